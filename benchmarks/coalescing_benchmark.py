@@ -0,0 +1,143 @@
+"""
+Fan-in load test for single-flight coalescing: bursts of callers start the
+same assessment at once through TestGenerator.generate_test, and the report
+shows how many upstream Gemini calls the bursts cost.
+
+    python benchmarks/coalescing_benchmark.py --burst 200 --cohorts 4 --rounds 3
+    python benchmarks/coalescing_benchmark.py --compare --cache
+    python benchmarks/coalescing_benchmark.py --cancel-fraction 0.3 --check
+
+Each round starts --burst callers per cohort at the same moment; callers in
+a cohort share skills and experience, so they send identical prompts.
+--cancel-fraction of the callers are cancelled while the shared call is in
+flight, and the rest must still get their test. --max-waiters is the per-key
+waiter limit. --cache puts the response cache in front, so later rounds
+should cost no upstream calls at all. --compare also runs with coalescing
+off (a waiter limit of 0). With --check, the exit status is 1 unless every
+surviving caller got a full test and the upstream calls match what
+coalescing promises: one per cohort and round per --max-waiters callers,
+and none after the first round with --cache.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.run_benchmarks import SKILLS, percentile, synthetic_response  # noqa: E402
+
+
+def expected_upstream_calls(args: argparse.Namespace) -> int:
+    """The upstream calls coalescing should cost: one per cohort, round and full set of waiters."""
+    per_burst = math.ceil(args.burst / args.max_waiters)
+    rounds = 1 if args.cache else args.rounds
+    return args.cohorts * rounds * per_burst
+
+
+async def drive(args: argparse.Namespace, coalesce: bool) -> Dict[str, Any]:
+    from services.gemini_service import GeminiService
+    from services.llm_cache import LLMResponseCache
+    from services.replay import FakeLLM, LatencyModel
+    from services.test_generator import TestGenerator
+
+    llm = FakeLLM(synthetic_response, latency=LatencyModel(args.llm_latency_ms / 1000))
+    service = GeminiService(
+        api_key="offline",
+        cache=LLMResponseCache() if args.cache else None,
+        max_waiters_per_key=args.max_waiters if coalesce else 0,
+    )
+    service.llm = llm
+    generator = TestGenerator(gemini_service=service)
+    cohorts = [(random.Random(i).sample(SKILLS, 2), i % 8) for i in range(args.cohorts)]
+
+    latencies: List[float] = []
+    outcome = {"served": 0, "short": 0, "failed": 0, "cancelled": 0}
+
+    async def one(skills: List[str], experience_years: int) -> None:
+        started = time.perf_counter()
+        try:
+            questions = await generator.generate_test(skills, experience_years, args.num_questions)
+        except Exception:
+            outcome["failed"] += 1
+            return
+        latencies.append(time.perf_counter() - started)
+        outcome["served" if len(questions) == args.num_questions else "short"] += 1
+
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        tasks = [
+            asyncio.ensure_future(one(skills, experience_years))
+            for skills, experience_years in cohorts
+            for _ in range(args.burst)
+        ]
+        # Cancelled while the shared calls are in flight; the other callers must not notice.
+        await asyncio.sleep(args.llm_latency_ms / 2000)
+        for task in random.sample(tasks, int(len(tasks) * args.cancel_fraction)):
+            if task.cancel():
+                outcome["cancelled"] += 1
+        await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    requests = args.rounds * args.cohorts * args.burst
+    return {
+        "coalescing": coalesce,
+        "cache": args.cache,
+        "requests": requests,
+        "upstream_calls": llm.calls,
+        "calls_per_request": round(llm.calls / requests, 4),
+        "expected_upstream_calls": expected_upstream_calls(args) if coalesce else requests,
+        **outcome,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "elapsed_s": round(elapsed, 2),
+        "coalescing_stats": dict(service.coalescing_stats),
+    }
+
+
+def failed_checks(result: Dict[str, Any]) -> List[str]:
+    found = []
+    if result["upstream_calls"] > result["expected_upstream_calls"]:
+        found.append(f"{result['upstream_calls']} upstream calls, expected at most {result['expected_upstream_calls']}")
+    survivors = result["requests"] - result["cancelled"]
+    if result["served"] != survivors:
+        found.append(f"{result['served']} of {survivors} surviving callers got a full test")
+    return found
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=200, help="Simultaneous callers per cohort and round.")
+    parser.add_argument("--cohorts", type=int, default=4, help="Distinct assessments started in each round.")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--num-questions", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="Fake LLM latency.")
+    parser.add_argument("--max-waiters", type=int, default=100, help="Per-key waiter limit.")
+    parser.add_argument("--cancel-fraction", type=float, default=0.2, help="Callers cancelled mid-flight.")
+    parser.add_argument("--cache", action="store_true", help="Put the response cache in front.")
+    parser.add_argument("--compare", action="store_true", help="Also run with coalescing off.")
+    parser.add_argument("--check", action="store_true", help="Exit 1 when coalescing misses its promise.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    runs = [asyncio.run(drive(args, coalesce=True))]
+    if args.compare:
+        runs.append(asyncio.run(drive(args, coalesce=False)))
+    print(json.dumps({"runs": runs}, indent=2))
+    if not args.check:
+        return 0
+    found = failed_checks(runs[0])
+    for line in found:
+        print(f"FAIL {line}", file=sys.stderr)
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
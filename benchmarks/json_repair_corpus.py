@@ -0,0 +1,161 @@
+"""
+Corpus and fuzz runner for the local JSON repair in services/json_stream.py.
+Every case in benchmarks/fixtures/malformed_json.jsonl is a model output
+("text") with the value it must parse to ("expect"), or null when it must
+fail with JSONRepairError. Each case is checked through parse_json_response
+and, for arrays, through JsonArrayStreamParser fed in random chunk sizes,
+which must emit the object elements of "expect" (or "stream", when the
+streamed elements differ, e.g. a truncated last element is never emitted).
+Random mutations of each case (truncation, dropped, duplicated and inserted
+characters) must then parse or fail cleanly: anything but JSONRepairError
+from parse_json_response, or any exception from the stream parser, is a
+failure. Also reports the parse time per case.
+
+    python benchmarks/json_repair_corpus.py
+    python benchmarks/json_repair_corpus.py --mutations 2000 --seed 7
+    python benchmarks/json_repair_corpus.py --corpus my_outputs.jsonl
+
+The exit status is 1 when any check fails. Add real outputs the parser got
+wrong to the corpus as they turn up.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.json_stream import JSONRepairError, JsonArrayStreamParser, parse_json_response  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(ROOT, "benchmarks", "fixtures", "malformed_json.jsonl")
+# Characters that most often break model JSON, for inserted mutations.
+NOISE = ['"', "'", ",", "{", "}", "[", "]", ":", "\\", "\n", "`", " ", "x", "0"]
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as corpus:
+        return [json.loads(line) for line in corpus if line.strip()]
+
+
+def stream(text: str, rng: random.Random) -> List[Any]:
+    """Feeds text to a JsonArrayStreamParser in random chunk sizes and returns the elements."""
+    parser = JsonArrayStreamParser()
+    elements: List[Any] = []
+    position = 0
+    while position < len(text) and not parser.finished:
+        size = rng.randint(1, 24)
+        elements.extend(parser.feed(text[position:position + size]))
+        position += size
+    return elements
+
+
+def mutate(text: str, rng: random.Random) -> str:
+    if not text:
+        return rng.choice(NOISE)
+    index = rng.randrange(len(text))
+    kind = rng.choice(["truncate", "drop", "duplicate", "insert"])
+    if kind == "truncate":
+        return text[:index]
+    if kind == "drop":
+        return text[:index] + text[index + 1:]
+    if kind == "duplicate":
+        return text[:index] + text[index] + text[index:]
+    return text[:index] + rng.choice(NOISE) + text[index:]
+
+
+def check_case(case: Dict[str, Any], rng: random.Random) -> List[str]:
+    failures = []
+    name, text, expect = case["name"], case["text"], case["expect"]
+    try:
+        parsed = parse_json_response(text)
+    except JSONRepairError:
+        if expect is not None:
+            failures.append(f"{name}: failed to parse, expected {json.dumps(expect)[:80]}")
+    except Exception as e:
+        failures.append(f"{name}: raised {type(e).__name__}: {e}")
+    else:
+        if expect is None:
+            failures.append(f"{name}: parsed to {json.dumps(parsed)[:80]}, expected a JSONRepairError")
+        elif parsed != expect:
+            failures.append(f"{name}: parsed to {json.dumps(parsed)[:80]}, expected {json.dumps(expect)[:80]}")
+
+    # The stream parser emits each complete object or array element of a top-level array;
+    # "stream" lists them when they differ from expect, e.g. for a truncated last element.
+    if "stream" in case or isinstance(expect, list):
+        wanted = case.get("stream", [element for element in expect or [] if isinstance(element, (dict, list))])
+        try:
+            streamed = stream(text, rng)
+        except Exception as e:
+            failures.append(f"{name}: stream parser raised {type(e).__name__}: {e}")
+        else:
+            if streamed != wanted:
+                failures.append(f"{name}: streamed {json.dumps(streamed)[:80]}, expected {json.dumps(wanted)[:80]}")
+    return failures
+
+
+def fuzz(corpus: List[Dict[str, Any]], mutations: int, rng: random.Random) -> List[str]:
+    failures = []
+    for _ in range(mutations):
+        case = rng.choice(corpus)
+        text = case["text"]
+        for _ in range(rng.randint(1, 3)):
+            text = mutate(text, rng)
+        try:
+            parse_json_response(text)
+        except JSONRepairError:
+            pass
+        except Exception as e:
+            failures.append(f"mutation of {case['name']} {text!r:.80}: raised {type(e).__name__}: {e}")
+        try:
+            stream(text, rng)
+        except Exception as e:
+            failures.append(f"mutation of {case['name']} {text!r:.80}: stream parser raised {type(e).__name__}: {e}")
+    return failures
+
+
+def timings(corpus: List[Dict[str, Any]], repeat: int) -> Dict[str, float]:
+    """Microseconds per parse_json_response call for each case."""
+    result = {}
+    for case in corpus:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            try:
+                parse_json_response(case["text"])
+            except JSONRepairError:
+                pass
+        result[case["name"]] = round((time.perf_counter() - started) / repeat * 1e6, 1)
+    return result
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSONL file of {name, text, expect} cases.")
+    parser.add_argument("--mutations", type=int, default=500, help="Random mutations to fuzz with.")
+    parser.add_argument("--repeat", type=int, default=200, help="Parses per case when timing.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = load_corpus(args.corpus)
+    failures: List[str] = []
+    for case in corpus:
+        failures.extend(check_case(case, rng))
+    failures.extend(fuzz(corpus, args.mutations, rng))
+
+    print(json.dumps({
+        "cases": len(corpus),
+        "mutations": args.mutations,
+        "failures": len(failures),
+        "parse_us": timings(corpus, args.repeat),
+    }, indent=2))
+    for line in failures:
+        print(f"FAIL {line}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
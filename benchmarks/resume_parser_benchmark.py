@@ -0,0 +1,122 @@
+"""
+Resume parser scaling benchmark: parses generated multi-page PDF and DOCX
+CVs of growing length and reports time and peak traced memory per size,
+plus time and memory per page, so linear scaling (constant per-page cost)
+is easy to check.
+
+    python benchmarks/resume_parser_benchmark.py --pages 10 40 160 640 --runs 3
+
+With --sections end (the default) the experience, education and skills
+sections come after the filler, so every page is scanned. With
+--sections start they come first, which shows the early stop: parsing
+ends after the first page, so PDF time and memory stay flat however long
+the document is; python-docx loads the whole file up front, so DOCX only
+saves the line scanning.
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HEADER = ["Jane Doe", "jane.doe@example.com"]
+SECTIONS = [
+    "Work Experience",
+    "Senior backend engineer with 6 years of experience building APIs and data pipelines.",
+    "Education",
+    "B.Tech in Computer Science",
+    "Technical Skills",
+    "Python, SQL, Docker, Kubernetes, AWS",
+    # A section closes at the next heading, as in a real CV.
+    "Projects",
+]
+FILLER = "Led a project migrating services to a new platform, improving reliability and cutting costs."
+LINES_PER_PAGE = 40
+
+
+def document_lines(pages: int, sections: str) -> List[List[str]]:
+    """Lines per page: the header, then filler, with the sections on the first or the last page."""
+    layout = [[FILLER] * LINES_PER_PAGE for _ in range(pages)]
+    layout[0] = HEADER + layout[0]
+    if sections == "start":
+        layout[0] = HEADER + SECTIONS + [FILLER] * LINES_PER_PAGE
+    else:
+        layout[-1] = layout[-1] + SECTIONS
+    return layout
+
+
+def make_pdf(pages: int, sections: str) -> bytes:
+    import fitz
+
+    doc = fitz.open()
+    for lines in document_lines(pages, sections):
+        page = doc.new_page()
+        page.insert_text((40, 40), "\n".join(lines), fontsize=7)
+    return doc.tobytes()
+
+
+def make_docx(pages: int, sections: str) -> bytes:
+    import docx
+
+    document = docx.Document()
+    for lines in document_lines(pages, sections):
+        for line in lines:
+            document.add_paragraph(line)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def measure(parse: Callable[[], Any], runs: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        parse()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    parse()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"median_ms": statistics.median(timings) * 1000, "peak_kb": peak / 1024}
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 40, 160, 640])
+    parser.add_argument("--formats", nargs="+", default=["pdf", "docx"], choices=["pdf", "docx"])
+    parser.add_argument("--sections", default="end", choices=["start", "end"])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    from parsers.resume_parser import load_extractors, parse_resume
+
+    load_extractors()
+    builders = {"pdf": make_pdf, "docx": make_docx}
+    report: Dict[str, List[Dict[str, Any]]] = {}
+    for file_type in args.formats:
+        rows = []
+        for pages in args.pages:
+            content = builders[file_type](pages, args.sections)
+            stats = measure(lambda: parse_resume(content, file_type), args.runs)
+            rows.append({
+                "pages": pages,
+                "file_kb": round(len(content) / 1024, 1),
+                "median_ms": round(stats["median_ms"], 2),
+                "ms_per_page": round(stats["median_ms"] / pages, 3),
+                "peak_kb": round(stats["peak_kb"], 1),
+                "peak_kb_per_page": round(stats["peak_kb"] / pages, 2),
+            })
+        report[file_type] = rows
+    print(json.dumps({"sections": args.sections, "runs": args.runs, "results": report}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
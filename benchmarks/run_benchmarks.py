@@ -0,0 +1,226 @@
+"""
+Offline end-to-end benchmark for /generate-test, /evaluate-test and /recommend-jobs.
+
+Gemini and SerpApi are replaced by fakes (or by recorded fixtures, see
+services/replay.py), so runs are repeatable, free and need no API keys.
+Reports throughput, p50/p99 latency and peak memory per endpoint, and can
+fail when p99 regresses against a saved baseline:
+
+    python benchmarks/run_benchmarks.py --requests 200 --concurrency 20 --llm-latency-ms 800
+    python benchmarks/run_benchmarks.py --save-baseline baseline.json
+    python benchmarks/run_benchmarks.py --baseline baseline.json --max-regression 0.2
+
+Fixtures are recorded from a real deployment by starting the app with
+LLM_RECORD_PATH and SERPAPI_RECORD_PATH set, then replayed here with
+--llm-fixtures and --search-fixtures.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SKILLS = ["python", "java", "sql", "javascript", "react", "docker", "kubernetes", "aws", "go", "rust", "django", "spark"]
+
+MCQ_QUESTION = {"question": "Which option is correct?", "options": ["A. one", "B. two", "C. three", "D. four"], "correct_answer": "A"}
+CODING_QUESTION = {
+    "question": "Write a function add(a, b) that returns a + b.",
+    "code_template": "def add(a, b):\n    pass",
+    "expected_output_example": "add(1, 2) -> 3",
+}
+EVALUATION = {
+    "overall_feedback": "Solid fundamentals.",
+    "strengths": ["Syntax"],
+    "weaknesses": ["Concurrency"],
+    "detailed_feedback": ["Review the threading model."],
+    "general_learning_resources": [],
+    "specific_learning_paths": [],
+}
+JOB_TITLES = ["Backend Developer", "Data Engineer", "Frontend Developer", "DevOps Engineer", "ML Engineer"]
+
+
+def synthetic_response(prompt: str) -> str:
+    """Plausible model output for each prompt kind the app sends."""
+    if "overall_feedback" in prompt:
+        return json.dumps(EVALUATION)
+    if "job postings" in prompt:
+        return json.dumps(re.findall(r'"id":"([^"]+)"', prompt)[:5])
+    match = re.search(r"Number of questions: (\d+)", prompt)
+    count = int(match.group(1)) if match else 5
+    question = CODING_QUESTION if "coding challenge" in prompt else MCQ_QUESTION
+    return json.dumps([dict(question, question=f"{question['question']} #{n}") for n in range(count)])
+
+
+def synthetic_search(params: Dict[str, Any]) -> Dict[str, Any]:
+    query = params.get("q", "")
+    return {"jobs_results": [
+        {
+            "title": f"{title} ({query})",
+            "company_name": f"Company {i}",
+            "location": "Remote",
+            "description": f"{query} {title.lower()} building services and data pipelines. " * 20,
+            "job_link": f"https://example.com/jobs/{i}",
+        }
+        for i, title in enumerate(JOB_TITLES)
+    ]}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def profile(i: int, distinct: int) -> Dict[str, Any]:
+    rng = random.Random(i % distinct)
+    return {
+        "name": f"Candidate {i}",
+        "email": f"candidate{i}@example.com",
+        "experience": "Built backend services.",
+        "experience_years": rng.randint(0, 12),
+        "education": "B.Tech",
+        "skills": rng.sample(SKILLS, 3),
+    }
+
+
+def payload(endpoint: str, i: int, distinct: int) -> Dict[str, Any]:
+    candidate = profile(i, distinct)
+    if endpoint == "/generate-test":
+        return {"skills": candidate["skills"], "experience_years": candidate["experience_years"], "num_questions": 5}
+    if endpoint == "/evaluate-test":
+        questions = [dict(MCQ_QUESTION, question=f"Question {n} on {candidate['skills'][0]}?") for n in range(4)]
+        questions.append(dict(CODING_QUESTION, question=f"{CODING_QUESTION['question']} ({i % distinct})"))
+        answers = {str(n): "A" for n in range(4)}
+        answers["4"] = "def add(a, b):\n    return a + b"
+        return {"questions": questions, "answers": answers}
+    return candidate
+
+
+async def run_endpoint(client, endpoint: str, requests: int, concurrency: int, distinct: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(endpoint, json=payload(endpoint, i, distinct))
+            latencies.append(time.perf_counter() - started)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    return {
+        "requests": requests,
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "peak_traced_mb": round(peak / (1024 * 1024), 2),
+        "statuses": statuses,
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+    import main
+    from services.replay import FakeLLM, LatencyModel, ReplayLLM, SearchReplayer
+
+    latency = LatencyModel(args.llm_latency_ms / 1000, args.llm_p99_ms / 1000 if args.llm_p99_ms else None)
+    if args.llm_fixtures:
+        main.gemini_service.llm = ReplayLLM(args.llm_fixtures, latency=latency, failure_rate=args.failure_rate)
+    else:
+        main.gemini_service.llm = FakeLLM(synthetic_response, latency=latency, failure_rate=args.failure_rate)
+    if main.job_recommender is not None:
+        main.job_recommender._search_blocking = SearchReplayer(
+            args.search_fixtures,
+            latency=LatencyModel(args.search_latency_ms / 1000),
+            fallback=None if args.search_fixtures else synthetic_search,
+        )
+
+    results: Dict[str, Any] = {}
+    tracemalloc.start()
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for endpoint in args.endpoints:
+                results[endpoint] = await run_endpoint(client, endpoint, args.requests, args.concurrency, args.distinct)
+    tracemalloc.stop()
+    results["process"] = {
+        "llm_calls": main.gemini_service.llm.calls,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    return results
+
+
+def regressions(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    found = []
+    for endpoint, stats in results.items():
+        before = baseline.get(endpoint, {}).get("p99_ms")
+        if before and "p99_ms" in stats and stats["p99_ms"] > before * (1 + max_regression):
+            found.append(f"{endpoint}: p99 {stats['p99_ms']}ms vs baseline {before}ms")
+    return found
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", default=["/generate-test", "/evaluate-test", "/recommend-jobs"])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint.")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--distinct", type=int, default=25, help="Distinct candidate profiles (lower means more cache hits).")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="Median fake LLM latency.")
+    parser.add_argument("--llm-p99-ms", type=float, default=0, help="p99 fake LLM latency (defaults to the median).")
+    parser.add_argument("--search-latency-ms", type=float, default=100)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of LLM calls failing with a 429.")
+    parser.add_argument("--llm-fixtures", help="JSONL recorded with LLM_RECORD_PATH to replay instead of synthetic responses.")
+    parser.add_argument("--search-fixtures", help="JSONL recorded with SERPAPI_RECORD_PATH.")
+    parser.add_argument("--baseline", help="Results JSON from an earlier run to compare p99 against.")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p99 growth over the baseline.")
+    parser.add_argument("--save-baseline", help="Write this run's results to the given file.")
+    args = parser.parse_args()
+
+    # Isolated state and dummy keys: nothing here talks to the real services.
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    for name, value in {
+        "GOOGLE_API_KEY": "offline",
+        "SERPAPI_API_KEY": "offline",
+        "QUESTION_BANK_PATH": os.path.join(workdir, "question_bank.db"),
+        "JOB_INDEX_PATH": os.path.join(workdir, "job_index.db"),
+        "EVALUATION_QUEUE_PATH": os.path.join(workdir, "evaluation_jobs.db"),
+        "RECOMMENDATION_STORE_PATH": os.path.join(workdir, "recommendations.db"),
+        "QUESTION_BANK_LOW_WATER_MARK": "0",
+        "GEMINI_REQUESTS_PER_MINUTE": "100000",
+        "GEMINI_TOKENS_PER_MINUTE": "1000000000",
+        "LOG_LEVEL": "WARNING",
+    }.items():
+        os.environ.setdefault(name, value)
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.max_regression)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,214 @@
+"""
+Multi-worker scaling benchmark: serves the app with `uvicorn --workers N`
+for each worker count and reports throughput per count, so the gain from
+running one worker per core is visible.
+
+    python benchmarks/scaling_benchmark.py --workers 1 2 4 --duration 15
+
+Gemini and SerpApi responses are first recorded from the synthetic fakes in
+run_benchmarks.py, then replayed by every worker (LLM_REPLAY_PATH and
+SERPAPI_REPLAY_PATH), so nothing talks to the real services. Worker counts
+above the machine's core count are skipped unless --allow-oversubscribe is
+given. Load comes from separate client processes, which share the cores
+with the server; on small machines keep --clients low.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run_benchmarks import payload, percentile, synthetic_response, synthetic_search  # noqa: E402
+
+
+def base_env(workdir: str) -> Dict[str, str]:
+    return dict(
+        os.environ,
+        GOOGLE_API_KEY="offline",
+        SERPAPI_API_KEY="offline",
+        QUESTION_BANK_PATH=os.path.join(workdir, "question_bank.db"),
+        JOB_INDEX_PATH=os.path.join(workdir, "job_index.db"),
+        EVALUATION_QUEUE_PATH=os.path.join(workdir, "evaluation_jobs.db"),
+        RECOMMENDATION_STORE_PATH=os.path.join(workdir, "recommendations.db"),
+        QUESTION_BANK_LOW_WATER_MARK="0",
+        GEMINI_REQUESTS_PER_MINUTE="100000",
+        GEMINI_TOKENS_PER_MINUTE="1000000000",
+        LOG_LEVEL="WARNING",
+        PYTHONPATH=ROOT,
+    )
+
+
+def record_fixtures(fixtures_dir: str, endpoints: List[str], distinct: int) -> None:
+    """Runs in a child process: sends each distinct request once, recording the upstream calls."""
+    import httpx
+    import main
+    from services.replay import FakeLLM, RecordingLLM, SearchRecorder
+
+    main.gemini_service.llm = RecordingLLM(FakeLLM(synthetic_response), os.path.join(fixtures_dir, "llm.jsonl"))
+    main.job_recommender._search_blocking = SearchRecorder(synthetic_search, os.path.join(fixtures_dir, "search.jsonl"))
+
+    async def send_all() -> None:
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                for endpoint in endpoints:
+                    for i in range(distinct):
+                        await client.post(endpoint, json=payload(endpoint, i, distinct))
+
+    asyncio.run(send_all())
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(base_url: str, timeout_seconds: float = 60.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server at {base_url} did not become ready")
+
+
+def drive_load(base_url: str, endpoints: List[str], distinct: int, concurrency: int,
+               duration: float, seed: int, results: "multiprocessing.Queue") -> None:
+    """Runs in a client process: keeps `concurrency` requests in flight for `duration` seconds."""
+    import httpx
+
+    async def load() -> Dict[str, Any]:
+        latencies: List[float] = []
+        errors = 0
+        stop_at = time.monotonic() + duration
+        counter = seed * 1_000_000
+
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            async def loop() -> None:
+                nonlocal counter, errors
+                while time.monotonic() < stop_at:
+                    counter += 1
+                    endpoint = endpoints[counter % len(endpoints)]
+                    started = time.perf_counter()
+                    try:
+                        response = await client.post(endpoint, json=payload(endpoint, counter, distinct))
+                        ok = response.status_code == 200
+                    except httpx.HTTPError:
+                        ok = False
+                    if ok:
+                        latencies.append(time.perf_counter() - started)
+                    else:
+                        errors += 1
+
+            await asyncio.gather(*(loop() for _ in range(concurrency)))
+        return {"latencies": latencies, "errors": errors}
+
+    results.put(asyncio.run(load()))
+
+
+def measure(workers: int, args: argparse.Namespace, fixtures_dir: str) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix=f"scaling-{workers}-")
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = base_env(workdir)
+    env.update(
+        WEB_CONCURRENCY=str(workers),
+        SHARED_STATE_PATH=os.path.join(workdir, "shared_state.db"),
+        LLM_CACHE_PATH=os.path.join(workdir, "llm_cache.db"),
+        TEST_SESSION_PATH=os.path.join(workdir, "test_sessions.db"),
+        LLM_REPLAY_PATH=os.path.join(fixtures_dir, "llm.jsonl"),
+        SERPAPI_REPLAY_PATH=os.path.join(fixtures_dir, "search.jsonl"),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(base_url)
+        # Every worker warms up on its own; give the others a moment to finish too.
+        time.sleep(1.0)
+        queue: "multiprocessing.Queue" = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(
+                target=drive_load,
+                args=(base_url, args.endpoints, args.distinct, args.concurrency, args.duration, seed, queue),
+            )
+            for seed in range(args.clients)
+        ]
+        for client in clients:
+            client.start()
+        outcomes = [queue.get() for _ in clients]
+        for client in clients:
+            client.join()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latencies = [latency for outcome in outcomes for latency in outcome["latencies"]]
+    return {
+        "workers": workers,
+        "requests": len(latencies),
+        "errors": sum(outcome["errors"] for outcome in outcomes),
+        "throughput_rps": round(len(latencies) / args.duration, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--endpoints", nargs="+", default=["/generate-test", "/evaluate-test", "/recommend-jobs"])
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds of load per worker count.")
+    parser.add_argument("--clients", type=int, default=max(1, (os.cpu_count() or 1) // 2), help="Load-generating processes.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight per client process.")
+    parser.add_argument("--distinct", type=int, default=25, help="Distinct candidate profiles.")
+    parser.add_argument("--allow-oversubscribe", action="store_true", help="Also run worker counts above the core count.")
+    parser.add_argument("--record", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.record, args.endpoints, args.distinct)
+        return 0
+
+    cores = os.cpu_count() or 1
+    counts = [n for n in args.workers if args.allow_oversubscribe or n <= cores]
+    skipped = sorted(set(args.workers) - set(counts))
+    if skipped:
+        print(f"Skipping worker counts {skipped}: only {cores} core(s).", file=sys.stderr)
+
+    fixtures_dir = tempfile.mkdtemp(prefix="scaling-fixtures-")
+    env = dict(base_env(tempfile.mkdtemp(prefix="scaling-record-")), WARM_UP_ON_STARTUP="false")
+    subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--record", fixtures_dir, "--endpoints", *args.endpoints,
+         "--distinct", str(args.distinct)],
+        cwd=ROOT, env=env, check=True,
+    )
+
+    results = [measure(n, args, fixtures_dir) for n in counts]
+    if results:
+        single = results[0]["throughput_rps"] or 1.0
+        for result in results:
+            result["speedup"] = round(result["throughput_rps"] / single, 2)
+    print(json.dumps({"cores": cores, "clients": args.clients, "results": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,228 @@
+"""
+SerpApi isolation benchmark: starts a local stub SerpApi server, points the
+app at it with SERPAPI_BASE_URL and measures p99 latency of /generate-test
+and /evaluate-test, first alone and then while /recommend-jobs keeps the
+stub busy. Searches run on their own bounded worker pool, so the other
+endpoints' p99 should barely move however slow the stub is.
+
+    python benchmarks/serpapi_stub_benchmark.py --stub-latency-ms 1000 --recommend-concurrency 16
+    python benchmarks/serpapi_stub_benchmark.py --inline
+    python benchmarks/serpapi_stub_benchmark.py --check --max-p99-increase-ms 250
+
+Every /recommend-jobs request uses a new profile, so each one searches the
+stub rather than the job index. --inline runs searches on the event loop
+instead, as the blocking client used to, for comparison. --check makes
+this a test against the stub: the exit status is 1 unless the stub served
+the searches, /recommend-jobs returned its postings and the other
+endpoints' p99 grew by at most --max-p99-increase-ms under load.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.run_benchmarks import payload, percentile, profile, synthetic_response, synthetic_search  # noqa: E402
+
+OTHER_ENDPOINTS = ["/generate-test", "/evaluate-test"]
+
+
+class StubSerpApi(ThreadingHTTPServer):
+    """Answers every SerpApi search with synthetic google_jobs results after a fixed delay."""
+
+    daemon_threads = True
+
+    def __init__(self, latency_seconds: float):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.latency_seconds = latency_seconds
+        self.searches = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        with self.server._lock:
+            self.server.searches += 1
+        time.sleep(self.server.latency_seconds)
+        body = json.dumps(synthetic_search(params)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+async def measure_others(client, requests: int, concurrency: int, offset: int) -> Dict[str, Any]:
+    """p50/p99 latency of the non-search endpoints, for payloads offset..offset+requests."""
+    results: Dict[str, Any] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    for endpoint in OTHER_ENDPOINTS:
+        latencies: List[float] = []
+        statuses: Dict[str, int] = {}
+
+        async def one(i: int) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(endpoint, json=payload(endpoint, offset + i, 10 ** 9))
+                latencies.append(time.perf_counter() - started)
+                statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        results[endpoint] = {
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "statuses": statuses,
+        }
+    return results
+
+
+async def recommend_load(client, concurrency: int, stop: asyncio.Event, outcome: Dict[str, Any]) -> None:
+    """Keeps concurrency /recommend-jobs requests in flight, each for a profile no earlier request used."""
+    counter = 0
+
+    async def loop() -> None:
+        nonlocal counter
+        while not stop.is_set():
+            counter += 1
+            candidate = profile(counter, 10 ** 9)
+            candidate["skills"] = candidate["skills"] + [f"tool{counter}"]
+            started = time.perf_counter()
+            response = await client.post("/recommend-jobs", json=candidate)
+            outcome["latencies"].append(time.perf_counter() - started)
+            status = str(response.status_code)
+            outcome["statuses"][status] = outcome["statuses"].get(status, 0) + 1
+            if response.status_code == 200 and response.json():
+                outcome["with_postings"] += 1
+
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+
+
+async def run(args: argparse.Namespace, stub: StubSerpApi) -> Dict[str, Any]:
+    import httpx
+    import main
+    from services.replay import FakeLLM, LatencyModel
+
+    main.gemini_service.llm = FakeLLM(synthetic_response, latency=LatencyModel(args.llm_latency_ms / 1000))
+    # Every measured request reaches the (fake) model, so both phases do the same work.
+    main.gemini_service.cache = None
+    recommender = main.job_recommender
+    if args.inline:
+        async def run_search_inline(params: Dict[str, Any]) -> Dict[str, Any]:
+            return recommender._search_blocking(params)
+        recommender._run_search = run_search_inline
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Warms the caches and code paths the measured runs use.
+            await measure_others(client, args.concurrency, args.concurrency, offset=2 * args.requests)
+            alone = await measure_others(client, args.requests, args.concurrency, offset=0)
+
+            stop = asyncio.Event()
+            outcome: Dict[str, Any] = {"latencies": [], "statuses": {}, "with_postings": 0}
+            load = asyncio.create_task(recommend_load(client, args.recommend_concurrency, stop, outcome))
+            await asyncio.sleep(args.stub_latency_ms / 1000)
+            under_load = await measure_others(client, args.requests, args.concurrency, offset=args.requests)
+            stop.set()
+            await load
+
+    latencies = outcome["latencies"]
+    return {
+        "searches": "inline" if args.inline else "worker pool",
+        "alone": alone,
+        "under_recommend_load": under_load,
+        "p99_increase_ms": {
+            endpoint: round(under_load[endpoint]["p99_ms"] - alone[endpoint]["p99_ms"], 1) for endpoint in OTHER_ENDPOINTS
+        },
+        "/recommend-jobs": {
+            "requests": len(latencies),
+            "with_postings": outcome["with_postings"],
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "statuses": outcome["statuses"],
+        },
+        "stub_searches": stub.searches,
+        "search_stats": dict(recommender.search_stats),
+    }
+
+
+def failed_checks(results: Dict[str, Any], max_p99_increase_ms: float) -> List[str]:
+    found = []
+    if results["stub_searches"] == 0:
+        found.append("the stub server received no searches")
+    if results["/recommend-jobs"]["with_postings"] == 0:
+        found.append("no /recommend-jobs request returned postings from the stub")
+    for endpoint, increase in results["p99_increase_ms"].items():
+        if increase > max_p99_increase_ms:
+            found.append(f"{endpoint}: p99 grew by {increase}ms under /recommend-jobs load")
+    return found
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per measured endpoint and phase.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrency of the measured endpoints.")
+    parser.add_argument("--recommend-concurrency", type=int, default=16, help="/recommend-jobs requests in flight.")
+    parser.add_argument("--stub-latency-ms", type=float, default=1000, help="Delay of each stub SerpApi response.")
+    parser.add_argument("--llm-latency-ms", type=float, default=50, help="Fake LLM latency.")
+    parser.add_argument("--inline", action="store_true", help="Run searches on the event loop, for comparison.")
+    parser.add_argument("--check", action="store_true", help="Exit 1 when a check against the stub fails.")
+    parser.add_argument("--max-p99-increase-ms", type=float, default=250)
+    args = parser.parse_args()
+
+    stub = StubSerpApi(args.stub_latency_ms / 1000)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+    # Isolated state and dummy keys; searches go to the stub server.
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    for name, value in {
+        "GOOGLE_API_KEY": "offline",
+        "SERPAPI_API_KEY": "offline",
+        "SERPAPI_BASE_URL": stub.base_url,
+        "SERPAPI_TIMEOUT_SECONDS": str(max(15.0, 4 * args.stub_latency_ms / 1000)),
+        "RECOMMEND_JOBS_DEADLINE_SECONDS": "120",
+        "JOB_RANKING_MODE": "local",
+        "QUESTION_BANK_PATH": os.path.join(workdir, "question_bank.db"),
+        "JOB_INDEX_PATH": os.path.join(workdir, "job_index.db"),
+        "EVALUATION_QUEUE_PATH": os.path.join(workdir, "evaluation_jobs.db"),
+        "RECOMMENDATION_STORE_PATH": os.path.join(workdir, "recommendations.db"),
+        "QUESTION_BANK_LOW_WATER_MARK": "0",
+        "GEMINI_REQUESTS_PER_MINUTE": "100000",
+        "GEMINI_TOKENS_PER_MINUTE": "1000000000",
+        "LOG_LEVEL": "WARNING",
+    }.items():
+        os.environ.setdefault(name, value)
+    os.chdir(ROOT)
+
+    try:
+        results = asyncio.run(run(args, stub))
+    finally:
+        stub.shutdown()
+    print(json.dumps(results, indent=2))
+    if not args.check:
+        return 0
+    found = failed_checks(results, args.max_p99_increase_ms)
+    for line in found:
+        print(f"FAIL {line}", file=sys.stderr)
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
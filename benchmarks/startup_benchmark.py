@@ -0,0 +1,97 @@
+"""
+Cold-start benchmark: measures, in fresh interpreter processes, how long
+`import main` takes, how long until the first request to / is answered and
+how long until /ready reports the warm-up as finished.
+
+    python benchmarks/startup_benchmark.py --runs 5
+
+Each run uses dummy API keys and a temporary data directory; nothing talks
+to Gemini or SerpApi.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_once() -> Dict[str, float]:
+    """Runs in the child process; `started` is taken before the app is imported."""
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+
+    import asyncio
+    import httpx
+
+    async def serve() -> Dict[str, float]:
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                await client.get("/")
+                first_response = time.perf_counter()
+                while (await client.get("/ready")).status_code != 200:
+                    if main.readiness["error"]:
+                        raise RuntimeError(main.readiness["error"])
+                    await asyncio.sleep(0.01)
+                ready = time.perf_counter()
+        return {
+            "import_ms": (imported - started) * 1000,
+            "first_response_ms": (first_response - started) * 1000,
+            "ready_ms": (ready - started) * 1000,
+        }
+
+    return asyncio.run(serve())
+
+
+def run_child() -> Dict[str, float]:
+    workdir = tempfile.mkdtemp(prefix="startup-bench-")
+    env = dict(
+        os.environ,
+        GOOGLE_API_KEY="offline",
+        SERPAPI_API_KEY="offline",
+        QUESTION_BANK_PATH=os.path.join(workdir, "question_bank.db"),
+        JOB_INDEX_PATH=os.path.join(workdir, "job_index.db"),
+        EVALUATION_QUEUE_PATH=os.path.join(workdir, "evaluation_jobs.db"),
+        RECOMMENDATION_STORE_PATH=os.path.join(workdir, "recommendations.db"),
+        QUESTION_BANK_LOW_WATER_MARK="0",
+        LOG_LEVEL="WARNING",
+        PYTHONPATH=ROOT,
+    )
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"], cwd=ROOT, env=env,
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_once()))
+        return 0
+
+    runs: List[Dict[str, float]] = [run_child() for _ in range(args.runs)]
+    report = {
+        metric: {
+            "median": round(statistics.median(run[metric] for run in runs), 1),
+            "max": round(max(run[metric] for run in runs), 1),
+        }
+        for metric in runs[0]
+    }
+    print(json.dumps({"runs": args.runs, **report}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,173 @@
+"""
+Simulated-upstream harness for the Gemini rate limiter: drives
+GeminiService against a stand-in that throttles like a quota-limited Gemini
+(services/replay.py ThrottlingLLM) and reports goodput per second, how
+often the upstream said 429, and how callers failed, so stable throughput
+under throttling can be checked without an API key.
+
+    python benchmarks/throttling_benchmark.py --duration 20 --callers 64 --upstream-concurrency 8 --upstream-rpm 1200
+    python benchmarks/throttling_benchmark.py --outage 5 8 --compare
+    python benchmarks/throttling_benchmark.py --min-goodput 0.7 --max-error-rate 0.05
+
+The limiter is configured as in main.py, with its request budget set to
+--budget-fraction of the upstream quota. --compare also runs without the
+limiter, where every caller hits the upstream directly. --outage START END
+makes the upstream fail with 503s for that window, which should open the
+circuit breaker and fail fast instead of queueing. With --min-goodput (a
+fraction of the upstream's capacity) or --max-error-rate, the exit status
+is 1 when the limited run misses either.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.deadline import DeadlineExceededError, deadline_scope  # noqa: E402
+from services.gemini_service import GeminiService  # noqa: E402
+from services.rate_limiter import AdaptiveConcurrencyLimiter, CircuitBreaker, CircuitOpenError, RateLimiter  # noqa: E402
+from services.replay import LatencyModel, ThrottlingLLM  # noqa: E402
+
+SCHEMA = {"type": "object", "properties": {"ok": {"type": "boolean"}}}
+
+
+def build_limiter(args: argparse.Namespace) -> RateLimiter:
+    return RateLimiter(
+        requests_per_minute=args.upstream_rpm * args.budget_fraction,
+        tokens_per_minute=1e12,
+        concurrency=AdaptiveConcurrencyLimiter(
+            initial_limit=args.initial_concurrency,
+            max_limit=args.max_concurrency,
+            latency_target_seconds=args.latency_target_seconds,
+        ),
+        breaker=CircuitBreaker(failure_threshold=5, reset_timeout_seconds=args.breaker_reset_seconds),
+        max_retries=3,
+    )
+
+
+async def drive(args: argparse.Namespace, limited: bool) -> Dict[str, Any]:
+    upstream = ThrottlingLLM(
+        lambda prompt: json.dumps({"ok": True}),
+        latency=LatencyModel(args.latency_ms / 1000, args.p99_ms / 1000),
+        max_concurrency=args.upstream_concurrency,
+        requests_per_minute=args.upstream_rpm,
+        outages=[tuple(args.outage)] if args.outage else [],
+    )
+    limiter = build_limiter(args) if limited else None
+    service = GeminiService(api_key="offline", limiter=limiter)
+    service.llm = upstream
+
+    seconds = int(args.duration)
+    timeline = [0] * (seconds + 1)
+    errors: Dict[str, int] = {}
+    latencies: List[float] = []
+    counter = 0
+    started = time.monotonic()
+    stop_at = started + args.duration
+
+    async def caller() -> None:
+        nonlocal counter
+        while time.monotonic() < stop_at:
+            counter += 1
+            # Distinct prompts, so coalescing doesn't hide upstream calls.
+            prompt = f"Return a JSON object with ok set to true. Request {counter}."
+            call_started = time.monotonic()
+            try:
+                with deadline_scope(args.deadline_seconds):
+                    await service.generate_structured_response(prompt, SCHEMA, purpose="harness")
+            except CircuitOpenError:
+                errors["circuit_open"] = errors.get("circuit_open", 0) + 1
+                # A real caller serves its fallback here rather than retrying at once.
+                await asyncio.sleep(max(args.think_time_seconds, args.fallback_pause_seconds))
+                continue
+            except DeadlineExceededError:
+                errors["deadline"] = errors.get("deadline", 0) + 1
+                continue
+            except Exception as e:
+                kind = "throttled" if "429" in str(e) else "other"
+                errors[kind] = errors.get(kind, 0) + 1
+                await asyncio.sleep(args.think_time_seconds)
+                continue
+            finished = time.monotonic()
+            latencies.append(finished - call_started)
+            timeline[min(seconds, int(finished - started))] += 1
+            await asyncio.sleep(args.think_time_seconds)
+
+    await asyncio.gather(*(caller() for _ in range(args.callers)))
+
+    successes = len(latencies)
+    failed = sum(errors.values())
+    # Throughput after the limiter has had a few seconds to find the upstream's limit.
+    steady = timeline[min(args.warmup_seconds, seconds - 1):seconds]
+    if args.outage:
+        steady = [n for second, n in enumerate(timeline[:seconds])
+                  if second >= args.warmup_seconds and not args.outage[0] - 1 <= second < args.outage[1] + 2]
+    capacity_rps = min(args.upstream_rpm / 60.0, args.upstream_concurrency / max(args.latency_ms / 1000, 1e-3))
+    mean = statistics.fmean(steady) if steady else 0.0
+    result: Dict[str, Any] = {
+        "limiter": limited,
+        "successes": successes,
+        "errors": errors,
+        "error_rate": round(failed / max(1, successes + failed), 4),
+        "goodput_rps": round(sum(timeline[:seconds]) / seconds, 2),
+        "steady_goodput_rps": round(mean, 2),
+        "goodput_vs_capacity": round(mean / capacity_rps, 3) if capacity_rps else None,
+        "steady_cv": round(statistics.pstdev(steady) / mean, 3) if mean else None,
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "upstream": dict(upstream.stats, calls=upstream.calls),
+        "timeline": timeline[:seconds],
+    }
+    if limiter is not None:
+        result["limiter_stats"] = dict(limiter.stats)
+        result["final_concurrency_limit"] = round(limiter.concurrency.limit, 2)
+    return result
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--callers", type=int, default=64, help="Concurrent request loops.")
+    parser.add_argument("--think-time-seconds", type=float, default=0.0, help="Pause between a caller's requests.")
+    parser.add_argument("--fallback-pause-seconds", type=float, default=0.5,
+                        help="Pause after a call short-circuited by the open breaker.")
+    parser.add_argument("--deadline-seconds", type=float, default=30.0, help="Per-request deadline, as in main.py.")
+    parser.add_argument("--upstream-concurrency", type=int, default=8, help="Calls the upstream serves at once.")
+    parser.add_argument("--upstream-rpm", type=float, default=1200.0, help="Upstream request quota per minute.")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Median upstream latency.")
+    parser.add_argument("--p99-ms", type=float, default=800.0)
+    parser.add_argument("--outage", type=float, nargs=2, metavar=("START", "END"), help="Seconds of 503s.")
+    parser.add_argument("--budget-fraction", type=float, default=0.9, help="Limiter request budget / upstream quota.")
+    parser.add_argument("--initial-concurrency", type=int, default=4)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--latency-target-seconds", type=float, default=20.0)
+    parser.add_argument("--breaker-reset-seconds", type=float, default=2.0)
+    parser.add_argument("--warmup-seconds", type=int, default=3)
+    parser.add_argument("--compare", action="store_true", help="Also run without the limiter.")
+    parser.add_argument("--min-goodput", type=float, help="Fail below this fraction of upstream capacity.")
+    parser.add_argument("--max-error-rate", type=float, help="Fail above this fraction of failed calls.")
+    args = parser.parse_args()
+
+    runs = [asyncio.run(drive(args, limited=True))]
+    if args.compare:
+        runs.append(asyncio.run(drive(args, limited=False)))
+    print(json.dumps({"runs": runs}, indent=2))
+
+    limited = runs[0]
+    failures: List[str] = []
+    if args.min_goodput is not None and (limited["goodput_vs_capacity"] or 0) < args.min_goodput:
+        failures.append(f"goodput {limited['goodput_vs_capacity']} of capacity is below {args.min_goodput}")
+    if args.max_error_rate is not None and limited["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {limited['error_rate']} is above {args.max_error_rate}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
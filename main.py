@@ -1,26 +1,136 @@
 import os
+import json
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Request, Response, UploadFile, File, Query
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
 
 load_dotenv()
 
+from services.observability import (
+    REGISTRY, HTTP_LATENCY, HTTP_REQUESTS, configure_logging, server_timing, trace_request
+)
+
+configure_logging(os.getenv("LOG_LEVEL", "INFO"), json_format=os.getenv("LOG_FORMAT", "text") == "json")
+logger = logging.getLogger("main")
+# Trace every request when set; otherwise only requests sending an `X-Trace: 1` header are traced.
+TRACE_ALL_REQUESTS = os.getenv("TRACE_ALL_REQUESTS", "false").lower() in ("1", "true", "yes")
+
 # --- Project Imports ---
 from services.gemini_service import GeminiService
-from services.test_generator import TestGenerator
+from services.rate_limiter import RateLimiter, AdaptiveConcurrencyLimiter, CircuitBreaker
+from services.deadline import deadline_scope
+from services.llm_cache import LLMResponseCache, MemoryCacheBackend, SQLiteCacheBackend
+from services.test_generator import TestGenerator, public_question
+from services.question_bank import QuestionBank, QuestionBankReplenisher
+from services.code_runner import CodeRunner
+from services.evaluation_queue import CallbackURLError, EvaluationQueue, EvaluationQueueFullError
+from services.session_store import AdaptiveSessionStore, TestSessionStore, new_session_id
+from services.adaptive_test import AdaptiveTester, AdaptiveTestConflictError
+from services.shared_state import SharedTokenBucket, Lease
 from services.job_recommender import JobRecommender
+from services.job_index import JobIndex
+from services.recommendation_store import RecommendationMaterializer, RecommendationStore
+from parsers.pipeline import ResumeParsingPipeline, ResumeTooLargeError, UnsupportedResumeError
 from models.pydantic_models import (
-    ResumeData, SkillTestRequest, TestQuestion, TestSubmission,
-    TestResult, JobPosting
+    ResumeData, SkillTestRequest, TestQuestion, TestSubmission, SessionSubmission,
+    TestResult, JobPosting, EvaluationJob, AdaptiveTestRequest, AdaptiveAnswer, AdaptiveTestStep
 )
 
+# Largest number of candidates accepted by one batch request.
+BATCH_MAX_CANDIDATES = int(os.getenv("BATCH_MAX_CANDIDATES", "1000"))
+
+# Warm the slow-to-load clients in the background on startup, so the app serves
+# requests immediately and /ready reports when the first LLM call won't pay for it.
+# With several uvicorn workers (--workers / WEB_CONCURRENCY), rate limits, the
+# response cache, test sessions and question refills are shared through SQLite.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH") or ("data/shared_state.db" if WEB_CONCURRENCY > 1 else None)
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+readiness: Dict[str, Any] = {"ready": False, "error": None}
+
+
+async def warm_up() -> None:
+    """Loads the Gemini client, SerpApi client and resume parser libraries."""
+    started = time.perf_counter()
+    try:
+        # Parser processes first, so they fork from the smaller pre-LangChain process.
+        await resume_pipeline.warm_up()
+        await asyncio.to_thread(gemini_service.warm_up)
+        if job_recommender:
+            await asyncio.to_thread(job_recommender.warm_up)
+    except Exception as e:
+        readiness["error"] = str(e)
+        logger.exception("Warm-up failed")
+        return
+    readiness["ready"] = True
+    logger.info("Warm-up finished in %.0f ms", (time.perf_counter() - started) * 1000)
+
+
+async def purge_llm_cache() -> None:
+    """Drops expired response cache entries every LLM_CACHE_PURGE_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(LLM_CACHE_PURGE_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(llm_cache.purge_expired)
+        except Exception as e:
+            logger.warning("Purging the LLM response cache failed: %s", e)
+
+
+async def purge_test_sessions() -> None:
+    """Drops expired test sessions every TEST_SESSION_PURGE_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(TEST_SESSION_PURGE_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(test_sessions.purge_expired)
+        except Exception as e:
+            logger.warning("Purging expired test sessions failed: %s", e)
+
+
 # --- FastAPI App Setup ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    question_bank_replenisher.start()
+    evaluation_queue.start()
+    if recommendation_materializer:
+        recommendation_materializer.start()
+    warm_up_task = asyncio.create_task(warm_up()) if WARM_UP_ON_STARTUP else None
+    purge_task = asyncio.create_task(purge_llm_cache())
+    session_purge_task = asyncio.create_task(purge_test_sessions())
+    if warm_up_task is None:
+        readiness["ready"] = True
+    yield
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+    purge_task.cancel()
+    session_purge_task.cancel()
+    await evaluation_queue.stop()
+    evaluation_queue.close()
+    await question_bank_replenisher.stop()
+    question_bank.close()
+    test_sessions.close()
+    adaptive_sessions.close()
+    resume_pipeline.close()
+    if job_recommender:
+        await recommendation_materializer.stop()
+        recommendation_materializer.store.close()
+        job_recommender.close()
+        job_index.close()
+    llm_cache.close()
+    if SHARED_STATE_PATH:
+        gemini_limiter.requests.close()
+        gemini_limiter.tokens.close()
+
 app = FastAPI(
     title="AI-Powered Resume Analyzer & Skill Assessment Platform",
-    description="Analyze manually entered resume details, generate skill tests, provide feedback, and recommend jobs using Gemini AI."
+    description="Analyze manually entered resume details, generate skill tests, provide feedback, and recommend jobs using Gemini AI.",
+    lifespan=lifespan
 )
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -35,18 +145,217 @@ if not google_api_key:
 
 serpapi_api_key = os.getenv("SERPAPI_API_KEY",None)
 if not serpapi_api_key:
-    print("Warning: SERPAPI_API_KEY not set. Job search disabled.")
+    logger.warning("SERPAPI_API_KEY not set. Job search disabled.")
 
 
-gemini_service = GeminiService(api_key=google_api_key)
-test_generator = TestGenerator(gemini_service=gemini_service)
+# Response cache: in-memory LRU, plus an on-disk tier when LLM_CACHE_PATH is set.
+llm_cache_path = os.getenv("LLM_CACHE_PATH") or ("data/llm_cache.db" if SHARED_STATE_PATH else None)
+llm_cache = LLMResponseCache(
+    ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600")),
+    memory_backend=MemoryCacheBackend(max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))),
+    disk_backend=SQLiteCacheBackend(llm_cache_path) if llm_cache_path else None
+)
+LLM_CACHE_PURGE_INTERVAL_SECONDS = float(os.getenv("LLM_CACHE_PURGE_INTERVAL_SECONDS", "600"))
+
+# Client-side limits for Gemini calls; keep the budgets at or below the project's quota.
+gemini_requests_per_minute = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+gemini_tokens_per_minute = float(os.getenv("GEMINI_TOKENS_PER_MINUTE", "250000"))
+gemini_limiter = RateLimiter(
+    requests_per_minute=gemini_requests_per_minute,
+    tokens_per_minute=gemini_tokens_per_minute,
+    concurrency=AdaptiveConcurrencyLimiter(
+        initial_limit=int(os.getenv("GEMINI_INITIAL_CONCURRENCY", "4")),
+        max_limit=int(os.getenv("GEMINI_MAX_CONCURRENCY", "16")),
+        latency_target_seconds=float(os.getenv("GEMINI_LATENCY_TARGET_SECONDS", "20"))
+    ),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("GEMINI_CIRCUIT_FAILURE_THRESHOLD", "5")),
+        reset_timeout_seconds=float(os.getenv("GEMINI_CIRCUIT_RESET_SECONDS", "30"))
+    ),
+    max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "3")),
+    request_bucket=SharedTokenBucket(SHARED_STATE_PATH, "gemini_requests", gemini_requests_per_minute) if SHARED_STATE_PATH else None,
+    token_bucket=SharedTokenBucket(SHARED_STATE_PATH, "gemini_tokens", gemini_tokens_per_minute) if SHARED_STATE_PATH else None
+)
+gemini_service = GeminiService(
+    api_key=google_api_key,
+    cache=llm_cache,
+    shared_call_seconds=float(os.getenv("GEMINI_SHARED_CALL_SECONDS", "60")),
+    limiter=gemini_limiter,
+    hedge_requests=os.getenv("GEMINI_HEDGE_REQUESTS", "false").lower() in ("1", "true", "yes"),
+    hedge_min_delay_seconds=float(os.getenv("GEMINI_HEDGE_MIN_DELAY_SECONDS", "2")),
+    log_token_usage=os.getenv("GEMINI_LOG_TOKEN_USAGE", "false").lower() in ("1", "true", "yes")
+)
+# Record real Gemini responses to a fixture file, or replay them offline (see benchmarks/).
+if os.getenv("LLM_REPLAY_PATH"):
+    from services.replay import ReplayLLM
+    gemini_service.llm = ReplayLLM(os.environ["LLM_REPLAY_PATH"])
+elif os.getenv("LLM_RECORD_PATH"):
+    from services.replay import RecordingLLM
+    gemini_service.llm = RecordingLLM(gemini_service.llm, os.environ["LLM_RECORD_PATH"])
+
+# Per-endpoint latency budgets. Past the budget, endpoints degrade (bank questions,
+# local ranking, local grading) instead of waiting on a slow Gemini response.
+GENERATE_TEST_DEADLINE_SECONDS = float(os.getenv("GENERATE_TEST_DEADLINE_SECONDS", "20"))
+EVALUATE_TEST_DEADLINE_SECONDS = float(os.getenv("EVALUATE_TEST_DEADLINE_SECONDS", "30"))
+RECOMMEND_JOBS_DEADLINE_SECONDS = float(os.getenv("RECOMMEND_JOBS_DEADLINE_SECONDS", "15"))
+# Generated tests are kept server-side; clients submit answers against the session id.
+test_session_path = os.getenv("TEST_SESSION_PATH") or ("data/test_sessions.db" if SHARED_STATE_PATH else None)
+test_sessions = TestSessionStore(
+    ttl_seconds=float(os.getenv("TEST_SESSION_TTL_SECONDS", str(2 * 3600))),
+    max_sessions=int(os.getenv("TEST_SESSION_MAX_SESSIONS", "10000")),
+    path=test_session_path
+)
+TEST_SESSION_PURGE_INTERVAL_SECONDS = float(os.getenv("TEST_SESSION_PURGE_INTERVAL_SECONDS", "600"))
+adaptive_sessions = AdaptiveSessionStore(
+    ttl_seconds=float(os.getenv("TEST_SESSION_TTL_SECONDS", str(2 * 3600))),
+    max_sessions=int(os.getenv("TEST_SESSION_MAX_SESSIONS", "10000")),
+    path=test_session_path
+)
+question_bank = QuestionBank(
+    os.getenv("QUESTION_BANK_PATH", "data/question_bank.db"),
+    max_demanded_buckets=int(os.getenv("QUESTION_BANK_MAX_DEMANDED_BUCKETS", "500"))
+)
+code_runner = CodeRunner(
+    max_workers=int(os.getenv("CODE_RUNNER_WORKERS", "4")),
+    cpu_seconds=int(os.getenv("CODE_RUNNER_CPU_SECONDS", "2")),
+    memory_bytes=int(os.getenv("CODE_RUNNER_MEMORY_BYTES", str(256 * 1024 * 1024))),
+    wall_timeout_seconds=float(os.getenv("CODE_RUNNER_TIMEOUT_SECONDS", "5")),
+    sandbox=os.getenv("CODE_RUNNER_SANDBOX", "namespaces"),
+    sandbox_uid=int(os.getenv("CODE_RUNNER_UID", "65534")),
+    sandbox_gid=int(os.getenv("CODE_RUNNER_GID", "65534"))
+)
+test_generator = TestGenerator(
+    gemini_service=gemini_service,
+    question_bank=question_bank,
+    code_runner=code_runner,
+    max_answer_tokens=int(os.getenv("EVALUATION_MAX_ANSWER_TOKENS", "1000"))
+)
+adaptive_tester = AdaptiveTester(
+    test_generator=test_generator,
+    question_bank=question_bank,
+    sessions=adaptive_sessions,
+    test_sessions=test_sessions,
+    target_standard_error=float(os.getenv("ADAPTIVE_TEST_TARGET_STANDARD_ERROR", "0.7")),
+    generation_batch_size=int(os.getenv("ADAPTIVE_TEST_GENERATION_BATCH_SIZE", "3"))
+)
+question_bank_replenisher = QuestionBankReplenisher(
+    bank=question_bank,
+    test_generator=test_generator,
+    low_water_mark=int(os.getenv("QUESTION_BANK_LOW_WATER_MARK", "20")),
+    batch_size=int(os.getenv("QUESTION_BANK_BATCH_SIZE", "10")),
+    interval_seconds=float(os.getenv("QUESTION_BANK_REFILL_INTERVAL_SECONDS", "30")),
+    max_batches_per_cycle=int(os.getenv("QUESTION_BANK_MAX_BATCHES_PER_CYCLE", "5")),
+    # Only one worker refills at a time; the lease outlives a few refill intervals.
+    lease=Lease(
+        SHARED_STATE_PATH, "question_bank_refill",
+        ttl_seconds=3 * float(os.getenv("QUESTION_BANK_REFILL_INTERVAL_SECONDS", "30"))
+    ) if SHARED_STATE_PATH else None
+)
+evaluation_queue = EvaluationQueue(
+    test_generator=test_generator,
+    path=os.getenv("EVALUATION_QUEUE_PATH", "data/evaluation_jobs.db"),
+    workers=int(os.getenv("EVALUATION_WORKERS", "4")),
+    max_pending=int(os.getenv("EVALUATION_MAX_PENDING", "1000")),
+    callback_allowed_hosts=[host.strip() for host in os.getenv("CALLBACK_ALLOWED_HOSTS", "").split(",") if host.strip()]
+)
 
 job_recommender = None
+job_index = None
+recommendation_materializer = None
 if serpapi_api_key:
+    job_index = JobIndex(os.getenv("JOB_INDEX_PATH", "data/job_index.db"))
     job_recommender = JobRecommender(
         gemini_service=gemini_service,
-        serpapi_api_key=serpapi_api_key
+        serpapi_api_key=serpapi_api_key,
+        max_concurrent_searches=int(os.getenv("SERPAPI_MAX_CONCURRENCY", "4")),
+        search_timeout=float(os.getenv("SERPAPI_TIMEOUT_SECONDS", "15")),
+        serpapi_base_url=os.getenv("SERPAPI_BASE_URL"),
+        ranking_mode=os.getenv("JOB_RANKING_MODE", "llm"),
+        llm_candidate_pool=int(os.getenv("JOB_LLM_CANDIDATE_POOL", "10")),
+        prompt_token_budget=int(os.getenv("JOB_PROMPT_TOKEN_BUDGET", "2500")),
+        job_index=job_index,
+        index_refresh_seconds=float(os.getenv("JOB_INDEX_REFRESH_SECONDS", str(6 * 3600)))
+    )
+    if os.getenv("SERPAPI_REPLAY_PATH"):
+        from services.replay import SearchReplayer
+        job_recommender._search_blocking = SearchReplayer(os.environ["SERPAPI_REPLAY_PATH"])
+    elif os.getenv("SERPAPI_RECORD_PATH"):
+        from services.replay import SearchRecorder
+        job_recommender._search_blocking = SearchRecorder(job_recommender._search_blocking, os.environ["SERPAPI_RECORD_PATH"])
+    # Ranked lists are materialized per profile and re-ranked when matching postings arrive.
+    recommendation_materializer = RecommendationMaterializer(
+        job_recommender=job_recommender,
+        store=RecommendationStore(os.getenv("RECOMMENDATION_STORE_PATH", "data/recommendations.db")),
+        interval_seconds=float(os.getenv("RECOMMENDATION_REFRESH_INTERVAL_SECONDS", "60")),
+        max_age_seconds=float(os.getenv("RECOMMENDATION_MAX_AGE_SECONDS", os.getenv("JOB_INDEX_REFRESH_SECONDS", str(6 * 3600)))),
+        retention_seconds=float(os.getenv("RECOMMENDATION_RETENTION_SECONDS", str(7 * 24 * 3600))),
+        lease=Lease(
+            SHARED_STATE_PATH, "recommendation_refresh",
+            ttl_seconds=3 * float(os.getenv("RECOMMENDATION_REFRESH_INTERVAL_SECONDS", "60"))
+        ) if SHARED_STATE_PATH else None
     )
+    job_recommender.on_ingest = recommendation_materializer.notify_ingest
+
+
+resume_pipeline = ResumeParsingPipeline(
+    max_workers=int(os.getenv("RESUME_PARSER_WORKERS", "0")) or None,
+    timeout_seconds=float(os.getenv("RESUME_PARSE_TIMEOUT_SECONDS", "30")),
+    max_file_bytes=int(os.getenv("RESUME_MAX_FILE_BYTES", str(5 * 1024 * 1024)))
+)
+
+
+# --- Metrics ---
+# Service counters are read at scrape time, so they need no extra bookkeeping on hot paths.
+REGISTRY.gauge_callback("llm_cache_events", "LLM response cache counters.", "event", lambda: llm_cache.stats_snapshot())
+REGISTRY.gauge_callback("llm_coalescing_events", "Coalesced Gemini calls.", "event", lambda: gemini_service.coalescing_stats)
+REGISTRY.gauge_callback("llm_hedging_events", "Hedged Gemini calls and deadline misses.", "event", lambda: gemini_service.hedging_stats)
+REGISTRY.gauge_callback("llm_limiter_events", "Gemini rate limiter counters.", "event", lambda: gemini_limiter.stats)
+REGISTRY.gauge_callback(
+    "llm_limiter_state", "Gemini concurrency limit, calls in flight and open circuit (1/0).", "field",
+    lambda: {
+        "concurrency_limit": gemini_limiter.concurrency.limit,
+        "in_flight": gemini_limiter.concurrency.in_flight,
+        "circuit_open": int(gemini_limiter.breaker.state != "closed"),
+    }
+)
+REGISTRY.gauge_callback("question_bank_events", "Question bank counters.", "event", lambda: question_bank.stats)
+REGISTRY.gauge_callback("test_session_events", "Test session store counters.", "event", lambda: test_sessions.stats_snapshot())
+REGISTRY.gauge_callback("adaptive_test_events", "Adaptive test counters.", "event", lambda: adaptive_tester.stats)
+REGISTRY.gauge_callback("evaluation_queue_events", "Queued evaluation counters.", "event", lambda: evaluation_queue.stats)
+if job_recommender:
+    REGISTRY.gauge_callback("serpapi_search_events", "SerpApi search counters.", "event", lambda: job_recommender.search_stats)
+    REGISTRY.gauge_callback(
+        "recommendation_store_events", "Materialized recommendation counters.", "event",
+        lambda: recommendation_materializer.stats
+    )
+
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """
+    Records request counts and latency per route. Traced requests also get a
+    Server-Timing header and a structured log line with their stage spans;
+    for streamed responses only the stages before the first byte are included.
+    """
+    started = time.perf_counter()
+    traced = TRACE_ALL_REQUESTS or request.headers.get("x-trace") == "1"
+    with trace_request() as spans:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    # Unmatched paths share one label, so scanners can't blow up metric cardinality.
+    route_path = route.path if route is not None else "unmatched"
+    HTTP_REQUESTS.inc(method=request.method, route=route_path, status=str(response.status_code))
+    HTTP_LATENCY.observe(elapsed, method=request.method, route=route_path)
+    if traced:
+        if spans:
+            response.headers["Server-Timing"] = server_timing(spans)
+        logger.info(
+            "%s %s %d in %.1f ms", request.method, route_path, response.status_code, elapsed * 1000,
+            extra={"route": route_path, "status": response.status_code, "duration_ms": round(elapsed * 1000, 2), "spans": spans}
+        )
+    return response
 
 
 # --- Routes ---
@@ -58,58 +367,324 @@ async def read_root(request: Request):
     """
     return templates.TemplateResponse("index.html", {"request": request})
 
+@app.get("/metrics", response_class=PlainTextResponse, summary="Prometheus Metrics", include_in_schema=False)
+async def metrics():
+    """
+    Exposes request, stage, Gemini latency/token and service counters in the
+    Prometheus text format.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready", summary="Readiness Probe", include_in_schema=False)
+async def ready():
+    """503 until the startup warm-up has loaded the model and parser clients."""
+    if not readiness["ready"]:
+        status = {"status": "failed", "error": readiness["error"]} if readiness["error"] else {"status": "warming_up"}
+        raise HTTPException(status_code=503, detail=status)
+    return {"status": "ready"}
+
+
 @app.post("/submit-resume-details", response_model=ResumeData, summary="Submit Manual Resume Details")
 async def submit_manual_resume_details(resume_data: ResumeData):
     """
     Accepts manually entered resume details and returns them.
-    This acts as the "parsing" step for manual input.
+    This acts as the "parsing" step for manual input. Job recommendations
+    for the profile start materializing in the background.
     """
+    if recommendation_materializer:
+        await recommendation_materializer.prefetch(resume_data)
+    return resume_data
+
+@app.post("/upload-resume", response_model=ResumeData, summary="Upload and Parse a Resume")
+async def upload_resume(file: UploadFile = File(...)):
+    """
+    Parses an uploaded PDF or DOCX resume into `ResumeData`.
+    Parsing runs on a process pool so it does not block other requests.
+    """
+    content = await file.read(resume_pipeline.max_file_bytes + 1)
+    try:
+        resume_data = await resume_pipeline.parse(content, file.filename or "")
+    except ResumeTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedResumeError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error parsing resume: {str(e)}")
+    if recommendation_materializer:
+        await recommendation_materializer.prefetch(resume_data)
     return resume_data
 
+@app.post("/upload-resumes/batch", summary="Upload and Parse a Zip of Resumes")
+async def upload_resume_batch(file: UploadFile = File(...)):
+    """
+    Parses every PDF/DOCX resume in an uploaded zip archive and streams back
+    one `ResumeParseResult` per line (NDJSON) as each resume finishes.
+    """
+    archive = await file.read(resume_pipeline.max_batch_bytes + 1)
+    if len(archive) > resume_pipeline.max_batch_bytes:
+        raise HTTPException(status_code=413, detail="The uploaded batch is too large.")
+
+    results = resume_pipeline.parse_zip(archive)
+    try:
+        # Pull the first result eagerly so archive-level errors become proper HTTP errors.
+        first = await results.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except ResumeTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedResumeError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+    async def result_lines():
+        if first is None:
+            return
+        yield first.model_dump_json() + "\n"
+        async for result in results:
+            yield result.model_dump_json() + "\n"
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
 @app.post("/generate-test", response_model=List[TestQuestion], summary="Generate Skill Test")
-async def generate_skill_test(request_data: SkillTestRequest):
+async def generate_skill_test(request_data: SkillTestRequest, response: Response):
     """
     Generates a skill assessment test (MCQs or coding questions) based on provided skills
-    and desired difficulty.
+    and desired difficulty. The test is stored server-side; submit answers to
+    `/evaluate-test` with the session id from the `X-Test-Session-Id` header.
+    The returned questions carry no correct answers or test cases.
     """
     try:
-        test_questions = await test_generator.generate_test(
-            skills=request_data.skills,
-            experience_years=request_data.experience_years,
-            num_questions=request_data.num_questions,
-            question_type=request_data.question_type
-        )
-        return test_questions
+        with deadline_scope(GENERATE_TEST_DEADLINE_SECONDS):
+            test_questions = await test_generator.generate_test(
+                skills=request_data.skills,
+                experience_years=request_data.experience_years,
+                num_questions=request_data.num_questions,
+                question_type=request_data.question_type
+            )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating test: {str(e)}")
+    if test_questions:
+        response.headers["X-Test-Session-Id"] = test_sessions.create(test_questions)
+    # Answers and test cases stay in the session; the client only gets the questions.
+    return [public_question(question) for question in test_questions]
+
+@app.post("/generate-test/batch", summary="Generate Skill Tests for Many Candidates")
+async def generate_skill_tests_batch(requests_data: List[SkillTestRequest]):
+    """
+    Generates a test per candidate and streams back one `CandidateTestResult`
+    per line (NDJSON) as each is ready. Candidates with the same skills,
+    difficulty and question type share one generated test, but each gets its
+    own test session.
+    """
+    if len(requests_data) > BATCH_MAX_CANDIDATES:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {BATCH_MAX_CANDIDATES} candidates.")
+
+    async def result_lines():
+        async for result in test_generator.generate_tests_batch(
+            requests_data, deadline_seconds=GENERATE_TEST_DEADLINE_SECONDS
+        ):
+            if result.questions:
+                result.session_id = test_sessions.create(result.questions)
+                result.questions = [public_question(question) for question in result.questions]
+            yield result.model_dump_json() + "\n"
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+@app.post("/generate-test/stream", summary="Generate Skill Test (Streaming)")
+async def stream_skill_test(request_data: SkillTestRequest):
+    """
+    Streams the generated test as NDJSON, one `TestQuestion` per line, so the
+    first question can be shown while the rest are still being generated.
+    A final `{"error": ...}` line is emitted if generation fails mid-stream.
+    The `X-Test-Session-Id` header names the test session, which can be
+    submitted once the stream has ended; after an error it holds the
+    questions that were sent.
+    """
+    if request_data.question_type not in ("mcq", "coding"):
+        raise HTTPException(status_code=400, detail="Unsupported question type. Choose 'mcq' or 'coding'.")
+
+    session_id = new_session_id()
+
+    async def question_lines():
+        questions = []
+        try:
+            async for question in test_generator.stream_test(
+                skills=request_data.skills,
+                experience_years=request_data.experience_years,
+                num_questions=request_data.num_questions,
+                question_type=request_data.question_type
+            ):
+                questions.append(question)
+                yield public_question(question).model_dump_json() + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"Error generating test: {str(e)}"}) + "\n"
+        finally:
+            # Stored however the stream ends, so questions already sent can still be submitted.
+            if questions:
+                test_sessions.put(session_id, questions)
+
+    return StreamingResponse(
+        question_lines(), media_type="application/x-ndjson", headers={"X-Test-Session-Id": session_id}
+    )
+
+@app.post("/adaptive-test/start", response_model=AdaptiveTestStep, summary="Start an Adaptive Test")
+async def start_adaptive_test(request_data: AdaptiveTestRequest):
+    """
+    Starts an adaptive MCQ test and returns its first question. Answer each
+    question with `/adaptive-test/answer`; difficulty follows the running
+    ability estimate and the test ends once the estimate is precise enough.
+    """
+    try:
+        with deadline_scope(GENERATE_TEST_DEADLINE_SECONDS):
+            return await adaptive_tester.start(request_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error starting adaptive test: {str(e)}")
+
+@app.post("/adaptive-test/answer", response_model=AdaptiveTestStep, summary="Answer an Adaptive Test Question")
+async def answer_adaptive_test(submission: AdaptiveAnswer):
+    """
+    Grades the answer and returns the next question, or, once the test is
+    done, the locally graded `TestResult`. A finished test can also be sent
+    to `/evaluate-test` by its `session_id` for the AI narrative.
+    """
+    try:
+        with deadline_scope(GENERATE_TEST_DEADLINE_SECONDS):
+            step = await adaptive_tester.answer(submission)
+    except AdaptiveTestConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error continuing adaptive test: {str(e)}")
+    if step is None:
+        raise HTTPException(status_code=404, detail="Adaptive test not found or already finished.")
+    return step
+
+def submitted_questions(submission: Union[SessionSubmission, TestSubmission]) -> List[TestQuestion]:
+    """The questions a submission answers: from its test session, or as sent by older clients."""
+    if isinstance(submission, TestSubmission):
+        return submission.questions
+    questions = test_sessions.get(submission.session_id)
+    if questions is None:
+        raise HTTPException(status_code=404, detail="Test session not found or expired. Please generate a new test.")
+    return questions
 
 @app.post("/evaluate-test", response_model=TestResult, summary="Submit Test and Get Feedback")
-async def submit_test_and_get_feedback(submission: TestSubmission):
+async def submit_test_and_get_feedback(
+    submission: Union[SessionSubmission, TestSubmission], include_narrative: bool = True
+):
     """
     Evaluates submitted test answers and provides instant feedback,
     strengths, weaknesses, and learning resources.
+    Send the `session_id` of the generated test with the answers. A full
+    `questions` list is still accepted, graded against the answer keys it carries.
+    The result includes the AI narrative and learning paths. With
+    `include_narrative=false`, an all-MCQ test is graded locally and returned
+    immediately; call again without it for the narrative.
     """
+    questions = submitted_questions(submission)
     try:
-        test_result = await test_generator.evaluate_test(
-            questions=submission.questions,
-            answers=submission.answers
-        )
+        with deadline_scope(EVALUATE_TEST_DEADLINE_SECONDS):
+            test_result = await test_generator.evaluate_test(
+                questions=questions,
+                answers=submission.answers,
+                include_narrative=include_narrative
+            )
         return test_result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error evaluating test: {str(e)}")
 
+@app.post("/evaluate-test/jobs", response_model=EvaluationJob, status_code=202, summary="Queue a Test Evaluation")
+async def queue_test_evaluation(
+    submission: Union[SessionSubmission, TestSubmission],
+    priority: int = Query(5, ge=0, le=9),
+    include_narrative: bool = True,
+    callback_url: Optional[str] = None
+):
+    """
+    Queues the submission for evaluation and returns a job id immediately.
+    Poll `/evaluate-test/jobs/{job_id}` or subscribe to its `/events` stream
+    for the `TestResult`. Lower priorities run first. When `callback_url` is
+    given, the finished job is also POSTed there; it must resolve to a public
+    address and, if `CALLBACK_ALLOWED_HOSTS` is set, name one of those hosts.
+    """
+    if callback_url:
+        try:
+            await evaluation_queue.check_callback_url(callback_url)
+        except CallbackURLError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if isinstance(submission, SessionSubmission):
+        # Already-validated questions from the session; no need to validate them again.
+        submission = TestSubmission.model_construct(
+            questions=submitted_questions(submission), answers=submission.answers
+        )
+    try:
+        return evaluation_queue.submit(
+            submission, priority=priority, include_narrative=include_narrative, callback_url=callback_url
+        )
+    except EvaluationQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/evaluate-test/jobs/{job_id}", response_model=EvaluationJob, summary="Get a Queued Evaluation")
+async def get_test_evaluation(job_id: str):
+    """
+    Returns the job's status, and its `TestResult` once it is done.
+    """
+    job = evaluation_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Evaluation job not found.")
+    return job
+
+@app.get("/evaluate-test/jobs/{job_id}/events", summary="Subscribe to a Queued Evaluation")
+async def stream_test_evaluation(job_id: str):
+    """
+    Server-sent events stream with one `status` event per status change of
+    the job. The stream closes after the job is done or has failed.
+    """
+    if evaluation_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Evaluation job not found.")
+
+    async def job_events():
+        async for job in evaluation_queue.watch(job_id):
+            yield f"event: status\ndata: {job.model_dump_json()}\n\n"
+
+    return StreamingResponse(job_events(), media_type="text/event-stream")
+
 @app.post("/recommend-jobs", response_model=List[JobPosting], summary="Recommend Jobs")
 async def recommend_jobs(resume_data: ResumeData):
     """
     Recommends suitable job postings based on the candidate's extracted skills and experience.
-    This now uses the mock job API to get dynamic jobs.
+    Served from the ranked list materialized for the profile when there is
+    one; it is re-ranked in the background as new matching postings arrive.
     """
+    if recommendation_materializer is None:
+        raise HTTPException(status_code=503, detail="Job search is disabled because SERPAPI_API_KEY is not set.")
     try:
-        recommendations = await job_recommender.recommend_jobs(
-            skills=resume_data.skills,
-            experience_years=resume_data.experience_years,
-            education=resume_data.education
-        )
+        with deadline_scope(RECOMMEND_JOBS_DEADLINE_SECONDS):
+            recommendations = await recommendation_materializer.recommend(resume_data)
         return recommendations
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error recommending jobs: {str(e)}")
+
+@app.post("/recommend-jobs/batch", summary="Recommend Jobs for Many Candidates")
+async def recommend_jobs_batch(profiles: List[ResumeData]):
+    """
+    Recommends jobs per candidate and streams back one `CandidateJobResult`
+    per line (NDJSON) as each is ready. Each distinct job search runs once
+    per batch, and identical profiles share one ranking.
+    """
+    if job_recommender is None:
+        raise HTTPException(status_code=503, detail="Job search is disabled because SERPAPI_API_KEY is not set.")
+    if len(profiles) > BATCH_MAX_CANDIDATES:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {BATCH_MAX_CANDIDATES} candidates.")
+
+    async def result_lines():
+        async for result in job_recommender.recommend_jobs_batch(
+            profiles, deadline_seconds=RECOMMEND_JOBS_DEADLINE_SECONDS
+        ):
+            yield result.model_dump_json() + "\n"
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
@@ -9,12 +9,28 @@ class ResumeData(BaseModel):
     education: str = Field(..., description="Extracted education summary from the resume.")
     skills: List[str] = Field(..., description="List of extracted skills.")
 
+class ResumeParseResult(BaseModel):
+    filename: str = Field(..., description="Name of the parsed file within the upload.")
+    resume: Optional[ResumeData] = Field(None, description="Extracted resume details, if parsing succeeded.")
+    error: Optional[str] = Field(None, description="Why parsing failed, if it did.")
+
+class CodeTestCase(BaseModel):
+    call: str = Field(..., description="A Python call expression, e.g. 'filter_evens([1, 2, 3])'.")
+    expected: str = Field(..., description="The expected return value as a Python literal, e.g. '[2]'.")
+
+class CodeRunResult(BaseModel):
+    passed: int = Field(..., description="Number of test cases the submission passed.")
+    total: int = Field(..., description="Number of test cases run.")
+    failures: List[str] = Field(default_factory=list, description="Description of each failed test case.")
+    error: Optional[str] = Field(None, description="Why the submission could not be run, if it couldn't.")
+
 class TestQuestion(BaseModel):
     question: str = Field(..., description="The question text.")
     options: Optional[List[str]] = Field(None, description="List of options for MCQ, if applicable.")
     correct_answer: Optional[str] = Field(None, description="Correct answer for MCQ, if applicable.")
     code_template: Optional[str] = Field(None, description="Code template for coding questions, if applicable.")
     expected_output_example: Optional[str] = Field(None, description="Example output for coding/short answer questions.")
+    test_cases: Optional[List[CodeTestCase]] = Field(None, description="Test cases used to grade coding questions locally.")
 
 class SkillTestRequest(BaseModel):
     skills: List[str] = Field(..., description="List of skills to generate questions for.")
@@ -26,6 +42,32 @@ class TestSubmission(BaseModel):
     questions: List[TestQuestion] = Field(..., description="The list of questions presented to the user.")
     answers: Dict[str, str] = Field(..., description="A dictionary of user answers, keyed by question index.")
 
+class SessionSubmission(BaseModel):
+    session_id: str = Field(..., description="The test session id returned (X-Test-Session-Id header) when the test was generated.")
+    answers: Dict[str, str] = Field(..., description="A dictionary of user answers, keyed by question index.")
+
+class AdaptiveTestRequest(BaseModel):
+    skills: List[str] = Field(..., description="List of skills to ask about.")
+    experience_years: int = Field(5, description="Years of experience; sets the starting difficulty.")
+    max_questions: int = Field(10, ge=1, le=30, description="Most questions the test will ask.")
+    min_questions: int = Field(3, ge=1, description="Questions asked before the test may stop early.")
+
+class AdaptiveAnswer(BaseModel):
+    session_id: str = Field(..., description="The adaptive test session id.")
+    question_index: int = Field(..., description="Index of the question being answered, as returned with it.")
+    answer: str = Field(..., description="The chosen option letter.")
+
+class AdaptiveTestState(BaseModel):
+    skills: List[str] = Field(..., description="Canonical skills, asked about in turn.")
+    questions: List[TestQuestion] = Field(default_factory=list, description="Questions asked so far, answer keys included.")
+    difficulties: List[str] = Field(default_factory=list, description="Difficulty tier of each question asked.")
+    answers: Dict[str, str] = Field(default_factory=dict, description="Answers so far, keyed by question index.")
+    prior_ability: float = Field(..., description="Starting ability estimate, from the years of experience.")
+    ability: float = Field(..., description="Current ability estimate.")
+    standard_error: float = Field(..., description="Standard error of the ability estimate.")
+    max_questions: int = Field(..., description="Most questions the test will ask.")
+    min_questions: int = Field(..., description="Questions asked before the test may stop early.")
+
 class LearningResource(BaseModel):
     title: str = Field(..., description="Title of the learning resource.")
     link: str = Field(..., description="URL link to the learning resource.")
@@ -46,6 +88,27 @@ class TestResult(BaseModel):
     general_learning_resources: List[LearningResource] = Field(..., description="General resources for improvement.")
     specific_learning_paths: List[LearningPath] = Field(..., description="Specific, structured learning paths for weaknesses.")
 
+class AdaptiveTestStep(BaseModel):
+    session_id: str = Field(..., description="The adaptive test session id; also the test session to evaluate once done.")
+    question_index: Optional[int] = Field(None, description="Index of `question`, to send back with its answer.")
+    question: Optional[TestQuestion] = Field(None, description="The next question (without its answer), unless the test is done.")
+    difficulty: Optional[str] = Field(None, description="Difficulty tier of the next question.")
+    previous_correct: Optional[bool] = Field(None, description="Whether the previous answer was correct.")
+    ability: float = Field(..., description="Current ability estimate (about -1 beginner, 0 intermediate, 1 advanced).")
+    standard_error: float = Field(..., description="Standard error of the ability estimate.")
+    level: str = Field(..., description="Difficulty tier closest to the ability estimate.")
+    done: bool = Field(..., description="Whether the test has finished.")
+    result: Optional[TestResult] = Field(None, description="Locally graded result, once the test is done.")
+
+class EvaluationJob(BaseModel):
+    id: str = Field(..., description="Identifier used to poll or subscribe to the job.")
+    status: str = Field(..., description="One of 'pending', 'running', 'done' or 'failed'.")
+    priority: int = Field(..., description="Scheduling priority; lower values run first.")
+    created_at: float = Field(..., description="Submission time as a Unix timestamp.")
+    updated_at: float = Field(..., description="Time of the last status change as a Unix timestamp.")
+    result: Optional[TestResult] = Field(None, description="The evaluation, once the job is done.")
+    error: Optional[str] = Field(None, description="Why the evaluation failed, if it did.")
+
 class JobPosting(BaseModel):
     id: str = Field(..., description="Unique identifier for the job posting.")
     title: str = Field(..., description="Job title.")
@@ -53,3 +116,14 @@ class JobPosting(BaseModel):
     location: str = Field(..., description="Job location.")
     description: str = Field(..., description="Full job description or a summary.")
     apply_link: str = Field(..., description="Direct link to apply for the job.")
+
+class CandidateTestResult(BaseModel):
+    index: int = Field(..., description="Position of the candidate's request in the batch.")
+    questions: Optional[List[TestQuestion]] = Field(None, description="The generated test, if generation succeeded.")
+    session_id: Optional[str] = Field(None, description="Test session to submit the candidate's answers against.")
+    error: Optional[str] = Field(None, description="Why generation failed, if it did.")
+
+class CandidateJobResult(BaseModel):
+    index: int = Field(..., description="Position of the candidate's profile in the batch.")
+    jobs: Optional[List[JobPosting]] = Field(None, description="Recommended job postings, if recommendation succeeded.")
+    error: Optional[str] = Field(None, description="Why recommendation failed, if it did.")
@@ -0,0 +1,147 @@
+import io
+import os
+import asyncio
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Optional
+from models.pydantic_models import ResumeData, ResumeParseResult
+from parsers.resume_parser import load_extractors, parse_resume
+from services.observability import stage
+
+SUPPORTED_EXTENSIONS = {".pdf": "pdf", ".docx": "docx"}
+
+
+class ResumeTooLargeError(ValueError):
+    pass
+
+
+class UnsupportedResumeError(ValueError):
+    pass
+
+
+def file_type_for(filename: str) -> str:
+    extension = os.path.splitext(filename.lower())[1]
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise UnsupportedResumeError(f"Unsupported file type '{extension or filename}'. Upload a PDF or DOCX resume.")
+    return SUPPORTED_EXTENSIONS[extension]
+
+
+class ResumeParsingPipeline:
+    """
+    Parses resumes on a process pool, since PDF/DOCX extraction is CPU-bound
+    and would otherwise block the event loop. Enforces per-file size limits
+    and per-job timeouts; batches are read from a zip archive and yielded
+    as each resume finishes. A pool whose worker timed out or crashed is
+    replaced and its processes terminated, since a running job can't be cancelled.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        timeout_seconds: float = 30.0,
+        max_file_bytes: int = 5 * 1024 * 1024,
+        max_batch_files: int = 500,
+        max_batch_bytes: int = 200 * 1024 * 1024,
+    ):
+        self.timeout_seconds = timeout_seconds
+        self.max_file_bytes = max_file_bytes
+        self.max_batch_files = max_batch_files
+        self.max_batch_bytes = max_batch_bytes
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        # Jobs are only submitted when a worker is free, so the timeout covers parsing, not queueing.
+        self._workers = asyncio.Semaphore(self.max_workers)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def warm_up(self) -> None:
+        """Starts a parser process and loads the PDF/DOCX libraries in it ahead of the first upload."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, load_extractors)
+
+    async def parse(self, content: bytes, filename: str) -> ResumeData:
+        """Parses one resume. Raises ValueError subclasses for bad input and TimeoutError on timeout."""
+        file_type = file_type_for(filename)
+        if len(content) > self.max_file_bytes:
+            raise ResumeTooLargeError(f"'{filename}' exceeds the {self.max_file_bytes} byte limit.")
+        with stage("resume_parse"):
+            try:
+                return await self._run_parse(content, file_type, filename)
+            except BrokenProcessPool:
+                # Its pool was replaced mid-job, after this or another job timed out or crashed; one retry.
+                try:
+                    return await self._run_parse(content, file_type, filename)
+                except BrokenProcessPool:
+                    raise RuntimeError(f"Parsing '{filename}' crashed the parser.") from None
+
+    async def _run_parse(self, content: bytes, file_type: str, filename: str) -> ResumeData:
+        async with self._workers:
+            executor = self._executor
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(executor, parse_resume, content, file_type)
+            try:
+                return await asyncio.wait_for(future, timeout=self.timeout_seconds)
+            except asyncio.TimeoutError:
+                # wait_for only stops waiting; the worker would keep parsing, so it goes with its pool.
+                self._recycle(executor)
+                raise TimeoutError(f"Parsing '{filename}' timed out after {self.timeout_seconds}s") from None
+            except BrokenProcessPool:
+                self._recycle(executor)
+                raise
+
+    def _recycle(self, executor: ProcessPoolExecutor) -> None:
+        """Replaces the pool and terminates its workers. Jobs left on it fail with BrokenProcessPool."""
+        if executor is not self._executor:
+            return
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False)
+
+    async def _parse_entry(
+        self, bundle: zipfile.ZipFile, info: zipfile.ZipInfo, slots: asyncio.Semaphore
+    ) -> ResumeParseResult:
+        if info.file_size > self.max_file_bytes:
+            return ResumeParseResult(
+                filename=info.filename, error=f"'{info.filename}' exceeds the {self.max_file_bytes} byte limit."
+            )
+        async with slots:
+            try:
+                # Decompressed off the event loop, and only when a worker is about to take it,
+                # so a large batch never sits in memory all at once.
+                content = await asyncio.to_thread(bundle.read, info)
+                return ResumeParseResult(filename=info.filename, resume=await self.parse(content, info.filename))
+            except Exception as e:
+                return ResumeParseResult(filename=info.filename, error=str(e))
+
+    async def parse_zip(self, archive: bytes) -> AsyncIterator[ResumeParseResult]:
+        """
+        Parses every PDF/DOCX in a zip archive concurrently and yields results
+        in completion order. Other entries are skipped; oversized or unreadable
+        entries are reported as errors, oversized ones without being decompressed.
+        """
+        try:
+            bundle = zipfile.ZipFile(io.BytesIO(archive))
+        except zipfile.BadZipFile:
+            raise UnsupportedResumeError("The uploaded batch is not a valid zip archive.") from None
+
+        entries = [
+            info for info in bundle.infolist()
+            if not info.is_dir() and os.path.splitext(info.filename.lower())[1] in SUPPORTED_EXTENSIONS
+        ]
+        if len(entries) > self.max_batch_files:
+            raise ResumeTooLargeError(f"The batch contains more than {self.max_batch_files} resumes.")
+        if sum(info.file_size for info in entries) > self.max_batch_bytes:
+            raise ResumeTooLargeError(f"The batch exceeds the {self.max_batch_bytes} byte limit once extracted.")
+
+        # One entry waiting per worker, so the next parse can start as soon as one finishes.
+        slots = asyncio.Semaphore(2 * self.max_workers)
+        tasks = [asyncio.create_task(self._parse_entry(bundle, info, slots)) for info in entries]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
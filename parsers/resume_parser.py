@@ -1,112 +1,187 @@
-import fitz  # PyMuPDF
-from docx import Document
+import io
+import logging
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Iterator, Iterable
 from models.pydantic_models import ResumeData
+from services.skill_taxonomy import default_taxonomy
 
-def extract_text_from_pdf(pdf_content: bytes) -> str:
-    """Extracts text from PDF content."""
-    text = ""
+EMAIL_RE = re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}")
+# A section heading is a line holding a known heading, optionally after up to three capitalized
+# qualifier words ("Work Experience", "Key Technical Skills") and followed by ':' and inline
+# content. Function words can't qualify, so "Years of experience" or "I have experience" is not a heading.
+HEADING_RE = re.compile(
+    r"^\s*(?:(?!(?:of|in|with|for|to|the|a|an|my|our|years?)\b)(?-i:[A-Z])[a-z&/-]*\s+|&\s+){0,3}?"
+    r"(professional experience|work history|experience|education|qualifications|"
+    r"technical skills|skills|proficiencies|core competencies|achievements|projects|awards)\s*(?::\s*(.*))?$",
+    re.IGNORECASE
+)
+SECTION_FOR_HEADING = {
+    "professional experience": "experience",
+    "work history": "experience",
+    "experience": "experience",
+    "education": "education",
+    "qualifications": "education",
+    "technical skills": "skills",
+    "skills": "skills",
+    "proficiencies": "skills",
+    "core competencies": "skills",
+}
+TRACKED_SECTIONS = ("experience", "education", "skills")
+YEARS_OF_EXPERIENCE_RE = re.compile(r"(\d+)\s*(year|yr)s?\s*of\s*(experience|exp)", re.IGNORECASE)
+YEARS_PLUS_RE = re.compile(r"(\d+)\+\s*years", re.IGNORECASE)
+JUNIOR_RE = re.compile(r"junior|entry-level", re.IGNORECASE)
+SENIOR_RE = re.compile(r"senior|lead|principal", re.IGNORECASE)
+SKILL_SPLIT_RE = re.compile(r'[,;\n•-]|\s(?:and|&)\s') # • is bullet point character
+WHITESPACE_RE = re.compile(r'\s+')
+# Labels that group a skills section rather than name a skill.
+SKILL_CATEGORY_LABELS = {
+    "languages", "programming languages", "frameworks", "libraries", "tools", "technologies", "databases",
+    "cloud", "platforms", "others", "other", "skills", "technical skills", "soft skills",
+}
+
+logger = logging.getLogger(__name__)
+
+def load_extractors() -> None:
+    """Loads the PDF/DOCX libraries and the skill taxonomy, which are otherwise loaded on the first parse."""
+    import fitz  # noqa: F401
+    import docx  # noqa: F401
+    default_taxonomy()
+
+def iter_pdf_pages(pdf_content: bytes) -> Iterator[str]:
+    """Yields the text of each PDF page in order, extracting pages lazily."""
+    import fitz  # PyMuPDF; imported on first use, it is slow to load
     try:
         doc = fitz.open(stream=pdf_content, filetype="pdf")
+    except Exception as e:
+        logger.warning("Error extracting text from PDF: %s", e)
+        return
+    try:
         for page in doc:
-            text += page.get_text()
-        doc.close()
+            yield page.get_text()
     except Exception as e:
-        print(f"Error extracting text from PDF: {e}")
-    return text
+        logger.warning("Error extracting text from PDF: %s", e)
+    finally:
+        doc.close()
 
-def extract_text_from_docx(docx_content: bytes) -> str:
-    """Extracts text from DOCX content."""
-    text = ""
+def iter_docx_paragraphs(docx_content: bytes) -> Iterator[str]:
+    """Yields each DOCX paragraph as a line of text."""
+    from docx import Document
     try:
-        doc = Document(docx_content)
+        doc = Document(io.BytesIO(docx_content))
         for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
+            yield paragraph.text + "\n"
     except Exception as e:
-        print(f"Error extracting text from DOCX: {e}")
-    return text
+        logger.warning("Error extracting text from DOCX: %s", e)
+
+def extract_text_from_pdf(pdf_content: bytes) -> str:
+    """Extracts text from PDF content."""
+    return "".join(iter_pdf_pages(pdf_content))
+
+def extract_text_from_docx(docx_content: bytes) -> str:
+    """Extracts text from DOCX content."""
+    return "".join(iter_docx_paragraphs(docx_content))
+
+def _iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Splits a stream of text chunks into lines without joining the whole document."""
+    pending = ""
+    for chunk in chunks:
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
 
 def parse_resume(file_content: bytes, file_type: str) -> ResumeData:
     """
     Parses resume content (PDF or DOCX) and extracts key information.
     This is a basic parser. For production, consider more advanced NLP.
+    The document is scanned once, line by line, and extraction stops as soon
+    as the email and every tracked section have been found, at the heading
+    that follows the last tracked section; otherwise it reads to the end.
     """
-    text = ""
     if file_type == "pdf":
-        text = extract_text_from_pdf(file_content)
+        chunks = iter_pdf_pages(file_content)
     elif file_type == "docx":
-        text = extract_text_from_docx(file_content)
+        chunks = iter_docx_paragraphs(file_content)
     else:
         raise ValueError("Unsupported file type")
 
     # Basic extraction using regex and keyword matching
     name = "N/A"
     email = "N/A"
-    experience = "N/A"
-    education = "N/A"
-    skills = []
     experience_years = 0
 
-    lines = text.split('\n')
-    if lines:
-        # Heuristic: Prioritize lines with multiple capitalized words, then fall back to first non-empty line
-        for line in lines[:5]: 
-            if line.strip() and len(line.strip().split()) > 1 and all(word.istitle() or not word.isalpha() for word in line.strip().split()):
-                name = line.strip()
+    first_lines: List[str] = []
+    sections: Dict[str, List[str]] = {}
+    closed_sections = set()
+    current_section = None
+
+    for line in _iter_lines(chunks):
+        if len(first_lines) < 5:
+            first_lines.append(line)
+
+        if email == "N/A":
+            email_match = EMAIL_RE.search(line)
+            if email_match:
+                email = email_match.group(0)
+
+        heading_match = HEADING_RE.match(line)
+        if heading_match:
+            if current_section:
+                closed_sections.add(current_section)
+            section = SECTION_FOR_HEADING.get(heading_match.group(1).lower())
+            # Only the first occurrence of each section is used.
+            current_section = section if section and section not in sections else None
+            if current_section:
+                sections[current_section] = [heading_match.group(2) or ""]
+            if email != "N/A" and closed_sections.issuperset(TRACKED_SECTIONS):
                 break
-        if name == "N/A" and lines[0].strip():
-            name = lines[0].strip()
-
-    # Email
-    email_match = re.search(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", text)
-    if email_match:
-        email = email_match.group(0)
-
-    # Experience
-    experience_match = re.search(
-        r"(experience|work history|professional experience)\s*(\n|:)(.*?)(education|skills|achievements|projects|$)",
-        text, re.IGNORECASE | re.DOTALL
-    )
-    if experience_match:
-        experience = experience_match.group(3).strip()
-        # Try to extract years of experience if present
-        years_match = re.search(r"(\d+)\s*(year|yr)s?\s*of\s*(experience|exp)", experience, re.IGNORECASE)
+            continue
+
+        if current_section:
+            sections[current_section].append(line)
+
+    # Heuristic: Prioritize lines with multiple capitalized words, then fall back to first non-empty line
+    for line in first_lines:
+        words = line.strip().split()
+        if line.strip() and len(words) > 1 and all(word.istitle() or not word.isalpha() for word in words):
+            name = line.strip()
+            break
+    if name == "N/A" and first_lines and first_lines[0].strip():
+        name = first_lines[0].strip()
+
+    experience = "\n".join(sections.get("experience", [])).strip() or "N/A"
+    education = "\n".join(sections.get("education", [])).strip() or "N/A"
+    skills = []
+
+    # Experience: try to extract years of experience if present
+    if "experience" in sections:
+        years_match = YEARS_OF_EXPERIENCE_RE.search(experience)
         if years_match:
             experience_years = int(years_match.group(1))
         else:
             # Fallback: estimate from common phrases if direct years not found
-            if re.search(r"(\d+)\+\s*years", experience, re.IGNORECASE):
-                experience_years = int(re.search(r"(\d+)", experience).group(1))
-            elif re.search(r"junior|entry-level", experience, re.IGNORECASE):
+            plus_match = YEARS_PLUS_RE.search(experience)
+            if plus_match:
+                experience_years = int(plus_match.group(1))
+            elif JUNIOR_RE.search(experience):
                 experience_years = 0
-            elif re.search(r"senior|lead|principal", experience, re.IGNORECASE):
+            elif SENIOR_RE.search(experience):
                 experience_years = 5 # Arbitrary, adjust as needed
 
-    # Education
-    education_match = re.search(
-        r"(education|qualifications)\s*(\n|:)(.*?)(skills|experience|projects|$)",
-        text, re.IGNORECASE | re.DOTALL
-    )
-    if education_match:
-        education = education_match.group(3).strip()
-
-    # Skills - Improved extraction, looking for common skill section headings
-    skills_match = re.search(
-        r"(skills|technical skills|proficiencies|core competencies)\s*(\n|:)(.*?)(experience|education|projects|awards|$)",
-        text, re.IGNORECASE | re.DOTALL
-    )
-    if skills_match:
-        skills_text = skills_match.group(3).strip()
-        # Split by common delimiters: commas, newlines, bullet points, etc.
-        raw_skills = re.split(r'[,;\n\u2022-]', skills_text) # \u2022 is bullet point character
-        skills = [s.strip() for s in raw_skills if s.strip() and len(s.strip()) > 1]
-        # Further refine skills (e.g., remove common filler words, ensure uniqueness)
-        skills = list(set([s.lower() for s in skills])) # Convert to lowercase and get unique
+    # Skills: known skills are found anywhere in the section in one pass and
+    # canonicalized ("Python3" -> "python"). What is left is split by common
+    # delimiters (commas, bullet points, etc.) and kept as unknown skills,
+    # minus category labels like "Frameworks:".
+    if "skills" in sections:
+        taxonomy = default_taxonomy()
+        known, remainder = taxonomy.extract_with_remainder("\n".join(sections["skills"]))
+        unknown = {taxonomy.canonical(item) for item in SKILL_SPLIT_RE.split(remainder)}
+        skills = sorted(set(known) | {s for s in unknown if len(s) > 1 and s not in SKILL_CATEGORY_LABELS})
 
     # Basic cleanup for extracted text fields
-    experience = re.sub(r'\s+', ' ', experience).strip()
-    education = re.sub(r'\s+', ' ', education).strip()
+    experience = WHITESPACE_RE.sub(' ', experience).strip()
+    education = WHITESPACE_RE.sub(' ', education).strip()
 
     return ResumeData(
         name=name,
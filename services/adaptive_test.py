@@ -0,0 +1,209 @@
+import math
+import logging
+from typing import List, Optional, Tuple, TYPE_CHECKING
+from services.rate_limiter import CircuitOpenError
+from services.deadline import DeadlineExceededError
+from services.question_bank import is_valid_question
+from services.session_store import AdaptiveSessionStore, TestSessionStore, new_session_id
+from services.skill_taxonomy import canonical_skills
+from services.test_generator import TestGenerator, difficulty_for_experience, is_correct_mcq, public_question
+from models.pydantic_models import (
+    AdaptiveAnswer, AdaptiveTestRequest, AdaptiveTestState, AdaptiveTestStep, TestQuestion
+)
+
+if TYPE_CHECKING:
+    from services.question_bank import QuestionBank
+
+logger = logging.getLogger(__name__)
+
+# Item difficulty of each tier on the ability scale.
+DIFFICULTY_LEVELS = {"beginner": -1.0, "intermediate": 0.0, "advanced": 1.0}
+_ABILITY_GRID = [-4.0 + 0.1 * i for i in range(81)]
+
+
+class AdaptiveTestConflictError(ValueError):
+    pass
+
+
+def estimate_ability(
+    prior_mean: float, responses: List[Tuple[float, bool]], prior_sd: float = 1.0
+) -> Tuple[float, float]:
+    """
+    Expected-a-posteriori ability estimate and its standard error under the
+    Rasch model, from (item difficulty, answered correctly) pairs and a
+    normal prior. Computed on a grid, so it is defined even for all-correct
+    or all-wrong answers.
+    """
+    log_weights = []
+    for theta in _ABILITY_GRID:
+        log_weight = -0.5 * ((theta - prior_mean) / prior_sd) ** 2
+        for difficulty, correct in responses:
+            p = 1.0 / (1.0 + math.exp(difficulty - theta))
+            log_weight += math.log(p if correct else 1.0 - p)
+        log_weights.append(log_weight)
+    top = max(log_weights)
+    weights = [math.exp(w - top) for w in log_weights]
+    total = sum(weights)
+    mean = sum(theta * w for theta, w in zip(_ABILITY_GRID, weights)) / total
+    variance = sum((theta - mean) ** 2 * w for theta, w in zip(_ABILITY_GRID, weights)) / total
+    return mean, math.sqrt(variance)
+
+
+def level_for_ability(ability: float) -> str:
+    """The tier whose questions tell the most about a candidate of this ability."""
+    return min(DIFFICULTY_LEVELS, key=lambda level: abs(DIFFICULTY_LEVELS[level] - ability))
+
+
+class AdaptiveTester:
+    """
+    Adaptive MCQ tests: questions are served one at a time at the tier
+    closest to the running ability estimate and graded locally as they are
+    answered. The test stops once the estimate's standard error is at most
+    target_standard_error (after min_questions) or max_questions is reached,
+    so clear-cut candidates answer fewer questions. Questions come from the
+    bank; on a miss a few are generated and banked for later sessions.
+    """
+
+    def __init__(
+        self,
+        test_generator: TestGenerator,
+        question_bank: Optional["QuestionBank"],
+        sessions: AdaptiveSessionStore,
+        test_sessions: Optional[TestSessionStore] = None,
+        target_standard_error: float = 0.7,
+        generation_batch_size: int = 3
+    ):
+        self.test_generator = test_generator
+        self.question_bank = question_bank
+        self.sessions = sessions
+        self.test_sessions = test_sessions
+        self.target_standard_error = target_standard_error
+        self.generation_batch_size = generation_batch_size
+        self.stats = {"started": 0, "answered": 0, "finished": 0, "early_stops": 0, "generated": 0}
+
+    async def start(self, request: AdaptiveTestRequest) -> AdaptiveTestStep:
+        """Starts a session and returns its first question. Raises LookupError when no question is available."""
+        skills = canonical_skills(request.skills)
+        if not skills:
+            raise ValueError("At least one skill is required.")
+        prior = DIFFICULTY_LEVELS[difficulty_for_experience(request.experience_years)]
+        state = AdaptiveTestState(
+            skills=skills,
+            prior_ability=prior,
+            ability=prior,
+            standard_error=1.0,
+            max_questions=request.max_questions,
+            min_questions=min(request.min_questions, request.max_questions)
+        )
+        session_id = new_session_id()
+        step = await self._advance(session_id, state, previous_correct=None)
+        if step.question is None:
+            raise LookupError("No questions are available for these skills right now. Please try again later.")
+        self.stats["started"] += 1
+        return step
+
+    async def answer(self, submission: AdaptiveAnswer) -> Optional[AdaptiveTestStep]:
+        """
+        Grades the answer, updates the ability estimate and returns the next
+        question or the final result. None when the session is unknown or expired.
+        """
+        state = self.sessions.get(submission.session_id)
+        if state is None:
+            return None
+        index = len(state.answers)
+        if submission.question_index != index or index >= len(state.questions):
+            raise AdaptiveTestConflictError(f"Expected an answer to question {index}.")
+
+        state.answers[str(index)] = submission.answer
+        responses = [
+            (DIFFICULTY_LEVELS[difficulty], is_correct_mcq(question, state.answers[str(i)]))
+            for i, (question, difficulty) in enumerate(zip(state.questions, state.difficulties))
+        ]
+        state.ability, state.standard_error = estimate_ability(state.prior_ability, responses)
+        # Recorded only if no concurrent answer to this question got there first.
+        if not self.sessions.put(submission.session_id, state, expected_answered=index):
+            raise AdaptiveTestConflictError(f"Question {index} was already answered.")
+        self.stats["answered"] += 1
+        return await self._advance(submission.session_id, state, previous_correct=responses[-1][1])
+
+    async def _advance(self, session_id: str, state: AdaptiveTestState, previous_correct: Optional[bool]) -> AdaptiveTestStep:
+        """Serves the next question, or finishes the test."""
+        answered = len(state.answers)
+        converged = answered >= state.min_questions and state.standard_error <= self.target_standard_error
+        question, difficulty = None, None
+        if answered < state.max_questions and not converged:
+            skill = state.skills[answered % len(state.skills)]
+            question, difficulty = await self._next_question(skill, level_for_ability(state.ability), state)
+
+        step = AdaptiveTestStep(
+            session_id=session_id,
+            previous_correct=previous_correct,
+            ability=round(state.ability, 3),
+            standard_error=round(state.standard_error, 3),
+            level=level_for_ability(state.ability),
+            done=question is None
+        )
+        if question is not None:
+            state.questions.append(question)
+            state.difficulties.append(difficulty)
+            self.sessions.put(session_id, state)
+            step.question_index = answered
+            step.question = public_question(question)
+            step.difficulty = difficulty
+            return step
+
+        self.sessions.delete(session_id)
+        if not state.questions:
+            return step
+        self.stats["finished"] += 1
+        if answered < state.max_questions:
+            self.stats["early_stops"] += 1
+        step.result = await self.test_generator.evaluate_test(state.questions, state.answers, include_narrative=False)
+        step.result.overall_feedback += f" Estimated level: {step.level}."
+        if self.test_sessions is not None:
+            # The finished test can be submitted to /evaluate-test for the AI narrative.
+            self.test_sessions.put(session_id, state.questions)
+        return step
+
+    async def _next_question(
+        self, skill: str, difficulty: str, state: AdaptiveTestState
+    ) -> Tuple[Optional[TestQuestion], Optional[str]]:
+        """
+        An unasked question on skill at difficulty: from the bank, else freshly
+        generated, else from the bank at the nearest other tier.
+        """
+        asked = {question.question for question in state.questions}
+        question = self._from_bank(skill, difficulty, asked)
+        if question is not None:
+            return question, difficulty
+
+        try:
+            generated = await self.test_generator.generate_questions_from_llm(
+                [skill], difficulty, self.generation_batch_size, "mcq", avoid_questions=sorted(asked)
+            )
+        except (CircuitOpenError, DeadlineExceededError):
+            generated = []
+        generated = [q for q in generated if is_valid_question(q, "mcq") and q.question not in asked]
+        if generated:
+            self.stats["generated"] += len(generated)
+            if self.question_bank is not None:
+                self.question_bank.add(skill, difficulty, "mcq", generated)
+            return generated[0], difficulty
+
+        nearest = sorted(
+            (level for level in DIFFICULTY_LEVELS if level != difficulty),
+            key=lambda level: abs(DIFFICULTY_LEVELS[level] - DIFFICULTY_LEVELS[difficulty])
+        )
+        for level in nearest:
+            question = self._from_bank(skill, level, asked)
+            if question is not None:
+                return question, level
+        logger.warning("No question available for %s at any difficulty", skill)
+        return None, None
+
+    def _from_bank(self, skill: str, difficulty: str, asked: set) -> Optional[TestQuestion]:
+        if self.question_bank is None:
+            return None
+        # Drawing one more than was asked guarantees an unasked question if the bucket has one.
+        sampled = self.question_bank.sample([skill], difficulty, "mcq", len(asked) + 1, min_questions=1) or []
+        return next((question for question in sampled if question.question not in asked), None)
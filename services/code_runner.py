@@ -0,0 +1,297 @@
+import os
+import ast
+import builtins
+import sys
+import json
+import shutil
+import signal
+import asyncio
+import hashlib
+import logging
+import secrets
+import tempfile
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from models.pydantic_models import CodeTestCase, CodeRunResult, TestQuestion
+from services.observability import stage
+
+logger = logging.getLogger(__name__)
+
+_RESULT_MARKER = "__CODE_RUNNER_RESULT__"
+_MAX_ACTUAL_CHARS = 100_000
+
+# Runs inside the sandboxed interpreter. It applies the resource limits before
+# any submitted code runs, and never sees the expected values: it only reports
+# the repr of each call's result, and the parent compares. A forged result line
+# can therefore only claim return values, not a pass. The submission's own
+# output is captured, so only the harness writes to the real stdout. Its state
+# lives in main()'s locals and is dropped before the submission runs, so the
+# submission finds nothing in sys.modules['__main__'] but main itself.
+_HARNESS = r'''
+import io, sys, json
+def main():
+    payload = json.loads(sys.stdin.readline())
+    try:
+        import resource
+        for name, value in payload["limits"].items():
+            resource.setrlimit(getattr(resource, name), (value, value))
+    except ImportError:  # Not available on Windows; runs there only get the wall-clock timeout.
+        pass
+    code, calls, max_chars = payload["code"], payload["calls"], payload["max_actual_chars"]
+    frame = "%s%s:" % (payload["marker"], payload["nonce"])
+    del payload
+    real_stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    def report(outcome):
+        real_stdout.write(frame + json.dumps(outcome) + "\n")
+        real_stdout.flush()
+    namespace = {"__name__": "__submission__"}
+    try:
+        exec(compile(code, "<submission>", "exec"), namespace)
+    except BaseException as e:
+        report({"error": type(e).__name__})
+        return
+    results = []
+    for call in calls:
+        try:
+            results.append({"actual": repr(eval(call, namespace))[:max_chars]})
+        except BaseException as e:
+            results.append({"raised": type(e).__name__})
+    report({"results": results})
+main()
+'''
+
+
+def _exception_name(name: object) -> str:
+    """A built-in exception name as reported by the harness; anything else could carry data out."""
+    name = str(name)
+    builtin = getattr(builtins, name, None)
+    return name if isinstance(builtin, type) and issubclass(builtin, BaseException) else "an exception"
+
+
+def case_passed(actual: str, expected: str) -> bool:
+    """Compares a reported repr with the expected value as literals, falling back to the text."""
+    try:
+        expected_value = ast.literal_eval(expected)
+    except Exception:
+        expected_value = expected
+    try:
+        if ast.literal_eval(actual) == expected_value:
+            return True
+    except Exception:
+        pass
+    return actual == expected.strip()
+
+
+def parse_example_case(example: Optional[str]) -> Optional[CodeTestCase]:
+    """Turns an example like 'f([1, 2]) -> [2]' into a test case, if it is a Python call."""
+    if not example or "->" not in example:
+        return None
+    call, expected = (part.strip() for part in example.split("->", 1))
+    try:
+        if not isinstance(ast.parse(call, mode="eval").body, ast.Call):
+            return None
+    except SyntaxError:
+        return None
+    return CodeTestCase(call=call, expected=expected)
+
+
+def test_cases_for(question: TestQuestion) -> List[CodeTestCase]:
+    """The question's stored test cases plus the case parsed from its example."""
+    cases = list(question.test_cases or [])
+    example_case = parse_example_case(question.expected_output_example)
+    if example_case and all(case.call != example_case.call for case in cases):
+        cases.insert(0, example_case)
+    return cases
+
+
+class CodeRunner:
+    """
+    Runs Python submissions against test cases in sandboxed subprocesses.
+    Each run gets its own temporary directory, an empty environment, an
+    isolated interpreter (-I) and CPU, memory, file-size and wall-clock caps.
+    With sandbox="namespaces" (the default) the interpreter also runs in new
+    network, PID, mount, IPC and UTS namespaces, so it has no network and its
+    /proc shows only itself, as an unprivileged uid with no capabilities. The
+    host filesystem stays visible: submissions can write only where that uid
+    may, but can read any world-readable file, the app source included, so
+    secrets must not be world-readable. That needs root (or CAP_SYS_ADMIN and
+    CAP_SETUID) and util-linux's unshare and setpriv; without them the runner
+    is disabled and coding answers are graded by the model. sandbox="none"
+    runs submissions unsandboxed, for development.
+    Concurrency is bounded, and results are cached by (question, code) hash.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        cpu_seconds: int = 2,
+        memory_bytes: int = 256 * 1024 * 1024,
+        wall_timeout_seconds: float = 5.0,
+        cache_size: int = 1024,
+        sandbox: str = "namespaces",
+        sandbox_uid: int = 65534,
+        sandbox_gid: int = 65534,
+    ):
+        if sandbox not in ("namespaces", "none"):
+            raise ValueError("sandbox must be 'namespaces' or 'none'.")
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.wall_timeout_seconds = wall_timeout_seconds
+        self.cache_size = cache_size
+        self.sandbox = sandbox
+        self.sandbox_uid = sandbox_uid
+        self.sandbox_gid = sandbox_gid
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._cache: "OrderedDict[Tuple[str, str], CodeRunResult]" = OrderedDict()
+        # The sandbox command prefix, probed on first use; [] when unsandboxed, None when unavailable.
+        self._sandbox_prefix: Optional[List[str]] = [] if sandbox == "none" else None
+        self._sandbox_probed = sandbox == "none"
+
+    def _namespace_prefix(self) -> Optional[List[str]]:
+        """The unshare/setpriv command that runs the interpreter in its own namespaces as the sandbox uid."""
+        unshare, setpriv = shutil.which("unshare"), shutil.which("setpriv")
+        if not unshare or not setpriv:
+            return None
+        return [
+            unshare, "--net", "--pid", "--fork", "--kill-child", "--mount-proc", "--mount", "--ipc", "--uts", "--",
+            setpriv, f"--reuid={self.sandbox_uid}", f"--regid={self.sandbox_gid}", "--clear-groups",
+            "--inh-caps=-all", "--bounding-set=-all", "--no-new-privs", "--",
+        ]
+
+    async def _sandbox_available(self) -> bool:
+        """Checks once that the namespace sandbox can start an interpreter as the sandbox uid."""
+        if not self._sandbox_probed:
+            self._sandbox_probed = True
+            prefix = self._namespace_prefix()
+            if prefix is not None:
+                try:
+                    process = await asyncio.create_subprocess_exec(
+                        *prefix, sys.executable, "-I", "-c", "import os; print(os.getuid())",
+                        stdin=asyncio.subprocess.DEVNULL,
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.DEVNULL,
+                        env={},
+                    )
+                    stdout, _ = await asyncio.wait_for(process.communicate(), timeout=10)
+                    if process.returncode != 0 or stdout.strip() != str(self.sandbox_uid).encode():
+                        prefix = None
+                except (OSError, asyncio.TimeoutError):
+                    prefix = None
+            self._sandbox_prefix = prefix
+            if prefix is None:
+                logger.warning(
+                    "The code sandbox is unavailable (needs root, unshare and setpriv); "
+                    "coding answers will be graded by the model."
+                )
+        return self._sandbox_prefix is not None
+
+    def _limits(self) -> dict:
+        """rlimits the harness applies to itself before running the submission."""
+        return {
+            "RLIMIT_CPU": self.cpu_seconds,
+            "RLIMIT_AS": self.memory_bytes,
+            "RLIMIT_FSIZE": 1024 * 1024,
+            "RLIMIT_CORE": 0,
+            "RLIMIT_NPROC": 0,
+        }
+
+    async def run(self, question: TestQuestion, code: str) -> Optional[CodeRunResult]:
+        """
+        Runs the submission against the question's test cases. Returns None
+        when the question has no runnable cases or the code is not Python.
+        """
+        cases = test_cases_for(question)
+        if not cases:
+            return None
+        try:
+            ast.parse(code)
+        except SyntaxError:
+            return None
+        if not await self._sandbox_available():
+            return None
+
+        question_key = hashlib.sha256(
+            json.dumps([question.question] + [case.model_dump() for case in cases]).encode("utf-8")
+        ).hexdigest()
+        key = (question_key, hashlib.sha256(code.encode("utf-8")).hexdigest())
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        async with self._semaphore:
+            with stage("code_run"):
+                result = await self._execute(code, cases)
+
+        self._cache[key] = result
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    async def _execute(self, code: str, cases: List[CodeTestCase]) -> CodeRunResult:
+        # A fresh nonce per run frames the results line, so printed marker text can't pose as results;
+        # even a forged line only claims return values, which are checked here against the expected ones.
+        frame = f"{_RESULT_MARKER}{secrets.token_hex(16)}:"
+        payload = json.dumps({
+            "code": code,
+            "calls": [case.call for case in cases],
+            "marker": _RESULT_MARKER,
+            "nonce": frame[len(_RESULT_MARKER):-1],
+            "limits": self._limits(),
+            "max_actual_chars": _MAX_ACTUAL_CHARS,
+        }).encode("utf-8") + b"\n"
+
+        with tempfile.TemporaryDirectory(prefix="code-run-") as workdir:
+            harness_path = os.path.join(workdir, "harness.py")
+            with open(harness_path, "w", encoding="utf-8") as harness:
+                harness.write(_HARNESS)
+            if self._sandbox_prefix:
+                # The sandbox uid owns the run's directory and nothing else.
+                os.chown(workdir, self.sandbox_uid, self.sandbox_gid)
+                os.chown(harness_path, self.sandbox_uid, self.sandbox_gid)
+
+            process = await asyncio.create_subprocess_exec(
+                *self._sandbox_prefix, sys.executable, "-I", harness_path,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+                cwd=workdir,
+                env={},
+                # A new session instead of os.setsid() in a preexec_fn, which is unsafe in a threaded server.
+                start_new_session=True,
+            )
+            try:
+                stdout, _ = await asyncio.wait_for(process.communicate(payload), timeout=self.wall_timeout_seconds)
+            except asyncio.TimeoutError:
+                # The run leads its own process group; killing it takes the sandbox down too.
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    process.kill()
+                await process.wait()
+                return CodeRunResult(passed=0, total=len(cases), error="Time limit exceeded.")
+
+        for line in reversed(stdout.decode("utf-8", errors="replace").splitlines()):
+            if line.startswith(frame):
+                outcome = json.loads(line[len(frame):])
+                break
+        else:
+            return CodeRunResult(
+                passed=0, total=len(cases),
+                error="The submission crashed or exceeded its resource limits."
+            )
+
+        if "error" in outcome:
+            return CodeRunResult(passed=0, total=len(cases), error=f"{_exception_name(outcome['error'])} while loading the submission")
+        # Feedback names only exception types, never values the submission produced,
+        # so nothing the code read inside the sandbox can reach the caller.
+        passed = 0
+        failures = []
+        for case, item in zip(cases, outcome["results"]):
+            if "raised" in item:
+                failures.append(f"{case.call} raised {_exception_name(item['raised'])}, expected {case.expected}")
+            elif case_passed(str(item.get("actual", "")), case.expected):
+                passed += 1
+            else:
+                failures.append(f"{case.call} did not return the expected {case.expected}")
+        return CodeRunResult(passed=passed, total=len(cases), failures=failures)
@@ -0,0 +1,410 @@
+import ssl
+import time
+import uuid
+import socket
+import asyncio
+import logging
+import ipaddress
+import threading
+import http.client
+import urllib.parse
+from typing import AsyncIterator, Collection, Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+from models.pydantic_models import EvaluationJob, TestResult, TestSubmission
+from services.shared_state import connect_shared, owner_is_alive, process_owner
+
+if TYPE_CHECKING:
+    from services.test_generator import TestGenerator
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("done", "failed")
+
+
+class EvaluationQueueFullError(RuntimeError):
+    pass
+
+
+class CallbackURLError(ValueError):
+    pass
+
+
+def resolve_callback_url(
+    url: str, allowed_hosts: Optional[Collection[str]] = None
+) -> Tuple[urllib.parse.SplitResult, str]:
+    """
+    Checks a callback URL and returns it split, with the address to connect
+    to. Raises CallbackURLError unless it is http(s), its host is in
+    allowed_hosts (when given) and every address it resolves to is public,
+    so callbacks can't be aimed at loopback, private or link-local services.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise CallbackURLError("callback_url must be an http(s) URL.")
+    if allowed_hosts and parts.hostname.lower() not in allowed_hosts:
+        raise CallbackURLError(f"callback_url host '{parts.hostname}' is not allowed.")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except ValueError:
+        raise CallbackURLError("callback_url has an invalid port.") from None
+    except socket.gaierror:
+        raise CallbackURLError(f"callback_url host '{parts.hostname}' could not be resolved.") from None
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise CallbackURLError("callback_url must resolve to a public address.")
+    return parts, infos[0][4][0]
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """Connects to an already checked address instead of resolving the host again."""
+
+    def __init__(self, host: str, port: Optional[int], address: str, timeout: float):
+        super().__init__(host, port, timeout=timeout)
+        self.address = address
+
+    def connect(self) -> None:
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS variant of _PinnedHTTPConnection; the certificate is still checked against the host name."""
+
+    def __init__(self, host: str, port: Optional[int], address: str, timeout: float):
+        self.ssl_context = ssl.create_default_context()
+        super().__init__(host, port, timeout=timeout, context=self.ssl_context)
+        self.address = address
+
+    def connect(self) -> None:
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        self.sock = self.ssl_context.wrap_socket(sock, server_hostname=self.host)
+
+
+class EvaluationQueue:
+    """
+    Runs test evaluations in the background so the submitting request can
+    return a job id immediately. Jobs are scheduled by priority on a fixed
+    pool of workers, and their state is persisted in SQLite: on start, jobs
+    that were pending or running when the process stopped are queued again.
+    Finished jobs are kept for retention_seconds so clients can collect them.
+
+    Several processes may share one store: a job is claimed atomically by the
+    process that runs it, and watchers poll the store for jobs run by another
+    process. Each process renews its claims every reclaim_interval_seconds and
+    takes over unfinished jobs whose owner has exited or not renewed them for
+    claim_ttl_seconds.
+
+    Callback URLs must resolve to public addresses (and, with
+    callback_allowed_hosts, name an allowed host); they are checked again when
+    the callback is sent, and redirects are not followed.
+    """
+
+    def __init__(
+        self,
+        test_generator: "TestGenerator",
+        path: str,
+        workers: int = 4,
+        max_pending: int = 1000,
+        retention_seconds: float = 24 * 3600,
+        callback_timeout_seconds: float = 10.0,
+        poll_interval_seconds: float = 1.0,
+        reclaim_interval_seconds: float = 15.0,
+        claim_ttl_seconds: float = 120.0,
+        callback_allowed_hosts: Optional[Collection[str]] = None,
+    ):
+        self.test_generator = test_generator
+        self.path = path
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self.callback_timeout_seconds = callback_timeout_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.reclaim_interval_seconds = reclaim_interval_seconds
+        self.claim_ttl_seconds = claim_ttl_seconds
+        self.callback_allowed_hosts = {host.lower() for host in callback_allowed_hosts or ()}
+        self.owner = process_owner()
+        self.stats = {"submitted": 0, "done": 0, "failed": 0, "recovered": 0, "rejected": 0}
+
+        self._conn = connect_shared(path)
+        self._lock = threading.Lock()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._sequence = 0  # Keeps equal priorities first-in, first-out.
+        self._pending = 0
+        # Jobs queued or running in this process; unfinished jobs we own but don't hold here get queued again.
+        self._local_jobs: Set[str] = set()
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS evaluation_jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL, "
+                "submission TEXT NOT NULL, include_narrative INTEGER NOT NULL, callback_url TEXT, "
+                "result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, owner TEXT, "
+                "heartbeat_at REAL)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(evaluation_jobs)")}
+            if "owner" not in columns:
+                self._conn.execute("ALTER TABLE evaluation_jobs ADD COLUMN owner TEXT")
+            if "heartbeat_at" not in columns:
+                self._conn.execute("ALTER TABLE evaluation_jobs ADD COLUMN heartbeat_at REAL")
+            self._conn.commit()
+            if "defer_narrative" in columns:
+                self._migrate_narrative_flag()
+
+    def _migrate_narrative_flag(self) -> None:
+        """The narrative used to be opt-out (defer_narrative); jobs stored then keep their meaning."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(evaluation_jobs)")}
+            # Another worker may have migrated the table meanwhile.
+            if "defer_narrative" in columns:
+                self._conn.execute("ALTER TABLE evaluation_jobs RENAME COLUMN defer_narrative TO include_narrative")
+                self._conn.execute("UPDATE evaluation_jobs SET include_narrative = 1 - include_narrative")
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+
+    def start(self) -> None:
+        """Queues unfinished jobs from the store and starts the workers."""
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM evaluation_jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (time.time() - self.retention_seconds,)
+            )
+            self._conn.commit()
+        self._reclaim()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._keep_claims()))
+
+    def _reclaim(self) -> int:
+        """
+        Renews this process's claims and queues here the unfinished jobs whose
+        owner has exited or let its claim expire, as well as jobs claimed by
+        this process that it no longer holds. Returns how many were taken over.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE evaluation_jobs SET heartbeat_at = ? WHERE owner = ? AND status IN ('pending', 'running')",
+                    (now, self.owner)
+                )
+                rows = self._conn.execute(
+                    "SELECT id, priority, owner, heartbeat_at FROM evaluation_jobs "
+                    "WHERE status IN ('pending', 'running') ORDER BY created_at"
+                ).fetchall()
+                taken = [
+                    (job_id, priority) for job_id, priority, owner, heartbeat_at in rows
+                    if (job_id not in self._local_jobs if owner == self.owner else
+                        not owner or (heartbeat_at or 0) < now - self.claim_ttl_seconds or not owner_is_alive(owner))
+                ]
+                self._conn.executemany(
+                    "UPDATE evaluation_jobs SET status = 'pending', owner = ?, heartbeat_at = ? WHERE id = ?",
+                    [(self.owner, now, job_id) for job_id, _ in taken]
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        for job_id, priority in taken:
+            self._enqueue(job_id, priority)
+        self.stats["recovered"] += len(taken)
+        return len(taken)
+
+    async def _keep_claims(self) -> None:
+        while True:
+            await asyncio.sleep(self.reclaim_interval_seconds)
+            try:
+                self._reclaim()
+            except Exception as e:
+                logger.warning("Renewing evaluation job claims failed: %s", e)
+
+    async def stop(self) -> None:
+        """Stops the workers. Interrupted jobs stay in the store and resume on the next start."""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._pending = 0
+        self._local_jobs.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _enqueue(self, job_id: str, priority: int) -> None:
+        self._sequence += 1
+        self._pending += 1
+        self._local_jobs.add(job_id)
+        self._queue.put_nowait((priority, self._sequence, job_id))
+
+    def submit(
+        self,
+        submission: TestSubmission,
+        priority: int = 5,
+        include_narrative: bool = True,
+        callback_url: Optional[str] = None
+    ) -> EvaluationJob:
+        """Stores and queues a submission. Raises EvaluationQueueFullError when too many jobs are waiting."""
+        if self._queue is None:
+            raise RuntimeError("The evaluation queue has not been started.")
+        if self._pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise EvaluationQueueFullError("Too many evaluations are waiting. Please retry shortly.")
+
+        now = time.time()
+        job = EvaluationJob(id=uuid.uuid4().hex, status="pending", priority=priority, created_at=now, updated_at=now)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO evaluation_jobs "
+                "(id, status, priority, submission, include_narrative, callback_url, created_at, updated_at, "
+                "owner, heartbeat_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.status, priority, submission.model_dump_json(), int(include_narrative),
+                 callback_url, now, now, self.owner, now)
+            )
+            self._conn.commit()
+        self._enqueue(job.id, priority)
+        self.stats["submitted"] += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[EvaluationJob]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, priority, created_at, updated_at, result, error "
+                "FROM evaluation_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return EvaluationJob(
+            id=row[0], status=row[1], priority=row[2], created_at=row[3], updated_at=row[4],
+            result=TestResult.model_validate_json(row[5]) if row[5] else None,
+            error=row[6]
+        )
+
+    async def watch(self, job_id: str) -> AsyncIterator[EvaluationJob]:
+        """Yields the job now and after every status change, until it finishes."""
+        updates: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(updates)
+        try:
+            job = self.get(job_id)
+            last_status = None
+            while job is not None:
+                if job.status != last_status:
+                    yield job
+                    last_status = job.status
+                if job.status in TERMINAL_STATUSES:
+                    return
+                try:
+                    job = await asyncio.wait_for(updates.get(), timeout=self.poll_interval_seconds)
+                except asyncio.TimeoutError:
+                    # The job may be running in another process sharing the store, which can't notify us.
+                    job = self.get(job_id)
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(updates)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    def _update(self, job_id: str, status: str, result: Optional[TestResult] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE evaluation_jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, result.model_dump_json() if result else None, error, time.time(), job_id)
+            )
+            self._conn.commit()
+        self._notify(job_id)
+
+    def _notify(self, job_id: str) -> None:
+        if job_id in self._subscribers:
+            job = self.get(job_id)
+            for updates in self._subscribers[job_id]:
+                updates.put_nowait(job)
+
+    async def _work(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            self._pending -= 1
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Evaluation job %s could not be processed", job_id)
+            finally:
+                self._local_jobs.discard(job_id)
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str) -> None:
+        with self._lock:
+            # Claim the job, so no other process sharing the store runs it too.
+            claimed = self._conn.execute(
+                "UPDATE evaluation_jobs SET status = 'running', owner = ?, updated_at = ?, heartbeat_at = ? "
+                "WHERE id = ? AND status = 'pending'", (self.owner, time.time(), time.time(), job_id)
+            ).rowcount
+            self._conn.commit()
+            if not claimed:
+                return
+            row = self._conn.execute(
+                "SELECT submission, include_narrative, callback_url FROM evaluation_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        self._notify(job_id)
+        submission = TestSubmission.model_validate_json(row[0])
+        try:
+            result = await self.test_generator.evaluate_test(
+                questions=submission.questions,
+                answers=submission.answers,
+                include_narrative=bool(row[1])
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Evaluation job %s failed: %s", job_id, e)
+            self._update(job_id, "failed", error=f"Error evaluating test: {str(e)}")
+            self.stats["failed"] += 1
+        else:
+            self._update(job_id, "done", result=result)
+            self.stats["done"] += 1
+        if row[2]:
+            await self._send_callback(row[2], self.get(job_id))
+
+    async def check_callback_url(self, url: str) -> None:
+        """Raises CallbackURLError unless the URL may be used as a callback."""
+        await asyncio.to_thread(resolve_callback_url, url, self.callback_allowed_hosts)
+
+    async def _send_callback(self, url: str, job: EvaluationJob) -> None:
+        """POSTs the finished job to the client's callback URL. Failures are logged, not retried."""
+        body = job.model_dump_json().encode("utf-8")
+
+        def post() -> None:
+            # Resolved and checked again, and the checked address is the one connected to,
+            # so the host can't be re-pointed at an internal address after submission.
+            parts, address = resolve_callback_url(url, self.callback_allowed_hosts)
+            connection_class = _PinnedHTTPSConnection if parts.scheme == "https" else _PinnedHTTPConnection
+            connection = connection_class(parts.hostname, parts.port, address, self.callback_timeout_seconds)
+            path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+            try:
+                connection.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    raise RuntimeError(f"HTTP {response.status}")
+            finally:
+                connection.close()
+
+        try:
+            await asyncio.to_thread(post)
+        except Exception as e:
+            logger.warning("Callback for evaluation job %s to %s failed: %s", job.id, url, e)
@@ -1,71 +1,329 @@
-import re
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-import json
-from typing import List, Dict, Any
+import copy
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import aclosing
+from typing import Dict, Any, Optional, AsyncIterator, Callable
+from services.llm_cache import LLMResponseCache, make_cache_key
+from services.json_stream import JsonArrayStreamParser, parse_json_response
+from services.prompt_builder import TokenUsage, estimate_tokens, structured_prompt
+from services.observability import LLM_LATENCY, LLM_TOKENS, stage
+from services.rate_limiter import RateLimiter
+from services.deadline import DeadlineExceededError, deadline_scope, no_deadline, remaining, within_deadline
 
-def clean_json(text: str) -> str:
-    text = text.strip()
+logger = logging.getLogger(__name__)
 
-    # remove markdown fences
-    text = re.sub(r"```(?:json)?", "", text)
-    text = text.replace("```", "")
+class _InFlightCall:
+    """A shared upstream call and the number of callers currently awaiting it."""
 
-    # remove trailing commas
-    text = re.sub(r",\s*([}\]])", r"\1", text)
-
-    return text
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
 
 class GeminiService:
-    def __init__(self, api_key: str):
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            google_api_key=api_key,
-            temperature=0.2  # lower randomness = cleaner JSON
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gemini-2.5-flash",
+        temperature: float = 0.2,  # lower randomness = cleaner JSON
+        cache: Optional[LLMResponseCache] = None,
+        max_waiters_per_key: int = 100,
+        shared_call_seconds: Optional[float] = 60.0,
+        limiter: Optional[RateLimiter] = None,
+        hedge_requests: bool = False,
+        hedge_min_delay_seconds: float = 2.0,
+        hedge_percentile: float = 0.95,
+        log_token_usage: bool = False
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        # The chat client (and LangChain with it) is loaded on first use, see `llm`.
+        self._llm = None
+        self._llm_lock = threading.Lock()
+        self.cache = cache
+        # Shared request/token budgets, adaptive concurrency and circuit breaker for upstream calls.
+        self.limiter = limiter
+
+        # Single-flight state: identical concurrent structured calls share one request.
+        self.max_waiters_per_key = max_waiters_per_key
+        # Budget of a shared call, which outlives whichever caller happened to start it.
+        self.shared_call_seconds = shared_call_seconds
+        self._in_flight: Dict[str, _InFlightCall] = {}
+        self.coalescing_stats = {"leaders": 0, "followers": 0, "overflow": 0}
+
+        # Hedging: when a structured call runs longer than the recent p95, a
+        # duplicate is sent and whichever parses first wins.
+        self.hedge_requests = hedge_requests
+        self.hedge_min_delay_seconds = hedge_min_delay_seconds
+        self.hedge_percentile = hedge_percentile
+        self._latencies: deque = deque(maxlen=200)
+        self.hedging_stats = {"hedged": 0, "hedge_wins": 0, "deadline_exceeded": 0}
+
+        # Prompt/completion token counts per purpose (e.g. "evaluate_test"), optionally logged per call.
+        self.token_usage = TokenUsage()
+        self.log_token_usage = log_token_usage
+
+    @property
+    def llm(self):
+        """The LangChain chat model, created on first use so that importing the app stays fast."""
+        if self._llm is None:
+            with self._llm_lock:
+                if self._llm is None:
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+                    self._llm = ChatGoogleGenerativeAI(
+                        model=self.model,
+                        google_api_key=self.api_key,
+                        temperature=self.temperature
+                    )
+        return self._llm
+
+    @llm.setter
+    def llm(self, llm) -> None:
+        self._llm = llm
+
+    def warm_up(self) -> None:
+        """Loads the chat model ahead of the first request. Blocking; run it off the event loop."""
+        self.llm
+
+    async def generate_text(self, prompt: str, purpose: str = "default") -> str:
+        """Generates text using the Gemini model, through the limiter when one is configured."""
+        try:
+            if self.limiter is not None:
+                return await self.limiter.run(prompt, lambda: self._invoke(prompt, purpose))
+            return await self._invoke(prompt, purpose)
+        except Exception as e:
+            logger.warning("Error generating text with Gemini: %s", e)
+            raise
+
+    async def _invoke(self, prompt: str, purpose: str) -> str:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with stage("llm_call"):
+                response = await self.llm.ainvoke(prompt)
+            outcome = "ok"
+        finally:
+            LLM_LATENCY.observe(time.perf_counter() - started, purpose=purpose, outcome=outcome)
+         # Explicitly get the string content from the AIMessage object
+        if hasattr(response, 'content'):
+            content = response.content
+        else:
+            content = str(response)
+        usage = getattr(response, "usage_metadata", None) or {}
+        self._record_usage(
+            purpose,
+            usage.get("input_tokens") or estimate_tokens(prompt),
+            usage.get("output_tokens") or estimate_tokens(content)
         )
-        self.output_parser = StrOutputParser()
+        return content
+
+    def _record_usage(self, purpose: str, prompt_tokens: int, completion_tokens: int) -> None:
+        self.token_usage.record(purpose, prompt_tokens, completion_tokens)
+        LLM_TOKENS.inc(prompt_tokens, purpose=purpose, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, purpose=purpose, kind="completion")
+        if self.log_token_usage:
+            logger.info(
+                "Gemini call (%s): %d prompt tokens, %d completion tokens", purpose, prompt_tokens, completion_tokens,
+                extra={"purpose": purpose, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+            )
 
-    async def generate_text(self, prompt: str) -> str:
-        """Generates text using the Gemini model."""
+    async def stream_text(
+        self, prompt: str, purpose: str = "default", until: Optional[Callable[[], bool]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Streams text chunks from the Gemini model as they are produced.
+        A stream holds one limiter slot for its whole duration; it is not
+        retried, since chunks may already have been handed to the caller.
+        until, checked after each chunk, ends the stream early as a success,
+        e.g. once a parser has everything it needs from the response. A stream
+        closed by its caller instead releases its slot without an outcome.
+        """
         try:
-            response = await self.llm.ainvoke(prompt)
-             # Explicitly get the string content from the AIMessage object
-            if hasattr(response, 'content'):
-                return response.content
+            if self.limiter is None:
+                async with aclosing(self._stream(prompt, purpose, until)) as chunks:
+                    async for content in chunks:
+                        yield content
             else:
-                return self.output_parser.parse(response)
+                async with self.limiter.slot(prompt), aclosing(self._stream(prompt, purpose, until)) as chunks:
+                    async for content in chunks:
+                        yield content
         except Exception as e:
-            print(f"Error generating text with Gemini: {e}")
+            logger.warning("Error streaming text with Gemini: %s", e)
             raise
 
-    async def generate_structured_response(self, prompt: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    async def _stream(self, prompt: str, purpose: str, until: Optional[Callable[[], bool]] = None) -> AsyncIterator[str]:
+        # Streamed chunks don't reliably carry usage metadata, so completion tokens are estimated.
+        completion = []
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            # Closed as soon as the loop ends, so the upstream request doesn't wait for garbage collection.
+            async with aclosing(self.llm.astream(prompt)) as chunks:
+                async for chunk in chunks:
+                    content = chunk.content if hasattr(chunk, 'content') else chunk
+                    if content:
+                        completion.append(content)
+                        yield content
+                    if until is not None and until():
+                        break
+            outcome = "ok"
+        finally:
+            LLM_LATENCY.observe(time.perf_counter() - started, purpose=purpose, outcome=outcome)
+            self._record_usage(purpose, estimate_tokens(prompt), estimate_tokens("".join(completion)))
+
+    async def stream_structured_array(
+        self, prompt: str, schema: Dict[str, Any], purpose: str = "default"
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streams the elements of a JSON array response one by one, each as soon as
+        the model closes it. A cached response is replayed instead of calling the
+        model, and a completed stream is written back to the cache.
+        """
+        cache_key = make_cache_key(prompt, schema, self.model, self.temperature)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if isinstance(cached, list):
+                for element in cached:
+                    yield element
+                return
+
+        parser = JsonArrayStreamParser()
+        elements = []
+        # The stream ends itself once the array is closed, which counts as a success, and is
+        # closed right away if this generator is, so its limiter slot isn't held until collection.
+        stream = self.stream_text(structured_prompt(prompt, schema), purpose, until=lambda: parser.finished)
+        async with aclosing(stream) as chunks:
+            async for chunk in chunks:
+                for element in parser.feed(chunk):
+                    elements.append(copy.deepcopy(element))
+                    yield element
+
+        if parser.finished and elements and self.cache is not None:
+            self.cache.set(cache_key, elements)
+
+    async def generate_structured_response(
+        self, prompt: str, schema: Dict[str, Any], purpose: str = "default"
+    ) -> Dict[str, Any]:
         """
         Generates a structured JSON response using the Gemini model with a given schema.
         Note: LangChain's direct schema enforcement can be tricky. We'll use a prompt to guide the LLM to output JSON and then parse it.
+        Parsed responses are served from the response cache when one is configured,
+        and identical concurrent calls are coalesced into a single upstream request.
         """
-        full_prompt = (
-            f"{prompt}\n\n"
-            f"Please provide the response in JSON format according to the following schema:\n"
-            f"```json\n{json.dumps(schema, indent=2)}\n```\n"
-            f"Ensure your response contains ONLY the JSON object/array and no other text or explanations."
-        )
-        response_content = await self.generate_text(full_prompt)
-        json_match = re.search(r"```(?:json)?\s*(.*?)\s*```", response_content, re.DOTALL)
-        
-        if json_match:
-            json_string = json_match.group(1).strip()
+        cache_key = make_cache_key(prompt, schema, self.model, self.temperature)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        return await self._generate_coalesced(cache_key, prompt, schema, purpose)
+
+    async def _generate_coalesced(self, key: str, prompt: str, schema: Dict[str, Any], purpose: str) -> Dict[str, Any]:
+        """
+        Awaits the in-flight call for this key, starting one if there is none.
+        Callers await a shielded task, so one caller being cancelled does not
+        cancel the shared call for the others. The shared call runs under its
+        own shared_call_seconds budget, not the deadline of the caller that
+        started it. Once a call has
+        max_waiters_per_key callers attached, the next caller starts a fresh
+        shared call that later callers join instead.
+        """
+        call = self._in_flight.get(key)
+        if call is not None and call.waiters < self.max_waiters_per_key:
+            self.coalescing_stats["followers"] += 1
         else:
-            json_string = response_content.strip()
-        
-        json_string = clean_json(json_string)
-        
+            if call is not None:
+                self.coalescing_stats["overflow"] += 1
+            with no_deadline(), deadline_scope(self.shared_call_seconds):
+                task = asyncio.ensure_future(self._generate_and_cache(key, prompt, schema, purpose))
+            call = _InFlightCall(task)
+            self._in_flight[key] = call
+            task.add_done_callback(lambda t, key=key, call=call: self._finish_in_flight(key, call))
+            self.coalescing_stats["leaders"] += 1
+
+        call.waiters += 1
         try:
-            return json.loads(json_string)
-        except json.JSONDecodeError:
-            # retry cleanup once
-            json_string = clean_json(json_string)
-            return json.loads(json_string)
+            # Each caller waits under its own deadline; the shared call keeps
+            # running for the others and still fills the cache when it finishes.
+            result = await within_deadline(asyncio.shield(call.task))
+        except DeadlineExceededError:
+            self.hedging_stats["deadline_exceeded"] += 1
+            raise
+        finally:
+            call.waiters -= 1
+        # Every caller gets its own copy, since callers mutate the parsed response.
+        return copy.deepcopy(result)
+
+    def _finish_in_flight(self, key: str, call: _InFlightCall) -> None:
+        if self._in_flight.get(key) is call:
+            del self._in_flight[key]
+        # Mark the exception as retrieved in case every waiter was cancelled.
+        if not call.task.cancelled():
+            call.task.exception()
+
+    async def _generate_and_cache(self, key: str, prompt: str, schema: Dict[str, Any], purpose: str) -> Dict[str, Any]:
+        result = await self._generate_structured_uncached(prompt, schema, purpose)
+        if result and self.cache is not None:
+            self.cache.set(key, result)
+        return result
+
+    async def _generate_structured_uncached(self, prompt: str, schema: Dict[str, Any], purpose: str) -> Dict[str, Any]:
+        full_prompt = structured_prompt(prompt, schema)
+        if not self.hedge_requests:
+            return await self._attempt_structured(full_prompt, purpose)
+        return await self._generate_hedged(full_prompt, purpose)
+
+    async def _attempt_structured(self, full_prompt: str, purpose: str) -> Dict[str, Any]:
+        started = time.monotonic()
+        response_content = await self.generate_text(full_prompt, purpose)
+        with stage("json_parse"):
+            result = parse_json_response(response_content)
+        self._latencies.append(time.monotonic() - started)
+        return result
 
+    def hedge_delay(self) -> float:
+        """The recent p95 latency of structured calls, but at least hedge_min_delay_seconds."""
+        if len(self._latencies) < 20:
+            return self.hedge_min_delay_seconds
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))
+        return max(self.hedge_min_delay_seconds, ordered[index])
+
+    async def _generate_hedged(self, full_prompt: str, purpose: str) -> Dict[str, Any]:
+        """
+        Sends the call, and a duplicate if the first is still running after
+        hedge_delay(). The first valid parse wins and the other is cancelled.
+        No duplicate is sent when the deadline would pass before it could help.
+        """
+        primary = asyncio.ensure_future(self._attempt_structured(full_prompt, purpose))
+        tasks = [primary]
+        try:
+            delay = self.hedge_delay()
+            left = remaining()
+            if left is not None and left <= delay:
+                return await primary
 
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
 
+            self.hedging_stats["hedged"] += 1
+            hedge = asyncio.ensure_future(self._attempt_structured(full_prompt, purpose))
+            tasks.append(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedging_stats["hedge_wins"] += 1
+                        return task.result()
+            # Both failed: surface the primary's error.
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
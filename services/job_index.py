@@ -0,0 +1,247 @@
+import re
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+from models.pydantic_models import JobPosting
+from services.shared_state import connect_shared
+
+_YEARS_RE = re.compile(r"(\d{1,2})\s*\+?\s*(?:-\s*\d{1,2}\s*)?(?:years|yrs)", re.IGNORECASE)
+# The index tokenizer keeps '+' and '#' inside tokens, so "c++" and "c#" are words of their own;
+# queries are split with the same rule, and "node.js" is searched as the phrase "node js".
+_FTS_TOKENCHARS = "+#"
+_FTS_TOKEN_RE = re.compile(r"(?:[^\W_]|[+#])+")
+
+
+def job_id_for(title: str, company: str, location: str) -> str:
+    """Stable content-hash id, so the same posting keeps its id across searches."""
+    key = "|".join(" ".join(part.lower().split()) for part in (title, company, location))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def postings_from_serpapi(results: Dict[str, Any]) -> List[JobPosting]:
+    """Converts a SerpApi google_jobs result page into postings with stable ids."""
+    postings = []
+    for job in results.get("jobs_results", []):
+        title = job.get("title", "N/A")
+        company = job.get("company_name", "N/A")
+        location = job.get("location", "N/A")
+        postings.append(
+            JobPosting(
+                id=job_id_for(title, company, location),
+                title=title,
+                company=company,
+                location=location,
+                description=job.get("description", "N/A"),
+                apply_link=job.get("job_link", job.get("direct_apply_link", "#"))
+            )
+        )
+    return postings
+
+
+def fts_terms(skills: List[str]) -> List[str]:
+    """
+    Quoted FTS5 query terms for the skills, one per word, split the way the
+    index tokenizer splits text.
+    """
+    terms = []
+    for skill in skills:
+        for word in skill.lower().split():
+            tokens = _FTS_TOKEN_RE.findall(word)
+            if tokens:
+                terms.append('"{}"'.format(" ".join(tokens)))
+    return list(dict.fromkeys(terms))
+
+
+def min_experience_years(description: str) -> Optional[int]:
+    """The smallest 'N years' requirement mentioned in a description, if any."""
+    years = [int(match) for match in _YEARS_RE.findall(description)]
+    return min(years) if years else None
+
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        key INTEGER PRIMARY KEY,
+        id TEXT NOT NULL UNIQUE,
+        title TEXT NOT NULL,
+        company TEXT NOT NULL,
+        location TEXT NOT NULL,
+        description TEXT NOT NULL,
+        apply_link TEXT NOT NULL,
+        min_experience INTEGER,
+        ingested_at REAL NOT NULL
+    )
+    """,
+    # External content: the index reads its text from jobs and its entries are jobs.key rowids.
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5(
+        title, description, location, content='jobs', content_rowid='key',
+        tokenize="unicode61 tokenchars '{_FTS_TOKENCHARS}'"
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS fetched_queries (
+        query TEXT PRIMARY KEY,
+        fetched_at REAL NOT NULL
+    )
+    """,
+]
+_JOB_COLUMNS = "id, title, company, location, description, apply_link, min_experience, ingested_at"
+
+
+class JobIndex:
+    """
+    Local SQLite store of job postings with an FTS5 index over titles and
+    descriptions. Postings are upserted by their content-hash id, keeping the
+    time each was first ingested, and the time each search query was last
+    fetched upstream is tracked for refresh.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = connect_shared(path)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+                # Older indexes kept their own copy of the text, found by an unindexed id column,
+                # so replacing a posting scanned the whole index. They are rebuilt once.
+                migrate = bool(columns) and "key" not in columns
+                fts = self._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'jobs_fts'").fetchone()
+                # Indexes built with the default tokenizer split "c++" into "c", so they are rebuilt too.
+                retokenize = not migrate and fts is not None and "tokenchars" not in fts[0]
+                if migrate:
+                    self._conn.execute("ALTER TABLE jobs RENAME TO jobs_unkeyed")
+                if migrate or retokenize:
+                    self._conn.execute("DROP TABLE IF EXISTS jobs_fts")
+                for statement in _SCHEMA:
+                    self._conn.execute(statement)
+                if migrate:
+                    self._conn.execute(f"INSERT INTO jobs ({_JOB_COLUMNS}) SELECT {_JOB_COLUMNS} FROM jobs_unkeyed")
+                    self._conn.execute("DROP TABLE jobs_unkeyed")
+                if migrate or retokenize:
+                    self._conn.execute("INSERT INTO jobs_fts (jobs_fts) VALUES ('rebuild')")
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def ingest(self, postings: Iterable[JobPosting]) -> int:
+        """Upserts postings. Returns how many were new to the index."""
+        added = 0
+        now = time.time()
+        with self._lock:
+            # Holds the write lock from the lookup to the upsert, so another process
+            # can't insert or change a posting in between.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for job in postings:
+                    row = self._conn.execute(
+                        "SELECT key, title, description, location FROM jobs WHERE id = ?", (job.id,)
+                    ).fetchone()
+                    indexed = (job.title, job.description, job.location)
+                    if row is None:
+                        added += 1
+                    elif tuple(row[1:]) != indexed:
+                        # An external-content entry is removed by rowid, with the text it was indexed under.
+                        self._conn.execute(
+                            "INSERT INTO jobs_fts (jobs_fts, rowid, title, description, location) "
+                            "VALUES ('delete', ?, ?, ?, ?)", row
+                        )
+                    # Re-fetched postings keep their first ingested_at, so only new ones count as new.
+                    # lastrowid isn't set by the update branch, so the key comes back through RETURNING.
+                    key = self._conn.execute(
+                        f"INSERT INTO jobs ({_JOB_COLUMNS}) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(id) DO UPDATE SET title = excluded.title, company = excluded.company, "
+                        "location = excluded.location, description = excluded.description, "
+                        "apply_link = excluded.apply_link, min_experience = excluded.min_experience "
+                        "RETURNING key",
+                        (job.id, job.title, job.company, job.location, job.description, job.apply_link,
+                         min_experience_years(job.description), now),
+                    ).fetchone()[0]
+                    # Unchanged re-fetches leave the full-text index alone.
+                    if row is None or tuple(row[1:]) != indexed:
+                        self._conn.execute(
+                            "INSERT INTO jobs_fts (rowid, title, description, location) VALUES (?, ?, ?, ?)",
+                            (key,) + indexed,
+                        )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return added
+
+    def ingest_serpapi_page(self, results: Dict[str, Any]) -> int:
+        return self.ingest(postings_from_serpapi(results))
+
+    def search(
+        self,
+        skills: List[str],
+        location: Optional[str] = None,
+        experience_years: Optional[int] = None,
+        limit: int = 50,
+        ingested_after: Optional[float] = None
+    ) -> List[JobPosting]:
+        """
+        Full-text search for postings mentioning any of the skills, best match
+        first. Postings asking for more experience than the candidate has
+        (with one year of slack) are filtered out, as are, with ingested_after,
+        postings first ingested at or before that Unix time.
+        """
+        terms = fts_terms(skills)
+        if not terms:
+            return []
+        match = " OR ".join(terms)
+
+        sql = (
+            "SELECT jobs.id, jobs.title, jobs.company, jobs.location, jobs.description, jobs.apply_link "
+            "FROM jobs_fts JOIN jobs ON jobs.key = jobs_fts.rowid WHERE jobs_fts MATCH ?"
+        )
+        params: List[Any] = [match]
+        if location:
+            sql += " AND jobs.location LIKE ?"
+            params.append(f"%{location}%")
+        if experience_years is not None:
+            sql += " AND (jobs.min_experience IS NULL OR jobs.min_experience <= ?)"
+            params.append(experience_years + 1)
+        if ingested_after is not None:
+            sql += " AND jobs.ingested_at > ?"
+            params.append(ingested_after)
+        sql += " ORDER BY bm25(jobs_fts, 2.0, 1.0, 0.5) LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            JobPosting(id=row[0], title=row[1], company=row[2], location=row[3], description=row[4], apply_link=row[5])
+            for row in rows
+        ]
+
+    def query_age(self, query: str) -> Optional[float]:
+        """Seconds since the query was last fetched upstream, or None if never."""
+        with self._lock:
+            row = self._conn.execute("SELECT fetched_at FROM fetched_queries WHERE query = ?", (query,)).fetchone()
+        return None if row is None else time.time() - row[0]
+
+    def mark_query_fetched(self, query: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fetched_queries (query, fetched_at) VALUES (?, ?)", (query, time.time())
+            )
+            self._conn.commit()
+
+    def last_ingested_at(self) -> Optional[float]:
+        """When the newest posting was first ingested, or None for an empty index."""
+        with self._lock:
+            return self._conn.execute("SELECT MAX(ingested_at) FROM jobs").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
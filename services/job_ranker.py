@@ -0,0 +1,65 @@
+import re
+import math
+from collections import Counter
+from typing import Dict, List, Tuple
+from models.pydantic_models import JobPosting
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#.]*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases and splits text, keeping tokens such as 'c++', 'c#' and 'node.js' intact."""
+    return [token.rstrip(".") for token in _TOKEN_RE.findall(text.lower())]
+
+
+class JobRanker:
+    """
+    Local, CPU-only BM25 ranking of job postings against a candidate's skills.
+    Title terms are counted twice, since a skill in the title is a stronger
+    signal than one mentioned in passing in the description.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, title_weight: int = 2):
+        self.k1 = k1
+        self.b = b
+        self.title_weight = title_weight
+
+    def _document_terms(self, job: JobPosting) -> Counter:
+        terms = Counter(tokenize(job.description))
+        for token in tokenize(job.title):
+            terms[token] += self.title_weight
+        return terms
+
+    def rank(self, jobs: List[JobPosting], skills: List[str]) -> List[Tuple[JobPosting, float]]:
+        """Returns every job with its BM25 score, best match first."""
+        if not jobs:
+            return []
+        query_terms = set()
+        for skill in skills:
+            query_terms.update(tokenize(skill))
+
+        documents = [self._document_terms(job) for job in jobs]
+        lengths = [sum(terms.values()) for terms in documents]
+        average_length = (sum(lengths) / len(lengths)) or 1.0
+
+        document_frequency: Dict[str, int] = {}
+        for term in query_terms:
+            document_frequency[term] = sum(1 for terms in documents if term in terms)
+
+        total = len(documents)
+        scored = []
+        for job, terms, length in zip(jobs, documents, lengths):
+            score = 0.0
+            for term in query_terms:
+                frequency = terms.get(term, 0)
+                if not frequency:
+                    continue
+                df = document_frequency[term]
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                norm = frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                score += idf * frequency * (self.k1 + 1) / norm
+            scored.append((job, score))
+
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored
+
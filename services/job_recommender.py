@@ -1,14 +1,135 @@
-import re
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from services.gemini_service import GeminiService
-from models.pydantic_models import JobPosting
-from typing import List, Dict, Any
-from serpapi import GoogleSearch
-import json 
+from services.job_ranker import JobRanker
+from services.prompt_builder import CHARS_PER_TOKEN, compact_json, estimate_tokens, fit_to_token_budget, truncate_to_tokens
+from services.job_index import JobIndex, postings_from_serpapi
+from services.deadline import deadline_scope, no_deadline, remaining
+from models.pydantic_models import JobPosting, ResumeData, CandidateJobResult
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Tuple
+from services.observability import stage
+from services.skill_taxonomy import canonical_skills
+
+logger = logging.getLogger(__name__)
+
+def search_query_for(skills: List[str], experience_years: int) -> str:
+    return f"{' '.join(canonical_skills(skills))} developer jobs {experience_years} years experience in India"
 
 class JobRecommender:
-    def __init__(self, gemini_service: GeminiService, serpapi_api_key: str):
+    def __init__(
+        self,
+        gemini_service: GeminiService,
+        serpapi_api_key: str,
+        max_concurrent_searches: int = 4,
+        max_pending_searches: int = 32,
+        search_timeout: float = 15.0,
+        serpapi_base_url: Optional[str] = None,
+        ranking_mode: str = "llm",
+        llm_candidate_pool: int = 10,
+        description_chars: int = 400,
+        prompt_token_budget: int = 2500,
+        max_recommendations: int = 7,
+        job_index: Optional[JobIndex] = None,
+        index_refresh_seconds: float = 6 * 3600,
+        index_refresh_pages: int = 2,
+        index_candidate_pool: int = 50,
+    ):
+        if ranking_mode not in ("llm", "local"):
+            raise ValueError("ranking_mode must be 'llm' or 'local'.")
         self.gemini_service = gemini_service
         self.serpapi_api_key = serpapi_api_key
+        self.search_timeout = search_timeout
+        self.max_pending_searches = max_pending_searches
+        # Points the SerpApi client at another backend (e.g. a local stub server).
+        self.serpapi_base_url = serpapi_base_url
+
+        # The SerpApi client is blocking, so searches run on a dedicated, bounded
+        # thread pool instead of the event loop.
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_searches, thread_name_prefix="serpapi"
+        )
+        self._search_semaphore = asyncio.Semaphore(max_concurrent_searches)
+        # Postings are pre-ranked locally; in "llm" mode only the top candidates,
+        # with truncated descriptions, are sent to Gemini for the final pick.
+        self.ranker = JobRanker()
+        self.ranking_mode = ranking_mode
+        self.llm_candidate_pool = llm_candidate_pool
+        self.description_chars = description_chars
+        self.prompt_token_budget = prompt_token_budget
+        self.max_recommendations = max_recommendations
+
+        # With a job index, recommendations are served locally and searches only refresh the index.
+        self.job_index = job_index
+        self.index_refresh_seconds = index_refresh_seconds
+        self.index_refresh_pages = index_refresh_pages
+        self.index_candidate_pool = index_candidate_pool
+        self._refresh_tasks: Dict[str, asyncio.Task] = {}
+        # Called with the number of new postings after a refresh ingests any, e.g. to re-rank stored recommendations.
+        self.on_ingest: Optional[Callable[[int], None]] = None
+
+        self.search_stats = {
+            "in_flight": 0,
+            "waiting": 0,
+            "completed": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "rejected": 0,
+        }
+
+    def close(self) -> None:
+        """Releases the search worker threads."""
+        self._search_executor.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self) -> None:
+        """Loads the SerpApi client ahead of the first search."""
+        import serpapi  # noqa: F401
+
+    def _search_blocking(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Runs a single SerpApi search. Called on the search thread pool."""
+        from serpapi import GoogleSearch
+        search = GoogleSearch(params)
+        # The client passes this straight to requests, so it is in seconds.
+        search.timeout = self.search_timeout
+        if self.serpapi_base_url:
+            search.BACKEND = self.serpapi_base_url
+        return search.get_dict()
+
+    async def _run_search(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Runs a SerpApi search off the event loop, bounded by the worker pool.
+        Raises RuntimeError when too many searches are already queued.
+        """
+        stats = self.search_stats
+        if stats["waiting"] >= self.max_pending_searches:
+            stats["rejected"] += 1
+            raise RuntimeError("Too many pending job searches, try again shortly.")
+
+        stats["waiting"] += 1
+        try:
+            await self._search_semaphore.acquire()
+        finally:
+            stats["waiting"] -= 1
+
+        stats["in_flight"] += 1
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._search_executor, self._search_blocking, params)
+            left = remaining()
+            timeout = self.search_timeout if left is None else max(0.0, min(self.search_timeout, left))
+            with stage("serpapi_fetch"):
+                results = await asyncio.wait_for(future, timeout=timeout)
+            stats["completed"] += 1
+            return results
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            raise TimeoutError(f"SerpApi search timed out after {timeout:.1f}s") from None
+        except Exception:
+            stats["failed"] += 1
+            raise
+        finally:
+            stats["in_flight"] -= 1
+            self._search_semaphore.release()
 
     async def _fetch_real_job_postings(self, query: str, num_jobs: int = 10) -> List[JobPosting]:
         """
@@ -22,93 +143,255 @@ class JobRecommender:
                 "location": "India",
                 "num": num_jobs 
             }
-            search = GoogleSearch(params)
-            results = search.get_dict()
-            
-            job_postings = []
-            if "jobs_results" in results:
-                for idx, job in enumerate(results["jobs_results"]):
-                    title = job.get("title", "N/A")
-                    company = job.get("company_name", "N/A")
-                    location = job.get("location", "N/A")
-                    description = job.get("description", "N/A")
-                    apply_link = job.get("job_link", job.get("direct_apply_link", "#")) 
-
-                    # SerpApi typically doesn't provide a unique 'id' like a simple number,
-                    # so we'll generate one or use a hash of some unique fields if available.
-                    # For simplicity, using index here.
-                    job_postings.append(
-                        JobPosting(
-                            id=str(idx + 1),
-                            title=title,
-                            company=company,
-                            location=location,
-                            description=description,
-                            apply_link=apply_link 
-                        )
-                    )
-            return job_postings
+            results = await self._run_search(params)
+            return postings_from_serpapi(results)
         except Exception as e:
-            print(f"Error fetching real job postings with SerpApi: {e}")
+            logger.warning("Error fetching real job postings with SerpApi: %s", e)
             return []
 
+    async def refresh_query(self, query: str, max_pages: int = 1) -> int:
+        """
+        Fetches up to max_pages SerpApi result pages for a query into the job
+        index. Returns how many new postings were ingested.
+        """
+        if self.job_index is None:
+            return 0
+        added = 0
+        params = {
+            "engine": "google_jobs",
+            "q": query,
+            "api_key": self.serpapi_api_key,
+            "location": "India"
+        }
+        try:
+            for _ in range(max_pages):
+                results = await self._run_search(params)
+                # Index writes are synchronous SQLite and may wait on another worker's ingest.
+                added += await asyncio.to_thread(self.job_index.ingest_serpapi_page, results)
+                next_page_token = results.get("serpapi_pagination", {}).get("next_page_token")
+                if not next_page_token:
+                    break
+                params = {**params, "next_page_token": next_page_token}
+            await asyncio.to_thread(self.job_index.mark_query_fetched, query)
+        except Exception as e:
+            logger.warning("Error refreshing job index for '%s': %s", query, e)
+        if added and self.on_ingest is not None:
+            self.on_ingest(added)
+        return added
+
+    def _schedule_refresh(self, query: str) -> None:
+        """Refreshes a query in the background, at most once at a time per query."""
+        if query in self._refresh_tasks:
+            return
+        # The refresh outlives the request, so it must not inherit the request's deadline.
+        with no_deadline():
+            task = asyncio.create_task(self.refresh_query(query, self.index_refresh_pages))
+        self._refresh_tasks[query] = task
+        task.add_done_callback(lambda t, query=query: self._refresh_tasks.pop(query, None))
+
     async def recommend_jobs(
         self, skills: List[str], experience_years: int, education: str
     ) -> List[JobPosting]:
         """
         Recommends suitable job postings based on the candidate's profile.
-        Now fetches jobs from SerpApi and then performs semantic matching.
+        Fetches jobs from SerpApi, ranks them locally against the skills and,
+        in "llm" mode, lets Gemini pick the best of the top candidates.
         """
-        search_query = f"{' '.join(skills)} developer jobs {experience_years} years experience in India"
+        jobs, _ = await self.recommend_jobs_with_status(skills, experience_years, education)
+        return jobs
 
-        fetched_jobs = await self._fetch_real_job_postings(search_query, num_jobs=20)
+    async def recommend_jobs_with_status(
+        self, skills: List[str], experience_years: int, education: str, ranking_mode: Optional[str] = None
+    ) -> Tuple[List[JobPosting], bool]:
+        """
+        Like recommend_jobs, but also reports whether the ranking fell back to
+        the local one because Gemini failed. ranking_mode overrides the
+        configured mode for this call.
+        """
+        skills = canonical_skills(skills)
+        candidates = await self.candidates_for(skills, experience_years)
+        if not candidates:
+            return [], False
+
+        return await self.rank_jobs_with_status(candidates, skills, experience_years, education, ranking_mode)
+
+    async def candidates_for(self, skills: List[str], experience_years: int) -> List[JobPosting]:
+        """The postings to rank for a profile: searched upstream, or served from the job index."""
+        skills = canonical_skills(skills)
+        return await self._candidates_for(search_query_for(skills, experience_years), skills, experience_years)
 
-        if not fetched_jobs:
+    async def indexed_candidates(self, skills: List[str], experience_years: int) -> List[JobPosting]:
+        """The postings the job index already holds for a profile, without fetching; empty without an index."""
+        if self.job_index is None:
             return []
+        return await asyncio.to_thread(
+            self.job_index.search, canonical_skills(skills),
+            experience_years=experience_years, limit=self.index_candidate_pool
+        )
+
+    async def _candidates_for(self, query: str, skills: List[str], experience_years: int) -> List[JobPosting]:
+        if self.job_index is None:
+            return await self._fetch_real_job_postings(query, num_jobs=20)
+        return await self._candidates_from_index(query, skills, experience_years)
 
-        jobs_json_str = json.dumps([job.dict() for job in fetched_jobs]) # Convert Pydantic models to dicts for JSON
+    async def recommend_jobs_batch(
+        self,
+        profiles: List[ResumeData],
+        max_concurrent_profiles: int = 8,
+        deadline_seconds: Optional[float] = None
+    ) -> AsyncIterator[CandidateJobResult]:
+        """
+        Recommends jobs for many candidates, yielding one result per candidate
+        as soon as it is ready. Candidates with the same skills, experience and
+        education share one ranking call, and each distinct search query is
+        fetched once for the whole batch. Each shared profile gets its own
+        deadline_seconds budget.
+        """
+        groups: Dict[Tuple[Tuple[str, ...], int, str], List[int]] = {}
+        for index, profile in enumerate(profiles):
+            key = (
+                tuple(canonical_skills(profile.skills)),
+                profile.experience_years,
+                " ".join(profile.education.lower().split())
+            )
+            groups.setdefault(key, []).append(index)
 
-        prompt = (
+        semaphore = asyncio.Semaphore(max_concurrent_profiles)
+        searches: Dict[str, asyncio.Task] = {}
+
+        async def recommend_group(key, indices: List[int]) -> List[CandidateJobResult]:
+            skills, experience_years, _ = key
+            profile = profiles[indices[0]]
+            query = search_query_for(list(skills), experience_years)
+            try:
+                async with semaphore:
+                    with deadline_scope(deadline_seconds):
+                        if query not in searches:
+                            searches[query] = asyncio.ensure_future(
+                                self._candidates_for(query, list(skills), experience_years)
+                            )
+                        # Shielded, so one profile timing out doesn't cancel the search for the others.
+                        candidates = await asyncio.shield(searches[query])
+                        jobs = await self.rank_jobs(candidates, list(skills), experience_years, profile.education) if candidates else []
+            except Exception as e:
+                return [CandidateJobResult(index=i, error=f"Error recommending jobs: {str(e)}") for i in indices]
+            return [CandidateJobResult(index=i, jobs=[job.model_copy() for job in jobs]) for i in indices]
+
+        tasks = [asyncio.ensure_future(recommend_group(key, indices)) for key, indices in groups.items()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for result in await next_done:
+                    yield result
+        finally:
+            for task in list(tasks) + list(searches.values()):
+                task.cancel()
+
+    async def _candidates_from_index(self, query: str, skills: List[str], experience_years: int) -> List[JobPosting]:
+        """
+        Serves candidates from the local job index. A query that was never
+        fetched is fetched inline once; a stale one is refreshed in the background.
+        """
+        age = await asyncio.to_thread(self.job_index.query_age, query)
+        if age is None:
+            await self.refresh_query(query, self.index_refresh_pages)
+        elif age > self.index_refresh_seconds:
+            self._schedule_refresh(query)
+        return await asyncio.to_thread(
+            self.job_index.search, skills, experience_years=experience_years, limit=self.index_candidate_pool
+        )
+
+    def _build_ranking_prompt(
+        self, candidates: List[JobPosting], skills: List[str], experience_years: int, education: str
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Builds the job selection prompt and the JSON schema of the expected response."""
+
+        # Static instructions first, so every ranking prompt shares the same prefix.
+        instructions = (
             f"As an expert career advisor and job matching specialist, your task is to review a list of job postings "
-            f"and select the top 5-7 most relevant ones for a candidate. "
-            f"The candidate's profile is as follows:\n"
-            f"Skills: {', '.join(skills)}\n"
-            f"Years of Experience: {experience_years}\n"
-            f"Education: {education}\n\n"
-            f"Here is the list of available job postings in JSON format. Each job includes 'id', 'title', 'company', 'location', 'description', and 'apply_link':\n"
-            f"```json\n{jobs_json_str}\n```\n\n"
-            f"Please carefully analyze each job description in relation to the candidate's skills, experience, and education. "
+            f"and select the top 5-7 most relevant ones for a candidate.\n"
+            f"Each job includes 'id', 'title', 'company', 'location' and a shortened 'description'. "
+            f"Carefully analyze each job description in relation to the candidate's skills, experience, and education. "
             f"Prioritize jobs where the core requirements strongly align with the candidate's profile. "
-            f"Return only the selected job postings in a JSON array format, identical to the input `JobPosting` schema. "
-            f"Do not include any additional text or explanations, just the JSON array of selected job postings.\n"
+            f"Return only the ids of the selected job postings as a JSON array of strings, most relevant first. "
+            f"Do not include any additional text or explanations, just the JSON array of ids.\n"
             f"If no jobs are highly relevant, return an empty JSON array.\n"
             f"Example of desired output structure:\n"
-            f"[\n"
-            f"  {{\"id\": \"1\", \"title\": \"Software Engineer\", \"company\": \"Tech Corp\", \"location\": \"Bengaluru\", \"description\": \"Develop scalable software...\", \"apply_link\": \"http://example.com/apply/1\"}}\n"
-            f"]"
+            f"[\"3\", \"1\", \"7\"]\n\n"
+        )
+        profile = (
+            f"The candidate's profile is as follows:\n"
+            f"Skills: {', '.join(skills)}\n"
+            f"Years of Experience: {experience_years}\n"
+            f"Education: {truncate_to_tokens(education, 200)}\n\n"
         )
-        
+
+        # Descriptions share whatever is left of the prompt budget; each is also capped at description_chars.
+        description_budget = self.prompt_token_budget - estimate_tokens(instructions + profile) - 40 * len(candidates)
+        descriptions = fit_to_token_budget(
+            [job.description for job in candidates],
+            description_budget,
+            max(1, self.description_chars // CHARS_PER_TOKEN)
+        )
+        candidates_json_str = compact_json(
+            [
+                {
+                    "id": job.id,
+                    "title": job.title,
+                    "company": job.company,
+                    "location": job.location,
+                    "description": description
+                }
+                for job, description in zip(candidates, descriptions)
+            ]
+        )
+
+        prompt = instructions + profile + f"Job postings:\n```json\n{candidates_json_str}\n```\n"
+
         schema = {
             "type": "array",
-            "items": {
-                "type": "object",
-                "properties": {
-                    "id": {"type": "string"},
-                    "title": {"type": "string"},
-                    "company": {"type": "string"},
-                    "location": {"type": "string"},
-                    "description": {"type": "string"},
-                    "apply_link": {"type": "string"}
-                },
-                "required": ["id", "title", "company", "location", "description", "apply_link"]
-            }
+            "items": {"type": "string"}
         }
+        return prompt, schema
+
+    async def rank_jobs(
+        self, jobs: List[JobPosting], skills: List[str], experience_years: int, education: str
+    ) -> List[JobPosting]:
+        """
+        Ranks a candidate pool of postings for a profile. The local ranking is
+        returned as is in "local" mode, and used as the fallback if Gemini fails.
+        """
+        ranked_jobs, _ = await self.rank_jobs_with_status(jobs, skills, experience_years, education)
+        return ranked_jobs
+
+    async def rank_jobs_with_status(
+        self, jobs: List[JobPosting], skills: List[str], experience_years: int, education: str,
+        ranking_mode: Optional[str] = None
+    ) -> Tuple[List[JobPosting], bool]:
+        """
+        Like rank_jobs, but also reports whether Gemini failed (an error, an
+        open circuit or a passed deadline) and the local ranking was returned instead.
+        """
+        with stage("local_rank"):
+            ranked = self.ranker.rank(jobs, skills)
+        local_picks = [job for job, score in ranked[:self.max_recommendations] if score > 0]
+        if (ranking_mode or self.ranking_mode) == "local":
+            return local_picks, False
+
+        candidates = [job for job, _ in ranked[:self.llm_candidate_pool]]
+        with stage("prompt_build"):
+            prompt, schema = self._build_ranking_prompt(candidates, skills, experience_years, education)
 
         try:
-            filtered_jobs_raw = await self.gemini_service.generate_structured_response(prompt, schema)
-            
-            recommended_jobs = [JobPosting(**job_data) for job_data in filtered_jobs_raw]
-            return recommended_jobs
+            selected_ids = await self.gemini_service.generate_structured_response(prompt, schema, purpose="rank_jobs")
+            if not isinstance(selected_ids, list):
+                raise ValueError(f"Expected a JSON array of ids, got: {selected_ids}")
+            jobs_by_id = {job.id: job for job in candidates}
+            selected = []
+            for job_id in selected_ids:
+                job = jobs_by_id.pop(str(job_id), None)
+                if job is not None:
+                    selected.append(job)
+            return selected, False
         except Exception as e:
-            print(f"Error semantically filtering job postings with Gemini: {e}")
-            return []
+            logger.warning("Error semantically filtering job postings with Gemini, using local ranking: %s", e)
+            return local_picks, True
@@ -0,0 +1,210 @@
+import json
+import logging
+from typing import Any, List, Type, TypeVar
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+class JsonArrayStreamParser:
+    """
+    Incrementally parses a JSON array arriving in chunks (e.g. LLM tokens) and
+    returns each top-level element as soon as it is complete. Text before the
+    opening bracket, such as a markdown fence, is skipped.
+    """
+
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Consumes a chunk and returns the elements completed by it."""
+        completed = []
+        for char in chunk:
+            if self._finished:
+                break
+            if not self._started:
+                if char == "[":
+                    self._started = True
+                continue
+
+            if self._in_string:
+                self._buffer.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if self._depth == 0:
+                # Between elements: only objects/arrays are emitted; commas and whitespace are skipped.
+                if char == "]":
+                    self._finished = True
+                elif char in "{[":
+                    self._depth = 1
+                    self._buffer = [char]
+                continue
+
+            self._buffer.append(char)
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    element = self._decode("".join(self._buffer))
+                    self._buffer = []
+                    if element is not None:
+                        completed.append(element)
+        return completed
+
+    @staticmethod
+    def _decode(text: str) -> Any:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            try:
+                return parse_json_response(text)
+            except JSONRepairError:
+                return None
+
+
+class JSONRepairError(ValueError):
+    """Raised when no JSON value can be recovered from a model response."""
+
+
+_STRING_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def repair_json(text: str) -> str:
+    """
+    Extracts and repairs the outermost JSON object or array in a model response
+    in a single pass. Handles surrounding prose and markdown fences, trailing
+    commas, raw control characters inside strings, mismatched closers and
+    truncated output (the incomplete tail is dropped and brackets are closed).
+    """
+    start = -1
+    for index, char in enumerate(text):
+        if char in "{[":
+            start = index
+            break
+    if start == -1:
+        raise JSONRepairError("No JSON object or array found in response.")
+
+    out: List[str] = []
+    stack: List[str] = []
+    # (output length, open brackets) at points where the document can be cut and closed.
+    safe_points: List[tuple] = []
+    in_string = False
+    escaped = False
+
+    for char in text[start:]:
+        if in_string:
+            if escaped:
+                escaped = False
+                out.append(char)
+            elif char == "\\":
+                escaped = True
+                out.append(char)
+            elif char == '"':
+                in_string = False
+                out.append(char)
+            else:
+                out.append(_STRING_ESCAPES.get(char, char))
+            continue
+
+        if char == '"':
+            in_string = True
+            out.append(char)
+        elif char in "{[":
+            stack.append(char)
+            out.append(char)
+        elif char in "}]":
+            _strip_trailing_comma(out)
+            out.append(_CLOSERS[stack.pop()])
+            if not stack:
+                break
+            safe_points.append((len(out), tuple(stack)))
+        elif char == ",":
+            _strip_trailing_comma(out)
+            safe_points.append((len(out), tuple(stack)))
+            out.append(char)
+        elif char == "`":
+            continue
+        else:
+            out.append(char)
+    else:
+        return _close_truncated(out, stack, safe_points, in_string)
+
+    return "".join(out)
+
+
+def _strip_trailing_comma(out: List[str]) -> None:
+    index = len(out) - 1
+    while index >= 0 and out[index].isspace():
+        index -= 1
+    if index >= 0 and out[index] == ",":
+        del out[index:]
+
+
+def _close_truncated(out: List[str], stack: List[str], safe_points: List[tuple], in_string: bool) -> str:
+    """Closes a truncated document, backing off to earlier cut points until it parses."""
+    # A value cut off mid-string is unreliable, so only complete tails are closed in place.
+    if not in_string:
+        candidate = "".join(out) + "".join(_CLOSERS[b] for b in reversed(stack))
+        try:
+            json.loads(candidate)
+            return candidate
+        except json.JSONDecodeError:
+            pass
+
+    for length, open_brackets in reversed(safe_points):
+        prefix = out[:length]
+        _strip_trailing_comma(prefix)
+        candidate = "".join(prefix) + "".join(_CLOSERS[b] for b in reversed(open_brackets))
+        try:
+            json.loads(candidate)
+            return candidate
+        except json.JSONDecodeError:
+            continue
+    raise JSONRepairError("Response JSON is truncated beyond repair.")
+
+
+def parse_json_response(text: str) -> Any:
+    """Parses a model response as JSON, repairing it locally if needed."""
+    try:
+        return json.loads(repair_json(text))
+    except json.JSONDecodeError as e:
+        raise JSONRepairError(f"Response JSON could not be repaired: {e}") from e
+
+
+def validate_items(raw_items: Any, model: Type[ModelT]) -> List[ModelT]:
+    """
+    Validates a parsed JSON array into Pydantic models, dropping invalid
+    elements instead of failing the whole response.
+    """
+    if isinstance(raw_items, dict):
+        raw_items = [raw_items]
+    if not isinstance(raw_items, list):
+        return []
+    items = []
+    for raw_item in raw_items:
+        try:
+            items.append(model.model_validate(raw_item))
+        except ValidationError as e:
+            logger.warning("Dropping invalid %s from model response: %d error(s)", model.__name__, e.error_count())
+    return items
@@ -0,0 +1,200 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from services.shared_state import connect_shared
+
+def make_cache_key(prompt: str, schema: Dict[str, Any], model: str, temperature: float) -> str:
+    """
+    Builds a content-addressed key from the exact prompt, the schema and the
+    model parameters that affect the response. Prompts are not normalized:
+    they embed submitted code, where whitespace changes what the program does.
+    """
+    payload = json.dumps(
+        {
+            "prompt": prompt,
+            "schema": schema,
+            "model": model,
+            "temperature": temperature,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class MemoryCacheBackend:
+    """In-memory LRU tier bounded by the total size of the stored values."""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, stats: CacheStats) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                stats.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                self._remove(key)
+        return len(expired)
+
+    def set(self, key: str, value: str, expires_at: float, stats: CacheStats) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                stats.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self.current_bytes -= len(value.encode("utf-8"))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    On-disk tier that survives restarts. Expired rows are dropped when read,
+    and by purge_expired, which the owner should call periodically.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = connect_shared(path)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str, stats: CacheStats) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= time.time():
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                stats.expirations += 1
+                return None
+            return row[0], row[1]
+
+    def set(self, key: str, value: str, expires_at: float, stats: CacheStats) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache for parsed LLM responses: an in-memory LRU in front of an
+    optional on-disk backend. Values are stored serialized, so callers always
+    get a fresh copy they are free to mutate.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 3600,
+        memory_backend: Optional[MemoryCacheBackend] = None,
+        disk_backend: Optional[SQLiteCacheBackend] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.memory = memory_backend if memory_backend is not None else MemoryCacheBackend()
+        self.disk = disk_backend
+        self.stats = CacheStats()
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key, self.stats)
+        if value is None and self.disk is not None:
+            row = self.disk.get(key, self.stats)
+            if row is not None:
+                value, expires_at = row
+                # Promote to the memory tier, keeping the original expiry.
+                self.memory.set(key, value, expires_at, self.stats)
+        if value is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        serialized = json.dumps(value, separators=(",", ":"))
+        expires_at = time.time() + self.ttl_seconds
+        self.memory.set(key, serialized, expires_at, self.stats)
+        if self.disk is not None:
+            self.disk.set(key, serialized, expires_at, self.stats)
+
+    def purge_expired(self) -> Dict[str, int]:
+        """Drops expired entries from both tiers, including ones nobody reads again. Returns how many per tier."""
+        purged = {"memory": self.memory.purge_expired()}
+        if self.disk is not None:
+            purged["disk"] = self.disk.purge_expired()
+        return purged
+
+    def stats_snapshot(self) -> Dict[str, int]:
+        snapshot = self.stats.as_dict()
+        snapshot["memory_entries"] = len(self.memory)
+        snapshot["memory_bytes"] = self.memory.current_bytes
+        return snapshot
+
+    def close(self) -> None:
+        if self.disk is not None:
+            self.disk.close()
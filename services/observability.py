@@ -0,0 +1,240 @@
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Per label set: (per-bucket counts, sum, count)
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts, totals = self._values.setdefault(key, ([0] * len(self.buckets), [0.0, 0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            totals[0] += value
+            totals[1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, totals) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(totals[0])}")
+                lines.append(f"{self.name}_count{labels} {_format_value(totals[1])}")
+        return lines
+
+
+class GaugeCallback:
+    """Gauge whose values are read from a callback at scrape time, e.g. a service's stats dict."""
+
+    def __init__(
+        self, name: str, documentation: str, labelname: str, read: Callable[[], Dict[str, float]]
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelname = labelname
+        self.read = read
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.read()
+        except Exception:
+            logger.exception("Reading gauge %s failed", self.name)
+            return lines
+        for label, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels((self.labelname,), (label,))} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(
+        self, name: str, documentation: str, labelname: str, read: Callable[[], Dict[str, float]]
+    ) -> GaugeCallback:
+        return self._register(GaugeCallback(name, documentation, labelname, read))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by route and status.", ("method", "route", "status")
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time until the response headers were sent.", ("method", "route")
+)
+STAGE_LATENCY = REGISTRY.histogram(
+    "stage_duration_seconds",
+    "Time spent in each processing stage (prompt_build, llm_call, json_parse, validation, serpapi_fetch, ...).",
+    ("stage",)
+)
+STAGE_ERRORS = REGISTRY.counter("stage_errors_total", "Processing stages that raised.", ("stage",))
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Gemini tokens by purpose and kind.", ("purpose", "kind"))
+LLM_LATENCY = REGISTRY.histogram(
+    "llm_call_duration_seconds", "Gemini call latency by purpose and outcome.", ("purpose", "outcome")
+)
+
+# Spans of the current request, when tracing is on for it.
+_spans: contextvars.ContextVar[Optional[List[Dict[str, float]]]] = contextvars.ContextVar("spans", default=None)
+
+
+@contextmanager
+def trace_request() -> Iterator[List[Dict[str, float]]]:
+    """Collects the spans of stages run inside the block (including tasks it starts)."""
+    spans: List[Dict[str, float]] = []
+    token = _spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _spans.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times a processing stage into stage_duration_seconds and the current trace, if any."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_LATENCY.observe(elapsed, stage=name)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append({"stage": name, "duration_ms": round(elapsed * 1000, 2)})
+
+
+def server_timing(spans: List[Dict[str, float]]) -> str:
+    """Formats spans as a Server-Timing header, totalling repeated stages."""
+    totals: Dict[str, float] = {}
+    for span in spans:
+        totals[span["stage"]] = totals.get(span["stage"], 0.0) + span["duration_ms"]
+    return ", ".join(f"{name};dur={duration:.1f}" for name, duration in totals.items())
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, including any `extra` fields passed to the log call."""
+
+    _RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = "INFO", json_format: bool = False) -> None:
+    handler = logging.StreamHandler()
+    if json_format:
+        handler.setFormatter(JsonLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
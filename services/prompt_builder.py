@@ -0,0 +1,76 @@
+import json
+from typing import Any, Dict, List
+
+# Gemini averages about four characters of English text per token.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Local token estimate, good enough for budgeting without a tokenizer round trip."""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def compact_json(value: Any) -> str:
+    """JSON without indentation or spaces after separators."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to roughly max_tokens on a word boundary, marking the cut with '...'."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(" ", 1)[0]
+    return cut + "..."
+
+
+def fit_to_token_budget(texts: List[str], token_budget: int, max_tokens_each: int) -> List[str]:
+    """
+    Truncates texts so that together they fit token_budget, giving each an
+    equal share (capped at max_tokens_each). Short texts are left whole and
+    their unused share is handed to the longer ones.
+    """
+    if not texts:
+        return []
+    allowance = {}
+    remaining_budget = max(0, token_budget)
+    # Hand out shares smallest first, so short texts don't waste budget.
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for position, index in enumerate(order):
+        share = min(max_tokens_each, remaining_budget // (len(order) - position))
+        tokens = min(share, estimate_tokens(texts[index]))
+        allowance[index] = max(1, share)
+        remaining_budget -= tokens
+    return [truncate_to_tokens(text, allowance[i]) for i, text in enumerate(texts)]
+
+
+def structured_prompt(prompt: str, schema: Dict[str, Any]) -> str:
+    """
+    Wraps a prompt with the JSON output instructions. The instructions and the
+    compact schema come first: they are identical for every call of the same
+    kind, so the prompt starts with a stable prefix the model can cache, and
+    callers should likewise put their static instructions before the
+    per-request details.
+    """
+    return (
+        f"Respond in JSON according to the following schema:\n"
+        f"```json\n{compact_json(schema)}\n```\n"
+        f"Ensure your response contains ONLY the JSON object/array and no other text or explanations.\n\n"
+        f"{prompt}"
+    )
+
+
+class TokenUsage:
+    """Per-purpose counts of calls and prompt/completion tokens."""
+
+    def __init__(self):
+        self.by_purpose: Dict[str, Dict[str, int]] = {}
+
+    def record(self, purpose: str, prompt_tokens: int, completion_tokens: int) -> None:
+        usage = self.by_purpose.setdefault(purpose, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        usage["calls"] += 1
+        usage["prompt_tokens"] += prompt_tokens
+        usage["completion_tokens"] += completion_tokens
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {purpose: dict(usage) for purpose, usage in self.by_purpose.items()}
@@ -0,0 +1,283 @@
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+from models.pydantic_models import TestQuestion
+from services.shared_state import Lease, connect_shared
+from services.skill_taxonomy import is_known_skill
+
+if TYPE_CHECKING:
+    from services.test_generator import TestGenerator
+
+logger = logging.getLogger(__name__)
+
+BucketKey = Tuple[str, str, str]  # (skill, difficulty, question_type)
+
+
+def normalize_skill(skill: str) -> str:
+    return " ".join(skill.lower().split())
+
+
+def question_hash(question: TestQuestion) -> str:
+    """Identifies a question by its normalized text, so rephrased whitespace or case dedupes."""
+    normalized = " ".join(question.question.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def is_valid_question(question: TestQuestion, question_type: str) -> bool:
+    """Only well-formed questions are banked, since they are served without review."""
+    if not question.question.strip():
+        return False
+    if question_type == "mcq":
+        return (
+            question.options is not None
+            and len(question.options) == 4
+            and (question.correct_answer or "").strip().upper() in ("A", "B", "C", "D")
+        )
+    return True
+
+
+class QuestionBank:
+    """
+    Persistent store of validated questions indexed by (skill, difficulty, question_type).
+    Questions are kept in SQLite and mirrored in memory, so sampling never touches disk.
+    Worker processes sharing the database pick up each other's questions and
+    demand on sync(), which a miss triggers at most every sync_interval_seconds.
+    Only skills in the taxonomy count as demand, up to max_demanded_buckets,
+    so arbitrary skill strings can't grow the set of buckets kept topped up.
+    """
+
+    def __init__(self, path: str, sync_interval_seconds: float = 5.0, max_demanded_buckets: int = 500):
+        self.path = path
+        self.sync_interval_seconds = sync_interval_seconds
+        self.max_demanded_buckets = max_demanded_buckets
+        self._conn = connect_shared(path)
+        self._lock = threading.Lock()
+        self._buckets: Dict[BucketKey, List[TestQuestion]] = {}
+        self._hashes: Set[str] = set()
+        # Buckets that requests asked for; these are the ones the replenisher keeps topped up.
+        self.demanded: Set[BucketKey] = set()
+        self.stats = {"hits": 0, "misses": 0, "added": 0, "duplicates": 0, "invalid": 0}
+        self._last_rowid = 0
+        self._synced_at = 0.0
+
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                "hash TEXT PRIMARY KEY, skill TEXT NOT NULL, difficulty TEXT NOT NULL, "
+                "question_type TEXT NOT NULL, payload TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS demand ("
+                "skill TEXT NOT NULL, difficulty TEXT NOT NULL, question_type TEXT NOT NULL, "
+                "PRIMARY KEY (skill, difficulty, question_type))"
+            )
+            self._conn.commit()
+        self.sync()
+        self._add_demand(list(self._buckets))
+
+    def _add_demand(self, keys: List[BucketKey]) -> List[BucketKey]:
+        """Adds the known-skill buckets among keys to the demand, within the cap. Returns the ones added."""
+        added = []
+        for key in keys:
+            if len(self.demanded) >= self.max_demanded_buckets:
+                break
+            if key not in self.demanded and is_known_skill(key[0]):
+                self.demanded.add(key)
+                added.append(key)
+        return added
+
+    def sync(self) -> int:
+        """
+        Loads the questions and demand recorded since the last sync, including
+        by other processes sharing the database. Returns how many questions were new.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT rowid, hash, skill, difficulty, question_type, payload FROM questions "
+                "WHERE rowid > ? ORDER BY rowid", (self._last_rowid,)
+            ).fetchall()
+            demand = self._conn.execute("SELECT skill, difficulty, question_type FROM demand").fetchall()
+        loaded = 0
+        for rowid, digest, skill, difficulty, question_type, payload in rows:
+            self._last_rowid = rowid
+            if digest in self._hashes:
+                continue
+            self._hashes.add(digest)
+            self._buckets.setdefault((skill, difficulty, question_type), []).append(
+                TestQuestion(**json.loads(payload))
+            )
+            loaded += 1
+        self._add_demand([tuple(key) for key in demand])
+        self._synced_at = time.monotonic()
+        return loaded
+
+    def size(self, skill: str, difficulty: str, question_type: str) -> int:
+        return len(self._buckets.get((normalize_skill(skill), difficulty, question_type), []))
+
+    def recent_question_texts(self, skill: str, difficulty: str, question_type: str, limit: int = 20) -> List[str]:
+        bucket = self._buckets.get((normalize_skill(skill), difficulty, question_type), [])
+        return [question.question for question in bucket[-limit:]]
+
+    def add(self, skill: str, difficulty: str, question_type: str, questions: List[TestQuestion]) -> int:
+        """Adds validated, previously unseen questions to a bucket. Returns how many were added."""
+        key = (normalize_skill(skill), difficulty, question_type)
+        rows = []
+        for question in questions:
+            if not is_valid_question(question, question_type):
+                self.stats["invalid"] += 1
+                continue
+            digest = question_hash(question)
+            if digest in self._hashes:
+                self.stats["duplicates"] += 1
+                continue
+            self._hashes.add(digest)
+            self._buckets.setdefault(key, []).append(question)
+            rows.append((digest, key[0], difficulty, question_type, question.model_dump_json(), time.time()))
+
+        if rows:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO questions "
+                    "(hash, skill, difficulty, question_type, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.commit()
+            self.stats["added"] += len(rows)
+        return len(rows)
+
+    def sample(
+        self, skills: List[str], difficulty: str, question_type: str, num_questions: int,
+        min_questions: Optional[int] = None
+    ) -> Optional[List[TestQuestion]]:
+        """
+        Draws num_questions distinct questions spread round-robin across the skills.
+        Returns None (and records demand) when the bank has fewer than min_questions
+        (by default num_questions) for the request, or when some skill can't
+        supply its round-robin share of them, so a multi-skill test never
+        silently covers only some of its skills.
+        """
+        keys = [(normalize_skill(skill), difficulty, question_type) for skill in skills]
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return None
+        new_demand = self._add_demand(keys)
+        if new_demand:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO demand (skill, difficulty, question_type) VALUES (?, ?, ?)", new_demand
+                )
+                self._conn.commit()
+
+        required = max(num_questions if min_questions is None else min_questions, 1)
+        # Each skill must cover its share of the required questions; the first skills take the remainder.
+        shares = [required // len(keys) + (1 if i < required % len(keys) else 0) for i in range(len(keys))]
+
+        def covered() -> bool:
+            return all(len(self._buckets.get(key, [])) >= share for key, share in zip(keys, shares))
+
+        if not covered() and time.monotonic() - self._synced_at >= self.sync_interval_seconds:
+            # Another worker may have banked questions for these buckets.
+            self.sync()
+        if not covered():
+            self.stats["misses"] += 1
+            return None
+
+        pools = [list(self._buckets.get(key, [])) for key in keys]
+        for pool in pools:
+            random.shuffle(pool)
+
+        picked: List[TestQuestion] = []
+        while len(picked) < num_questions and any(pools):
+            for pool in pools:
+                if pool and len(picked) < num_questions:
+                    picked.append(pool.pop())
+
+        self.stats["hits"] += 1
+        random.shuffle(picked)
+        return [question.model_copy(deep=True) for question in picked]
+
+    def low_buckets(self, low_water_mark: int) -> List[BucketKey]:
+        """Demanded buckets below the low-water mark, emptiest first."""
+        low = [key for key in self.demanded if len(self._buckets.get(key, [])) < low_water_mark]
+        return sorted(low, key=lambda key: len(self._buckets.get(key, [])))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class QuestionBankReplenisher:
+    """
+    Background task that refills demanded buckets below the low-water mark in
+    batches, emptiest first and at most max_batches_per_cycle generation calls
+    per interval, which bounds its Gemini spend. With a lease, only the worker process holding it refills, so
+    several workers don't generate the same questions.
+    """
+
+    def __init__(
+        self,
+        bank: QuestionBank,
+        test_generator: "TestGenerator",
+        low_water_mark: int = 20,
+        batch_size: int = 10,
+        interval_seconds: float = 30.0,
+        max_batches_per_cycle: int = 5,
+        lease: Optional[Lease] = None,
+    ):
+        self.bank = bank
+        self.test_generator = test_generator
+        self.low_water_mark = low_water_mark
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self.max_batches_per_cycle = max_batches_per_cycle
+        self.lease = lease
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.lease is not None:
+            self.lease.release()
+            self.lease.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.replenish_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Question bank replenishment failed: %s", e)
+            await asyncio.sleep(self.interval_seconds)
+
+    async def replenish_once(self) -> int:
+        """Refills up to max_batches_per_cycle low buckets once. Returns the number of questions added."""
+        if self.lease is not None:
+            if not self.lease.acquire():
+                return 0
+            self.bank.sync()
+        added = 0
+        for skill, difficulty, question_type in self.bank.low_buckets(self.low_water_mark)[:self.max_batches_per_cycle]:
+            if self.lease is not None and not self.lease.acquire():
+                break
+            # Listing existing questions keeps batches fresh and the prompt out of the response cache.
+            questions = await self.test_generator.generate_questions_from_llm(
+                [skill], difficulty, self.batch_size, question_type,
+                avoid_questions=self.bank.recent_question_texts(skill, difficulty, question_type)
+            )
+            added += self.bank.add(skill, difficulty, question_type, questions)
+        return added
@@ -0,0 +1,235 @@
+import time
+import random
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+from services.deadline import remaining
+from services.prompt_builder import estimate_tokens
+
+T = TypeVar("T")
+
+_THROTTLE_MARKERS = ("429", "resource exhausted", "resourceexhausted", "rate limit", "quota", "too many requests")
+_TRANSIENT_MARKERS = ("500", "502", "503", "504", "unavailable", "deadline exceeded", "timed out", "timeout")
+
+
+def is_throttle_error(error: BaseException) -> bool:
+    """Whether the upstream rejected the call for rate or quota reasons."""
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in _THROTTLE_MARKERS)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether retrying the call later may succeed."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)) or is_throttle_error(error):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in _TRANSIENT_MARKERS)
+
+
+def backoff_delay(attempt: int, base_seconds: float = 0.5, max_seconds: float = 20.0) -> float:
+    """Exponential backoff with full jitter, so retrying callers spread out instead of retrying in lockstep."""
+    return random.uniform(0, min(max_seconds, base_seconds * (2 ** attempt)))
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class TokenBucket:
+    """
+    Refills at per_minute units per minute up to capacity (one minute's worth
+    by default). acquire waits until the requested units are available;
+    waiters are served in arrival order.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        # A request larger than the bucket could never be served, so it waits for a full bucket instead.
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= amount
+
+    async def drain(self) -> None:
+        """Empties the bucket, e.g. after the upstream says the budget is already spent."""
+        self._refill()
+        self._tokens = 0.0
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit: each call that succeeds within the latency target
+    raises the limit by 1/limit (about +1 per round of calls), while a
+    throttled or slow call halves it. The limit stays within [min_limit, max_limit].
+    """
+
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 32, latency_target_seconds: float = 20.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target_seconds = latency_target_seconds
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency_seconds: float, throttled: bool = False) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            if throttled or latency_seconds > self.latency_target_seconds:
+                self.limit = max(float(self.min_limit), self.limit / 2)
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures, so callers fail fast
+    instead of queueing behind a struggling upstream. After reset_timeout_seconds
+    one trial call is let through: success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> None:
+        """Raises CircuitOpenError when the call should not be attempted."""
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.reset_timeout_seconds:
+                raise CircuitOpenError("Gemini is temporarily unavailable; failing fast.")
+            self.state = "half_open"
+            self._trial_in_flight = False
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                raise CircuitOpenError("Gemini is temporarily unavailable; failing fast.")
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def abandon(self) -> None:
+        """A call ended without an outcome (e.g. it was cancelled or rejected); lets another trial through."""
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class RateLimiter:
+    """
+    Shared gate for upstream model calls. Every call waits for the request
+    and token budgets and a concurrency slot, passes the circuit breaker, and
+    is retried with jittered exponential backoff on throttling and transient
+    errors, unless the backoff would overrun the current request's deadline.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 60,
+        tokens_per_minute: float = 250_000,
+        concurrency: Optional[AdaptiveConcurrencyLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_retries: int = 3,
+        output_token_estimate: int = 1024,
+        request_bucket: Optional[Any] = None,
+        token_bucket: Optional[Any] = None,
+    ):
+        # The buckets may be replaced by ones shared across worker processes (see shared_state).
+        self.requests = request_bucket if request_bucket is not None else TokenBucket(requests_per_minute)
+        self.tokens = token_bucket if token_bucket is not None else TokenBucket(tokens_per_minute)
+        self.concurrency = concurrency if concurrency is not None else AdaptiveConcurrencyLimiter()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.max_retries = max_retries
+        self.output_token_estimate = output_token_estimate
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0, "short_circuited": 0}
+
+    @asynccontextmanager
+    async def slot(self, prompt: str) -> AsyncIterator[None]:
+        """Holds budget and a concurrency slot for a single attempt, recording its outcome."""
+        try:
+            self.breaker.allow()
+        except CircuitOpenError:
+            self.stats["short_circuited"] += 1
+            raise
+        # Every exit that records no outcome (a failed acquire, cancellation, a
+        # non-transient error) releases the breaker's half-open trial, so a bad
+        # request can't leave the circuit waiting on a trial that never ends.
+        recorded = False
+        try:
+            await self.requests.acquire()
+            await self.tokens.acquire(estimate_tokens(prompt) + self.output_token_estimate)
+            await self.concurrency.acquire()
+            self.stats["calls"] += 1
+            started = time.monotonic()
+            throttled = False
+            try:
+                yield
+            except Exception as e:
+                throttled = is_throttle_error(e)
+                if throttled:
+                    self.stats["throttled"] += 1
+                    await self.requests.drain()
+                # Only upstream trouble counts against the breaker, not e.g. a bad prompt.
+                if is_transient_error(e):
+                    self.breaker.record_failure()
+                    recorded = True
+                self.stats["failures"] += 1
+                raise
+            else:
+                self.breaker.record_success()
+                recorded = True
+            finally:
+                await self.concurrency.release(time.monotonic() - started, throttled)
+        finally:
+            if not recorded:
+                self.breaker.abandon()
+
+    async def run(self, prompt: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Runs call under the limiter, retrying throttled and transient failures."""
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(prompt):
+                    return await call()
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient_error(e):
+                    raise
+                delay = backoff_delay(attempt)
+                left = remaining()
+                if left is not None and left <= delay:
+                    # The retry could not finish before the request's deadline.
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+                attempt += 1
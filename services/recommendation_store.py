@@ -0,0 +1,309 @@
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+from services.deadline import DeadlineExceededError, no_deadline, within_deadline
+from services.shared_state import Lease, connect_shared
+from services.skill_taxonomy import canonical_skills
+from models.pydantic_models import JobPosting, ResumeData
+
+if TYPE_CHECKING:
+    from services.job_recommender import JobRecommender
+
+logger = logging.getLogger(__name__)
+
+# (profile hash, canonical skills, experience years, education, computed_at)
+StoredProfile = Tuple[str, List[str], int, str, float]
+
+
+def profile_hash(skills: List[str], experience_years: int, education: str) -> str:
+    """
+    Identifies the inputs that decide a ranking, so candidates with equivalent
+    profiles share one materialized list and a changed profile gets a new one.
+    """
+    payload = json.dumps(
+        {
+            "skills": canonical_skills(skills),
+            "experience_years": experience_years,
+            "education": " ".join(education.lower().split()),
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RecommendationStore:
+    """
+    Ranked job lists materialized per profile hash in SQLite, with the
+    profile inputs needed to recompute them and when each was last read.
+    """
+
+    # last_read_at is only rewritten when older than this, so reads rarely write.
+    READ_TOUCH_SECONDS = 3600
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = connect_shared(path)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS recommendations ("
+                "profile_hash TEXT PRIMARY KEY, skills TEXT NOT NULL, experience_years INTEGER NOT NULL, "
+                "education TEXT NOT NULL, jobs TEXT NOT NULL, computed_at REAL NOT NULL, last_read_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[List[JobPosting], float]]:
+        """The materialized jobs and when they were computed, or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT jobs, computed_at, last_read_at FROM recommendations WHERE profile_hash = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[2] > self.READ_TOUCH_SECONDS:
+                self._conn.execute("UPDATE recommendations SET last_read_at = ? WHERE profile_hash = ?", (now, key))
+                self._conn.commit()
+        return [JobPosting(**job) for job in json.loads(row[0])], row[1]
+
+    def put(
+        self, key: str, skills: List[str], experience_years: int, education: str,
+        jobs: List[JobPosting], computed_at: float
+    ) -> None:
+        payload = json.dumps([job.model_dump() for job in jobs], separators=(",", ":"))
+        with self._lock:
+            # An older computation finishing late must not overwrite a newer one.
+            self._conn.execute(
+                "INSERT INTO recommendations "
+                "(profile_hash, skills, experience_years, education, jobs, computed_at, last_read_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(profile_hash) DO UPDATE SET jobs = excluded.jobs, computed_at = excluded.computed_at "
+                "WHERE excluded.computed_at > recommendations.computed_at",
+                (key, json.dumps(skills), experience_years, education, payload, computed_at, time.time())
+            )
+            self._conn.commit()
+
+    def profiles(self) -> List[StoredProfile]:
+        """Every stored profile, least recently computed first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT profile_hash, skills, experience_years, education, computed_at "
+                "FROM recommendations ORDER BY computed_at"
+            ).fetchall()
+        return [(key, json.loads(skills), experience_years, education, computed_at)
+                for key, skills, experience_years, education, computed_at in rows]
+
+    def evict_unread(self, read_before: float) -> int:
+        """Drops lists not read since read_before. Returns how many were dropped."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM recommendations WHERE last_read_at < ?", (read_before,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM recommendations").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RecommendationMaterializer:
+    """
+    Serves recommendations from the RecommendationStore, so a read costs one
+    SQLite lookup however expensive searching and ranking are. A miss is
+    computed inline, once per profile however many callers wait for it, and
+    profiles can be prefetched when a resume is submitted. A background task
+    recomputes lists whose profile matches postings ingested since they were
+    computed, or that are older than max_age_seconds, and drops lists not
+    read for retention_seconds. With a lease, only one worker process refreshes.
+    """
+
+    def __init__(
+        self,
+        job_recommender: "JobRecommender",
+        store: RecommendationStore,
+        interval_seconds: float = 60.0,
+        max_age_seconds: float = 6 * 3600,
+        retention_seconds: float = 7 * 24 * 3600,
+        max_refreshes_per_cycle: int = 20,
+        lease: Optional[Lease] = None,
+    ):
+        self.job_recommender = job_recommender
+        self.store = store
+        self.interval_seconds = interval_seconds
+        self.max_age_seconds = max_age_seconds
+        self.retention_seconds = retention_seconds
+        self.max_refreshes_per_cycle = max_refreshes_per_cycle
+        self.lease = lease
+        self.stats = {"hits": 0, "misses": 0, "prefetched": 0, "computed": 0, "refreshed": 0, "evicted": 0,
+                      "deadline_fallbacks": 0, "degraded": 0}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Candidates fetched by in-flight computations, for callers whose deadline passes meanwhile.
+        self._fetched: Dict[str, List[JobPosting]] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def recommend(self, profile: ResumeData) -> List[JobPosting]:
+        key = profile_hash(profile.skills, profile.experience_years, profile.education)
+        # The store is synchronous SQLite, and a read may also write last_read_at.
+        stored = await asyncio.to_thread(self.store.get, key)
+        if stored is not None:
+            self.stats["hits"] += 1
+            jobs, computed_at = stored
+            if time.time() - computed_at > self.max_age_seconds:
+                self._schedule(key, profile)
+            return jobs
+        self.stats["misses"] += 1
+        # The shared computation runs without this caller's deadline, so a caller with
+        # little budget left doesn't get a fallback ranking stored for every caller.
+        with no_deadline():
+            task = self._computation(key, profile)
+        try:
+            # Shielded, so a caller timing out doesn't cancel the computation others may share.
+            return await within_deadline(asyncio.shield(task))
+        except DeadlineExceededError:
+            # The computation carries on and is stored; this caller gets the local ranking of
+            # the postings already at hand now, without another search or index refresh.
+            self.stats["deadline_fallbacks"] += 1
+            candidates = self._fetched.get(key)
+            if candidates is None:
+                candidates = await self.job_recommender.indexed_candidates(profile.skills, profile.experience_years)
+            if not candidates:
+                return []
+            jobs, _ = await self.job_recommender.rank_jobs_with_status(
+                candidates, canonical_skills(profile.skills), profile.experience_years, profile.education,
+                ranking_mode="local"
+            )
+            return jobs
+
+    async def prefetch(self, profile: ResumeData) -> None:
+        """Materializes the profile's list in the background unless it is already stored."""
+        key = profile_hash(profile.skills, profile.experience_years, profile.education)
+        if key not in self._inflight and await asyncio.to_thread(self.store.get, key) is None:
+            self.stats["prefetched"] += 1
+            self._schedule(key, profile)
+
+    def notify_ingest(self, added: int) -> None:
+        """Wakes the refresh task early after new postings were ingested."""
+        self._wake.set()
+
+    def _schedule(self, key: str, profile: ResumeData) -> None:
+        # Background work outlives the request, so it must not inherit the request's deadline.
+        with no_deadline():
+            self._computation(key, profile)
+
+    def _computation(self, key: str, profile: ResumeData) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(key, profile))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._finished(key, t))
+        return task
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        self._fetched.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Materializing recommendations failed: %s", task.exception())
+
+    async def _compute(self, key: str, profile: ResumeData) -> List[JobPosting]:
+        # Stamped with the start time, so postings ingested meanwhile still trigger a refresh.
+        started = time.time()
+        skills = canonical_skills(profile.skills)
+        candidates = await self.job_recommender.candidates_for(skills, profile.experience_years)
+        self._fetched[key] = candidates
+        jobs, fell_back = [], False
+        if candidates:
+            jobs, fell_back = await self.job_recommender.rank_jobs_with_status(
+                candidates, skills, profile.experience_years, profile.education
+            )
+        self.stats["computed"] += 1
+        # An empty list usually means the search failed, and a fallback ranking means Gemini did;
+        # neither is stored, so the next read or refresh computes it again instead.
+        if fell_back:
+            self.stats["degraded"] += 1
+        elif jobs:
+            await asyncio.to_thread(
+                self.store.put, key, skills, profile.experience_years, profile.education, jobs, started
+            )
+        return jobs
+
+    def _is_stale(self, skills: List[str], experience_years: int, computed_at: float, newest_posting: Optional[float]) -> bool:
+        """Runs an FTS query, so it is called on a worker thread."""
+        if time.time() - computed_at > self.max_age_seconds:
+            return True
+        if newest_posting is None or newest_posting <= computed_at:
+            return False
+        job_index = self.job_recommender.job_index
+        return bool(job_index.search(skills, experience_years=experience_years, limit=1, ingested_after=computed_at))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self.lease is not None:
+            self.lease.release()
+            self.lease.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Recommendation refresh failed: %s", e)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def refresh_once(self) -> int:
+        """Recomputes up to max_refreshes_per_cycle stale lists. Returns how many were recomputed."""
+        if self.lease is not None and not self.lease.acquire():
+            return 0
+        # The store and index queries are synchronous SQLite, so they run off the event loop.
+        self.stats["evicted"] += await asyncio.to_thread(self.store.evict_unread, time.time() - self.retention_seconds)
+        job_index = self.job_recommender.job_index
+        newest_posting = await asyncio.to_thread(job_index.last_ingested_at) if job_index is not None else None
+
+        refreshed = 0
+        for key, skills, experience_years, education, computed_at in await asyncio.to_thread(self.store.profiles):
+            if refreshed >= self.max_refreshes_per_cycle:
+                break
+            if key in self._inflight:
+                continue
+            if not await asyncio.to_thread(self._is_stale, skills, experience_years, computed_at, newest_posting):
+                continue
+            if self.lease is not None and not self.lease.acquire():
+                break
+            profile = ResumeData(
+                name="", email="", experience="", experience_years=experience_years, education=education, skills=skills
+            )
+            try:
+                with no_deadline():
+                    await asyncio.shield(self._computation(key, profile))
+            except Exception as e:
+                logger.warning("Refreshing recommendations failed: %s", e)
+                continue
+            refreshed += 1
+        self.stats["refreshed"] += refreshed
+        return refreshed
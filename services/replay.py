@@ -0,0 +1,246 @@
+import json
+import math
+import random
+import asyncio
+import hashlib
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+
+def prompt_fingerprint(prompt: Any) -> str:
+    text = prompt if isinstance(prompt, str) else str(prompt)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def search_fingerprint(params: Dict[str, Any]) -> str:
+    """Identifies a SerpApi search by its parameters, ignoring the API key."""
+    relevant = {key: value for key, value in params.items() if key != "api_key"}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _append_jsonl(path: str, lock: threading.Lock, record: Dict[str, Any]) -> None:
+    with lock:
+        with open(path, "a", encoding="utf-8") as fixtures:
+            fixtures.write(json.dumps(record) + "\n")
+
+
+def _load_jsonl(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as fixtures:
+        return [json.loads(line) for line in fixtures if line.strip()]
+
+
+class LatencyModel:
+    """
+    Log-normal latency with the given median and p99, the usual shape of
+    LLM response times: most calls near the median and a long slow tail.
+    """
+
+    def __init__(self, median_seconds: float = 0.0, p99_seconds: Optional[float] = None):
+        self.median_seconds = median_seconds
+        p99 = p99_seconds if p99_seconds is not None else median_seconds
+        # z(0.99) ~= 2.326
+        self.sigma = math.log(p99 / median_seconds) / 2.326 if median_seconds > 0 and p99 > median_seconds else 0.0
+
+    def sample(self) -> float:
+        if self.median_seconds <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.median_seconds), self.sigma)
+
+
+class FakeLLM:
+    """
+    Stand-in for the chat model with configurable latency and failures.
+    responder maps a prompt to the response text. A failing call raises
+    failure_message, a 429-style error by default, so the limiter treats it
+    as throttling.
+    """
+
+    def __init__(
+        self,
+        responder: Callable[[str], str],
+        latency: Optional[LatencyModel] = None,
+        failure_rate: float = 0.0,
+        failure_message: str = "429 Resource exhausted (simulated)",
+        stream_chunk_chars: int = 32,
+    ):
+        self.responder = responder
+        self.latency = latency or LatencyModel()
+        self.failure_rate = failure_rate
+        self.failure_message = failure_message
+        self.stream_chunk_chars = stream_chunk_chars
+        self.calls = 0
+
+    async def _respond(self, prompt: Any) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency.sample())
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError(self.failure_message)
+        return self.responder(prompt if isinstance(prompt, str) else str(prompt))
+
+    async def ainvoke(self, prompt: Any, *args, **kwargs) -> AIMessage:
+        return AIMessage(content=await self._respond(prompt))
+
+    async def astream(self, prompt: Any, *args, **kwargs) -> AsyncIterator[AIMessageChunk]:
+        text = await self._respond(prompt)
+        for start in range(0, len(text), self.stream_chunk_chars):
+            await asyncio.sleep(0)
+            yield AIMessageChunk(content=text[start:start + self.stream_chunk_chars])
+
+
+class ThrottlingLLM(FakeLLM):
+    """
+    FakeLLM that throttles like a quota-limited upstream: a call beyond
+    max_concurrency in flight, or beyond requests_per_minute (enforced per
+    second, as requests_per_minute / 60), fails at once with a 429. During
+    outages, (start, end) seconds after the first call, every call fails
+    with a 503.
+    """
+
+    def __init__(
+        self,
+        responder: Callable[[str], str],
+        latency: Optional[LatencyModel] = None,
+        max_concurrency: int = 8,
+        requests_per_minute: float = 600.0,
+        outages: Sequence[Tuple[float, float]] = (),
+    ):
+        super().__init__(responder, latency=latency)
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_minute / 60.0
+        self.outages = list(outages)
+        self.stats = {"ok": 0, "throttled": 0, "unavailable": 0}
+        self._in_flight = 0
+        self._admitted: deque = deque()
+        self._first_call: Optional[float] = None
+
+    async def _respond(self, prompt: Any) -> str:
+        self.calls += 1
+        now = time.monotonic()
+        if self._first_call is None:
+            self._first_call = now
+        elapsed = now - self._first_call
+        if any(start <= elapsed < end for start, end in self.outages):
+            self.stats["unavailable"] += 1
+            raise RuntimeError("503 Service unavailable (simulated)")
+        while self._admitted and now - self._admitted[0] >= 1.0:
+            self._admitted.popleft()
+        if self._in_flight >= self.max_concurrency or len(self._admitted) >= self.requests_per_second:
+            self.stats["throttled"] += 1
+            raise RuntimeError(self.failure_message)
+        self._admitted.append(now)
+        self._in_flight += 1
+        try:
+            await asyncio.sleep(self.latency.sample())
+        finally:
+            self._in_flight -= 1
+        self.stats["ok"] += 1
+        return self.responder(prompt if isinstance(prompt, str) else str(prompt))
+
+
+class RecordingLLM:
+    """Wraps the real chat model and appends every prompt/response pair to a JSONL fixture file."""
+
+    def __init__(self, llm: Any, path: str):
+        self.llm = llm
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _record(self, prompt: Any, content: str) -> None:
+        _append_jsonl(self.path, self._lock, {
+            "key": prompt_fingerprint(prompt),
+            "prompt": prompt if isinstance(prompt, str) else str(prompt),
+            "response": content,
+        })
+
+    async def ainvoke(self, prompt: Any, *args, **kwargs) -> Any:
+        response = await self.llm.ainvoke(prompt, *args, **kwargs)
+        self._record(prompt, response.content if hasattr(response, "content") else str(response))
+        return response
+
+    async def astream(self, prompt: Any, *args, **kwargs) -> AsyncIterator[Any]:
+        parts = []
+        async for chunk in self.llm.astream(prompt, *args, **kwargs):
+            parts.append(chunk.content if hasattr(chunk, "content") else str(chunk))
+            yield chunk
+        self._record(prompt, "".join(parts))
+
+
+class ReplayLLM(FakeLLM):
+    """
+    Serves recorded responses. Prompts are matched exactly first; otherwise
+    the recording sharing the longest prefix is used, since prompts of one
+    kind share their static instructions and differ in the details.
+    """
+
+    def __init__(self, path: str, latency: Optional[LatencyModel] = None, failure_rate: float = 0.0):
+        self.records = _load_jsonl(path)
+        self._by_key = {record["key"]: record["response"] for record in self.records}
+        super().__init__(self._lookup, latency=latency, failure_rate=failure_rate)
+        self.misses = 0
+
+    def _lookup(self, prompt: str) -> str:
+        response = self._by_key.get(prompt_fingerprint(prompt))
+        if response is not None:
+            return response
+        self.misses += 1
+        if not self.records:
+            raise LookupError("No recorded LLM responses to replay.")
+        best = max(self.records, key=lambda record: _shared_prefix(record["prompt"], prompt))
+        return best["response"]
+
+
+def _shared_prefix(a: str, b: str) -> int:
+    limit = min(len(a), len(b))
+    i = 0
+    while i < limit and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class SearchRecorder:
+    """Wraps a blocking SerpApi search function and appends each params/result pair to a JSONL file."""
+
+    def __init__(self, search: Callable[[Dict[str, Any]], Dict[str, Any]], path: str):
+        self.search = search
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        results = self.search(params)
+        relevant = {key: value for key, value in params.items() if key != "api_key"}
+        _append_jsonl(self.path, self._lock, {"key": search_fingerprint(params), "params": relevant, "results": results})
+        return results
+
+
+class SearchReplayer:
+    """
+    Blocking drop-in for the SerpApi search function that serves recorded
+    results. Unrecorded searches return the recording for the same engine
+    (or, failing that, an empty result page), after the sampled latency.
+    """
+
+    def __init__(self, path: Optional[str] = None, latency: Optional[LatencyModel] = None,
+                 fallback: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None):
+        self.records = _load_jsonl(path) if path else []
+        self._by_key = {record["key"]: record["results"] for record in self.records}
+        self.latency = latency or LatencyModel()
+        self.fallback = fallback
+        self.calls = 0
+        self.misses = 0
+
+    def __call__(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        self.calls += 1
+        time.sleep(self.latency.sample())
+        results = self._by_key.get(search_fingerprint(params))
+        if results is not None:
+            return results
+        self.misses += 1
+        if self.fallback is not None:
+            return self.fallback(params)
+        same_engine = [record for record in self.records if record["params"].get("engine") == params.get("engine")]
+        if same_engine:
+            return random.choice(same_engine)["results"]
+        return {"jobs_results": []}
@@ -0,0 +1,214 @@
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from models.pydantic_models import AdaptiveTestState, TestQuestion
+from services.shared_state import connect_shared
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+class TestSessionStore:
+    """
+    Generated tests kept on the server, so a client submits only the session
+    id and its answers instead of sending the questions (answer key included)
+    back. Parsed questions live in an in-memory LRU bounded by max_sessions;
+    when a path is given, sessions are also written to SQLite so they survive
+    restarts and memory evictions. Sessions expire ttl_seconds after creation.
+    """
+
+    def __init__(self, ttl_seconds: float = 2 * 3600, max_sessions: int = 10_000, path: Optional[str] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Tuple[List[TestQuestion], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+        self._conn = None
+        if path:
+            self._conn = connect_shared(path)
+            with self._lock:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS test_sessions ("
+                    "id TEXT PRIMARY KEY, questions TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._conn.execute("DELETE FROM test_sessions WHERE expires_at <= ?", (time.time(),))
+                self._conn.commit()
+
+    def create(self, questions: List[TestQuestion]) -> str:
+        session_id = new_session_id()
+        self.put(session_id, questions)
+        return session_id
+
+    def put(self, session_id: str, questions: List[TestQuestion]) -> None:
+        """Stores questions under an id chosen by the caller, e.g. one already sent in a response header."""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(session_id, list(questions), expires_at)
+            self.stats["created"] += 1
+            if self._conn is not None:
+                payload = json.dumps([q.model_dump(exclude_none=True) for q in questions], separators=(",", ":"))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO test_sessions (id, questions, expires_at) VALUES (?, ?, ?)",
+                    (session_id, payload, expires_at)
+                )
+                self._conn.commit()
+
+    def get(self, session_id: str) -> Optional[List[TestQuestion]]:
+        """The session's questions, or None when it is unknown or expired. Callers must not mutate them."""
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                questions, expires_at = entry
+                if expires_at > now:
+                    self._sessions.move_to_end(session_id)
+                    self.stats["hits"] += 1
+                    return questions
+                del self._sessions[session_id]
+                self.stats["expirations"] += 1
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT questions, expires_at FROM test_sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    questions = [TestQuestion(**q) for q in json.loads(row[0])]
+                    self._remember(session_id, questions, row[1])
+                    self.stats["hits"] += 1
+                    return questions
+                if row is not None:
+                    self._conn.execute("DELETE FROM test_sessions WHERE id = ?", (session_id,))
+                    self._conn.commit()
+            self.stats["misses"] += 1
+            return None
+
+    def purge_expired(self) -> Dict[str, int]:
+        """
+        Drops expired sessions from both tiers, including ones nobody reads
+        again (reads only delete the session they hit). Returns how many per tier.
+        """
+        now = time.time()
+        with self._lock:
+            expired = [session_id for session_id, (_, expires_at) in self._sessions.items() if expires_at <= now]
+            for session_id in expired:
+                del self._sessions[session_id]
+            self.stats["expirations"] += len(expired)
+            purged = {"memory": len(expired), "disk": 0}
+            if self._conn is not None:
+                purged["disk"] = self._conn.execute("DELETE FROM test_sessions WHERE expires_at <= ?", (now,)).rowcount
+                self._conn.commit()
+        return purged
+
+    def _remember(self, session_id: str, questions: List[TestQuestion], expires_at: float) -> None:
+        self._sessions[session_id] = (questions, expires_at)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def stats_snapshot(self) -> Dict[str, int]:
+        snapshot = dict(self.stats)
+        snapshot["memory_sessions"] = len(self._sessions)
+        return snapshot
+
+    def close(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+
+
+class AdaptiveSessionStore:
+    """
+    In-progress adaptive tests. Their state changes on every answer, so it is
+    kept serialized: in memory (an LRU bounded by max_sessions), or, when a
+    path is given, only in SQLite, so every worker process sees the latest answer.
+    """
+
+    def __init__(self, ttl_seconds: float = 2 * 3600, max_sessions: int = 10_000, path: Optional[str] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        # session id -> (serialized state, expires_at, number of answers recorded)
+        self._sessions: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._conn = None
+        if path:
+            self._conn = connect_shared(path)
+            with self._lock:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS adaptive_sessions ("
+                    "id TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL, "
+                    "answered INTEGER NOT NULL DEFAULT 0)"
+                )
+                columns = {row[1] for row in self._conn.execute("PRAGMA table_info(adaptive_sessions)")}
+                if "answered" not in columns:
+                    self._conn.execute("ALTER TABLE adaptive_sessions ADD COLUMN answered INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute("DELETE FROM adaptive_sessions WHERE expires_at <= ?", (time.time(),))
+                self._conn.commit()
+
+    def put(self, session_id: str, state: AdaptiveTestState, expected_answered: Optional[int] = None) -> bool:
+        """
+        Stores the state. With expected_answered, only if the stored session is
+        live and still has that many answers (a compare-and-set, so of two
+        concurrent answers to one question only the first is recorded).
+        Returns whether the state was stored.
+        """
+        payload = state.model_dump_json()
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        answered = len(state.answers)
+        with self._lock:
+            if self._conn is not None:
+                if expected_answered is None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO adaptive_sessions (id, state, expires_at, answered) VALUES (?, ?, ?, ?)",
+                        (session_id, payload, expires_at, answered)
+                    )
+                    stored = True
+                else:
+                    stored = self._conn.execute(
+                        "UPDATE adaptive_sessions SET state = ?, expires_at = ?, answered = ? "
+                        "WHERE id = ? AND answered = ? AND expires_at > ?",
+                        (payload, expires_at, answered, session_id, expected_answered, now)
+                    ).rowcount == 1
+                self._conn.commit()
+                return stored
+            if expected_answered is not None:
+                entry = self._sessions.get(session_id)
+                if entry is None or entry[1] <= now or entry[2] != expected_answered:
+                    return False
+            self._sessions[session_id] = (payload, expires_at, answered)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return True
+
+    def get(self, session_id: str) -> Optional[AdaptiveTestState]:
+        """A fresh copy of the session's state, or None when it is unknown, finished or expired."""
+        with self._lock:
+            if self._conn is not None:
+                entry = self._conn.execute(
+                    "SELECT state, expires_at FROM adaptive_sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+            else:
+                entry = self._sessions.get(session_id)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return AdaptiveTestState.model_validate_json(entry[0])
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM adaptive_sessions WHERE id = ?", (session_id,))
+                self._conn.commit()
+            else:
+                self._sessions.pop(session_id, None)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
@@ -0,0 +1,163 @@
+import os
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from typing import Optional
+
+
+def connect_shared(path: str) -> sqlite3.Connection:
+    """
+    Opens a SQLite database that several worker processes may use at once:
+    WAL lets readers proceed alongside a writer, and writers wait for the
+    lock (up to busy_timeout) instead of failing with "database is locked".
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# Tells this process apart from an earlier one with the same host name and PID,
+# as a restarted container usually has.
+_BOOT_ID = uuid.uuid4().hex[:12]
+
+
+def process_owner() -> str:
+    """Identifies this process among the workers sharing a database, as host:pid:boot-id."""
+    return f"{os.uname().nodename}:{os.getpid()}:{_BOOT_ID}"
+
+
+def owner_is_alive(owner: str) -> bool:
+    """Whether the process named by process_owner() still runs. Owners on other hosts are assumed alive."""
+    parts = owner.rsplit(":", 2)
+    if len(parts) < 2 or parts[0] != os.uname().nodename or not parts[1].isdigit():
+        return True
+    if int(parts[1]) == os.getpid():
+        # Our own PID: alive only if it is this very process, not an earlier boot that had it.
+        return owner == process_owner()
+    try:
+        os.kill(int(parts[1]), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedTokenBucket:
+    """
+    TokenBucket whose level is kept in SQLite, so every worker process draws
+    from one budget. Each take is a short IMMEDIATE transaction run off the
+    event loop; waiters within a process are served in arrival order.
+    """
+
+    def __init__(self, path: str, name: str, per_minute: float, capacity: Optional[float] = None):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._conn = connect_shared(path)
+        self._lock = threading.Lock()
+        self._waiters = asyncio.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (name, self.capacity, time.time())
+            )
+            self._conn.commit()
+
+    def _take(self, amount: float) -> float:
+        """Takes amount if available and returns 0, otherwise the seconds until it will be."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                tokens, updated = self._conn.execute(
+                    "SELECT tokens, updated FROM token_buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                now = time.time()
+                tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+                wait = 0.0
+                if tokens >= amount:
+                    tokens -= amount
+                else:
+                    wait = (amount - tokens) / self.rate
+                self._conn.execute(
+                    "UPDATE token_buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens, now, self.name)
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return wait
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)
+        async with self._waiters:
+            while True:
+                wait = await asyncio.to_thread(self._take, amount)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    def _drain(self) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE token_buckets SET tokens = 0, updated = ? WHERE name = ?", (time.time(), self.name)
+            )
+            self._conn.commit()
+
+    async def drain(self) -> None:
+        await asyncio.to_thread(self._drain)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class Lease:
+    """
+    Named, expiring lease in SQLite, for work that only one worker process
+    should do at a time (e.g. background refills). The holder renews it by
+    acquiring again before ttl_seconds pass.
+    """
+
+    def __init__(self, path: str, name: str, ttl_seconds: float = 60.0):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.owner = process_owner()
+        self._conn = connect_shared(path)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def acquire(self) -> bool:
+        """Takes or renews the lease. Returns whether this process holds it."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (self.name, self.owner, now + self.ttl_seconds, now)
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def release(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (self.name, self.owner))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,172 @@
+import os
+import re
+import json
+from collections import deque
+from functools import lru_cache
+from typing import Collection, Dict, Iterator, List, Tuple
+
+DEFAULT_ALIASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "skill_aliases.json")
+
+# Characters that continue a skill name, so "c" does not match inside "c++" or "c#".
+_WORD_CHARS = "+#&"
+_STRIP_CHARS = " \t-•*:;,()[]{}'\"|/"
+# Aliases that are also ordinary words or letters ("I can go to the office"). In free text they
+# only count as a skill when they make up a whole list item: "Python, Go", "C++ and R".
+AMBIGUOUS_ALIASES = frozenset({"c", "r", "go", "sh", "ts", "tf", "dl", "ml"})
+_ITEM_BEFORE_RE = re.compile(r"(?:^|[,;:|•\n(/&]|\band|\bor)[ \t*-]*$")
+# A sentence-ending period also closes a list: "python, go and r. also ..." lists r.
+_ITEM_AFTER_RE = re.compile(r"[ \t.]*(?:$|[,;:|•\n)/&]|(?:and|or)\b)|\.\s")
+
+
+def normalize_skill_text(text: str) -> str:
+    """Lowercases and collapses whitespace."""
+    return " ".join(text.lower().split())
+
+
+def _normalize_lines(text: str) -> str:
+    """normalize_skill_text per line, keeping the line breaks, which often delimit skills."""
+    return "\n".join(normalize_skill_text(line) for line in text.splitlines())
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    return index < 0 or index >= len(text) or not (text[index].isalnum() or text[index] in _WORD_CHARS)
+
+
+def _is_list_item(text: str, start: int, end: int) -> bool:
+    """Whether text[start:end] stands alone between list delimiters."""
+    return bool(
+        _ITEM_BEFORE_RE.search(text, max(0, start - 12), start) and _ITEM_AFTER_RE.match(text, end)
+    )
+
+
+class _AhoCorasick:
+    """Multi-pattern matcher: finds every occurrence of every pattern in one pass over the text."""
+
+    def __init__(self, patterns: Dict[str, str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Per node: (pattern length, value) of each pattern ending there, including via fail links.
+        self._out: List[List[Tuple[int, str]]] = [[]]
+        for pattern, value in patterns.items():
+            node = 0
+            for ch in pattern:
+                child = self._goto[node].get(ch)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto[node][ch] = child
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = child
+            self._out[node].append((len(pattern), value))
+
+        # Breadth-first, so each node's fail target is finished before its children need it.
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def matches(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Yields (start, end, value) for every pattern occurrence."""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, value in self._out[node]:
+                yield i - length + 1, i + 1, value
+
+
+class SkillTaxonomy:
+    """
+    Maps free-text skill names to canonical ones using an alias table, e.g.
+    "Python3", "py" and "python" all become "python". Unknown skills are kept,
+    normalized, so nothing the candidate listed is dropped. In free text, the
+    ambiguous aliases only match as a whole list item.
+    """
+
+    def __init__(self, aliases: Dict[str, List[str]], ambiguous: Collection[str] = AMBIGUOUS_ALIASES):
+        self._ambiguous = {normalize_skill_text(name) for name in ambiguous}
+        self._canonical: Dict[str, str] = {}
+        self._known = set(aliases)
+        for canonical, names in aliases.items():
+            for name in [canonical, *names]:
+                self._canonical[normalize_skill_text(name)] = canonical
+        self._matcher = _AhoCorasick(self._canonical)
+
+    @classmethod
+    def from_file(cls, path: str) -> "SkillTaxonomy":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def canonical(self, skill: str) -> str:
+        key = normalize_skill_text(skill).strip(_STRIP_CHARS)
+        return self._canonical.get(key) or self._canonical.get(key.rstrip(".")) or key.rstrip(".")
+
+    def is_known(self, skill: str) -> bool:
+        """Whether the skill maps to a canonical name in the alias table."""
+        return self.canonical(skill) in self._known
+
+    def canonicalize(self, skills: List[str]) -> List[str]:
+        """Canonical, deduplicated and sorted, so equivalent skill lists compare (and hash) equal."""
+        return sorted({canonical for canonical in map(self.canonical, skills) if canonical})
+
+    def _mentions(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        Non-overlapping (start, end, canonical) mentions of known skills in
+        normalized text. Overlaps resolve to the leftmost, then longest, so
+        "react native" is one skill rather than "react" plus nothing.
+        """
+        found = sorted(
+            (start, -end, canonical)
+            for start, end, canonical in self._matcher.matches(text)
+            if _is_boundary(text, start - 1) and _is_boundary(text, end)
+            and (text[start:end] not in self._ambiguous or _is_list_item(text, start, end))
+        )
+        mentions = []
+        covered_until = 0
+        for start, negative_end, canonical in found:
+            if start >= covered_until:
+                mentions.append((start, -negative_end, canonical))
+                covered_until = -negative_end
+        return mentions
+
+    def extract(self, text: str) -> List[str]:
+        """Canonical names of the known skills mentioned in free text, sorted."""
+        return sorted({canonical for _, _, canonical in self._mentions(_normalize_lines(text))})
+
+    def extract_with_remainder(self, text: str) -> Tuple[List[str], str]:
+        """
+        Like extract, also returning the normalized text with the known
+        mentions cut out (replaced by commas), for callers that keep unknown
+        skills too. Line breaks are kept, since they often delimit skills.
+        """
+        text = _normalize_lines(text)
+        mentions = self._mentions(text)
+        parts = []
+        position = 0
+        for start, end, _ in mentions:
+            parts.append(text[position:start])
+            position = end
+        parts.append(text[position:])
+        return sorted({canonical for _, _, canonical in mentions}), ",".join(parts)
+
+
+@lru_cache(maxsize=1)
+def default_taxonomy() -> SkillTaxonomy:
+    """The taxonomy built from the bundled alias table, loaded once per process."""
+    return SkillTaxonomy.from_file(DEFAULT_ALIASES_PATH)
+
+
+def canonical_skills(skills: List[str]) -> List[str]:
+    return default_taxonomy().canonicalize(skills)
+
+
+def is_known_skill(skill: str) -> bool:
+    return default_taxonomy().is_known(skill)
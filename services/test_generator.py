@@ -1,35 +1,300 @@
 import re
+import asyncio
+import logging
+from contextlib import aclosing
 from services.gemini_service import GeminiService
-from models.pydantic_models import TestQuestion, TestResult, LearningPath, LearningResource
-from typing import List, Dict, Any
-import json
+from services.rate_limiter import CircuitOpenError
+from services.deadline import DeadlineExceededError, deadline_scope
+from services.json_stream import validate_items
+from services.prompt_builder import truncate_to_tokens
+from services.observability import stage
+from services.skill_taxonomy import canonical_skills
+from models.pydantic_models import (
+    TestQuestion, TestResult, CodeRunResult,
+    SkillTestRequest, CandidateTestResult
+)
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from services.question_bank import QuestionBank
+    from services.code_runner import CodeRunner
+
+logger = logging.getLogger(__name__)
+
+def difficulty_for_experience(experience_years: int) -> str:
+    """Maps years of experience onto the difficulty tier used for questions."""
+    if experience_years >= 5:
+        return "advanced"
+    if experience_years >= 2:
+        return "intermediate"
+    return "beginner"
+
+MCQ_TOPIC_RE = re.compile(r"What is (.*?)\?|Explain (.*?)|Describe (.*?)|How does (.*?) work", re.IGNORECASE)
+CODING_TOPIC_RE = re.compile(r"Write a (.*?) function|Implement (.*?)|Solve (.*?) problem", re.IGNORECASE)
+
+def _question_topic(question: str, pattern: "re.Pattern") -> str:
+    """Extracts a topic from the question text, falling back to its first word."""
+    topic_match = pattern.search(question)
+    topic = next((group for group in topic_match.groups() if group), None) if topic_match else None
+    return (topic or question.split(' ')[0]).strip()
+
+def is_correct_mcq(question: TestQuestion, answer: str) -> bool:
+    return answer.strip().lower() == (question.correct_answer or "").strip().lower()
+
+def public_question(question: TestQuestion) -> TestQuestion:
+    """A copy safe to send to the candidate: the answer key and grading cases stay server-side."""
+    return question.model_copy(update={"correct_answer": None, "test_cases": None})
+
+def _unique(items: List[str]) -> List[str]:
+    return list(dict.fromkeys(items))
+
+class LocalGrade:
+    """Result of grading a submission without the model."""
+
+    def __init__(self):
+        self.mcq_correct = 0
+        self.mcq_total = 0
+        self.feedback: Dict[int, str] = {}  # question index -> feedback, MCQs only
+        self.strength_topics: List[str] = []
+        self.weakness_topics: List[str] = []
+        self.open_ended: List[int] = []  # indices of coding/open-ended questions
+        self.open_ended_topics: Dict[int, str] = {}
+        self.code_results: Dict[int, CodeRunResult] = {}  # coding questions graded by running the code
+        self.code_feedback: Dict[int, str] = {}
+
+    def record_code_result(self, index: int, result: CodeRunResult) -> None:
+        self.code_results[index] = result
+        if result.error:
+            outcome = f"could not be run ({result.error})"
+        else:
+            outcome = f"passed {result.passed} of {result.total} test cases"
+            if result.failures:
+                outcome += f"; e.g. {result.failures[0]}"
+        self.code_feedback[index] = f"Question {index+1} (Coding): Your solution {outcome}."
+        topic = self.open_ended_topics.get(index)
+        if topic and not result.error and result.passed == result.total:
+            # A fully passing solution is a strength rather than a weakness.
+            del self.open_ended_topics[index]
+            self.strength_topics.append(topic)
+
+    @property
+    def needs_model(self) -> bool:
+        """Whether some answer can only be judged by the model."""
+        return any(i not in self.code_results for i in self.open_ended)
 
 class TestGenerator:
-    def __init__(self, gemini_service: GeminiService):
+    def __init__(
+        self,
+        gemini_service: GeminiService,
+        question_bank: Optional["QuestionBank"] = None,
+        code_runner: Optional["CodeRunner"] = None,
+        max_answer_tokens: int = 1000,
+        max_question_tokens: int = 200
+    ):
         self.gemini_service = gemini_service
+        self.question_bank = question_bank
+        self.code_runner = code_runner
+        # Evaluation prompt budgets: long submissions and question texts are cut to these sizes.
+        self.max_answer_tokens = max_answer_tokens
+        self.max_question_tokens = max_question_tokens
 
     async def generate_test(
         self, skills: List[str], experience_years: int, num_questions: int = 4, question_type: str = "mcq"
     ) -> List[TestQuestion]:
         """
         Generates a skill assessment test based on provided skills and experience.
+        Tests are sampled from the question bank when it can cover the request,
+        otherwise they are generated by Gemini.
         """
+        skills = canonical_skills(skills)
         if not skills:
             return []
-        difficulty = "beginner"
-        if experience_years >= 5:
-            difficulty = "advanced"
-        elif experience_years >= 2:
-            difficulty = "intermediate"
+        if question_type not in ("mcq", "coding"):
+            raise ValueError("Unsupported question type. Choose 'mcq' or 'coding'.")
+        difficulty = difficulty_for_experience(experience_years)
+
+        if self.question_bank is not None:
+            banked = self.question_bank.sample(skills, difficulty, question_type, num_questions)
+            if banked is not None:
+                return banked
+
+        try:
+            questions = await self.generate_questions_from_llm(skills, difficulty, num_questions, question_type)
+        except (CircuitOpenError, DeadlineExceededError):
+            questions = []
+        if not questions and self.question_bank is not None:
+            # Gemini is unavailable or too slow: a shorter test from the bank beats no test.
+            return self.question_bank.sample(skills, difficulty, question_type, num_questions, min_questions=1) or []
+        if self.question_bank is not None and len(skills) == 1:
+            # Multi-skill tests can't be attributed to a single bucket, so only single-skill results are banked.
+            self.question_bank.add(skills[0], difficulty, question_type, questions)
+        return questions
+
+    async def stream_test(
+        self, skills: List[str], experience_years: int, num_questions: int = 4, question_type: str = "mcq"
+    ) -> AsyncIterator[TestQuestion]:
+        """
+        Streaming variant of generate_test: yields each question as soon as the
+        model finishes it. Malformed questions are skipped.
+        """
+        skills = canonical_skills(skills)
+        if not skills:
+            return
+        if question_type not in ("mcq", "coding"):
+            raise ValueError("Unsupported question type. Choose 'mcq' or 'coding'.")
+        difficulty = difficulty_for_experience(experience_years)
+
+        if self.question_bank is not None:
+            banked = self.question_bank.sample(skills, difficulty, question_type, num_questions)
+            if banked is not None:
+                for question in banked:
+                    yield question
+                return
+
+        with stage("prompt_build"):
+            prompt, schema = self._build_generation_prompt(skills, difficulty, num_questions, question_type)
+        questions = []
+        try:
+            # Closed as soon as enough questions are in, releasing the upstream stream.
+            stream = self.gemini_service.stream_structured_array(prompt, schema, purpose="generate_test")
+            async with aclosing(stream) as raw_questions:
+                async for raw_question in raw_questions:
+                    try:
+                        question = TestQuestion(**raw_question)
+                    except Exception as e:
+                        logger.warning("Skipping malformed streamed question: %s", e)
+                        continue
+                    questions.append(question)
+                    yield question
+                    if len(questions) >= num_questions:
+                        break
+        except (CircuitOpenError, DeadlineExceededError):
+            # Only the questions still missing are topped up from the bank, skipping any already sent.
+            missing = num_questions - len(questions)
+            banked = None
+            if self.question_bank is not None and missing > 0:
+                sent = {question.question for question in questions}
+                sample = self.question_bank.sample(
+                    skills, difficulty, question_type, missing + len(sent), min_questions=1
+                ) or []
+                banked = [question for question in sample if question.question not in sent][:missing]
+            if not banked:
+                if missing <= 0:
+                    return
+                raise
+            for question in banked:
+                yield question
+            return
+
+        if self.question_bank is not None and len(skills) == 1:
+            self.question_bank.add(skills[0], difficulty, question_type, questions)
+
+    async def generate_tests_batch(
+        self,
+        requests: List[SkillTestRequest],
+        max_concurrent_groups: int = 8,
+        deadline_seconds: Optional[float] = None
+    ) -> AsyncIterator[CandidateTestResult]:
+        """
+        Generates tests for many candidates, yielding one result per candidate
+        as soon as its test is ready. Candidates with the same canonical skills
+        (ignoring aliases, case and order), difficulty tier and question type share one generated
+        test, so upstream calls scale with distinct profiles, not candidates.
+        Each shared generation gets its own deadline_seconds budget.
+        """
+        groups: Dict[Tuple[Tuple[str, ...], str, str], List[int]] = {}
+        for index, request in enumerate(requests):
+            skills = tuple(canonical_skills(request.skills))
+            key = (skills, difficulty_for_experience(request.experience_years), request.question_type)
+            groups.setdefault(key, []).append(index)
+
+        semaphore = asyncio.Semaphore(max_concurrent_groups)
+
+        async def generate_group(key, indices: List[int]) -> List[CandidateTestResult]:
+            skills, _, question_type = key
+            first = requests[indices[0]]
+            try:
+                async with semaphore:
+                    with deadline_scope(deadline_seconds):
+                        questions = await self.generate_test(
+                            skills=list(skills),
+                            experience_years=first.experience_years,
+                            num_questions=max(requests[i].num_questions for i in indices),
+                            question_type=question_type
+                        )
+            except Exception as e:
+                return [CandidateTestResult(index=i, error=f"Error generating test: {str(e)}") for i in indices]
+            return [
+                CandidateTestResult(
+                    index=i,
+                    questions=[question.model_copy(deep=True) for question in questions[:requests[i].num_questions]]
+                )
+                for i in indices
+            ]
+
+        tasks = [asyncio.ensure_future(generate_group(key, indices)) for key, indices in groups.items()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for result in await next_done:
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def generate_questions_from_llm(
+        self,
+        skills: List[str],
+        difficulty: str,
+        num_questions: int,
+        question_type: str = "mcq",
+        avoid_questions: Optional[List[str]] = None
+    ) -> List[TestQuestion]:
+        """
+        Generates questions with Gemini. avoid_questions lists question texts the
+        model should not repeat, which the question bank uses to get fresh batches.
+        Raises CircuitOpenError or DeadlineExceededError without retrying when
+        Gemini is failing fast or the request has run out of time.
+        """
+        with stage("prompt_build"):
+            prompt, schema = self._build_generation_prompt(
+                skills, difficulty, num_questions, question_type, avoid_questions
+            )
+
+        try:
+            raw_questions = await self.gemini_service.generate_structured_response(prompt, schema, purpose="generate_test")
+
+        except (CircuitOpenError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            logger.warning("First attempt failed: %s", e)
+            try:
+                raw_questions = await self.gemini_service.generate_structured_response(prompt, schema, purpose="generate_test")
+            except Exception as e2:
+                logger.warning("Second attempt failed: %s", e2)
+                return []
 
+        
+        with stage("validation"):
+            # The model sometimes writes more questions than asked for.
+            return validate_items(raw_questions, TestQuestion)[:num_questions]
+
+    def _build_generation_prompt(
+        self,
+        skills: List[str],
+        difficulty: str,
+        num_questions: int,
+        question_type: str,
+        avoid_questions: Optional[List[str]] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Builds the question generation prompt and the JSON schema of the expected response."""
         skills_str = ", ".join(skills)
 
         if question_type == "mcq":
 
             prompt = (
-                f"As an experienced technical interviewer and assessment creator, generate {num_questions} multiple-choice questions (MCQs) for a skill assessment test.\n"
-                f"The questions should rigorously test the candidate's understanding of the following skills: {skills_str}.\n"
-                f"The difficulty level for these questions must be strictly {difficulty}. Ensure questions are challenging but fair for this level.\n"
+                f"As an experienced technical interviewer and assessment creator, generate multiple-choice questions (MCQs) for a skill assessment test.\n"
+                f"The questions should rigorously test the candidate's understanding of the skills listed at the end.\n"
+                f"The difficulty level for these questions must strictly match the level given at the end. Ensure questions are challenging but fair for this level.\n"
                 f"Each question must have exactly 4 distinct options (A, B, C, D), and only one correct answer. Options should be plausible but clearly distinguishable.\n"
                 f"Format the entire output as a single JSON array of objects. Each object must strictly adhere to the following structure:\n"
                 f"{{\n"
@@ -44,7 +309,7 @@ class TestGenerator:
                 f"    \"correct_answer\": \"A\"\n"
                 f"  }}\n"
                 f"]\n"
-                f"Do not include any conversational text, explanations, or extraneous characters outside the JSON array."
+                f"Do not include any conversational text, explanations, or extraneous characters outside the JSON array.\n"
             )
             schema = {
                 "type": "array",
@@ -61,24 +326,27 @@ class TestGenerator:
         elif question_type == "coding":
  
             prompt = (
-                f"As a senior software engineer and technical challenge designer, create {num_questions} coding challenge questions for a skill assessment test.\n"
-                f"The challenges should primarily focus on testing the candidate's practical application of the following skills: {skills_str}.\n"
-                f"The difficulty level of these coding challenges must be strictly {difficulty}. The problems should be solvable within a reasonable time by a candidate at this experience level.\n"
+                f"As a senior software engineer and technical challenge designer, create coding challenge questions for a skill assessment test.\n"
+                f"The challenges should primarily focus on testing the candidate's practical application of the skills listed at the end.\n"
+                f"The difficulty level of these coding challenges must strictly match the level given at the end. The problems should be solvable within a reasonable time by a candidate at this experience level.\n"
                 f"For each question, provide a concise and clear problem description, at least one concrete input/output example to illustrate the expected behavior, and an optional, basic function signature or code template to get them started.\n"
+                f"Also provide 3-5 test cases, each a Python call expression and its expected return value as a Python literal, so solutions can be checked automatically.\n"
                 f"Format the entire output as a single JSON array of objects. Each object must strictly adhere to the following structure:\n"
                 f"{{\n"
                 f"  \"question\": \"[Problem description here]\",\n"
                 f"  \"code_template\": \"[Optional: Function signature or basic code snippet]\",\n"
-                f"  \"expected_output_example\": \"[Input example] -> [Expected output example]\"\n"
+                f"  \"expected_output_example\": \"[Input example] -> [Expected output example]\",\n"
+                f"  \"test_cases\": [{{\"call\": \"[Python call expression]\", \"expected\": \"[Expected return value]\"}}]\n"
                 f"}}\n"
                 f"Example format for a single object: [\n"
                 f"  {{\n"
                 f"    \"question\": \"Write a Python function that takes a list of integers and returns a new list with only the even numbers.\",\n"
                 f"    \"code_template\": \"def filter_evens(numbers):\\n  # Your code here\\n  pass\",\n"
-                f"    \"expected_output_example\": \"filter_evens([1, 2, 3, 4, 5, 6]) -> [2, 4, 6]\"\n"
+                f"    \"expected_output_example\": \"filter_evens([1, 2, 3, 4, 5, 6]) -> [2, 4, 6]\",\n"
+                f"    \"test_cases\": [{{\"call\": \"filter_evens([])\", \"expected\": \"[]\"}}, {{\"call\": \"filter_evens([1, 3])\", \"expected\": \"[]\"}}, {{\"call\": \"filter_evens([-2, 0, 7])\", \"expected\": \"[-2, 0]\"}}]\n"
                 f"  }}\n"
                 f"]\n"
-                f"Do not include any conversational text, explanations, or extraneous characters outside the JSON array."
+                f"Do not include any conversational text, explanations, or extraneous characters outside the JSON array.\n"
             )
             schema = {
                 "type": "array",
@@ -87,7 +355,18 @@ class TestGenerator:
                     "properties": {
                         "question": {"type": "string"},
                         "code_template": {"type": "string"},
-                        "expected_output_example": {"type": "string"}
+                        "expected_output_example": {"type": "string"},
+                        "test_cases": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "call": {"type": "string"},
+                                    "expected": {"type": "string"}
+                                },
+                                "required": ["call", "expected"]
+                            }
+                        }
                     },
                     "required": ["question"] 
                 }
@@ -95,106 +374,132 @@ class TestGenerator:
         else:
             raise ValueError("Unsupported question type. Choose 'mcq' or 'coding'.")
 
-        try:
-            raw_questions = await self.gemini_service.generate_structured_response(prompt, schema)
+        # The instructions above are identical across requests; only what follows varies.
+        prompt += (
+            f"\nNumber of questions: {num_questions}\n"
+            f"Skills: {skills_str}\n"
+            f"Difficulty level: {difficulty}\n"
+        )
+        if avoid_questions:
+            avoid_str = "\n".join(f"- {text}" for text in avoid_questions)
+            prompt += f"\nDo not repeat or closely paraphrase any of these existing questions:\n{avoid_str}\n"
 
-        except Exception as e:
-            print(f"First attempt failed: {e}")
-            try:
-                raw_questions = await self.gemini_service.generate_structured_response(prompt, schema)
-            except Exception as e2:
-                print(f"Second attempt failed: {e2}")
-                return []
+        return prompt, schema
 
-        
-        try:
-            if not raw_questions:
-                return []
-            questions = [TestQuestion(**q) for q in raw_questions]
-            return questions
-        except Exception as e:
-            print(f"Parsing failed: {e}")
-            return []
+    def grade_test(self, questions: List[TestQuestion], answers: Dict[str, str]) -> LocalGrade:
+        """
+        Grades MCQs deterministically and builds per-question feedback and
+        weakness topics without calling the model. Coding/open-ended questions
+        are collected for the LLM.
+        """
+        grade = LocalGrade()
+        for i, q in enumerate(questions):
+            user_answer = answers.get(str(i), "No answer provided.")
 
+            if q.options: # MCQ
+                grade.mcq_total += 1
+                topic = _question_topic(q.question, MCQ_TOPIC_RE)
+                is_correct = is_correct_mcq(q, user_answer)
+                if is_correct:
+                    grade.mcq_correct += 1
+                    grade.feedback[i] = f"Question {i+1} (MCQ): Correct. Good understanding."
+                    if topic:
+                        grade.strength_topics.append(topic)
+                else:
+                    grade.feedback[i] = f"Question {i+1} (MCQ): Incorrect. User answered '{user_answer}', correct was '{q.correct_answer}'. Review this topic."
+                    if topic:
+                        grade.weakness_topics.append(topic)
+            else: # Coding/Short Answer
+                grade.open_ended.append(i)
+                topic = _question_topic(q.question, CODING_TOPIC_RE)
+                if topic:
+                    grade.open_ended_topics[i] = topic
+        return grade
 
+    def _local_result(self, grade: LocalGrade) -> TestResult:
+        """A complete TestResult built only from local grading."""
+        if grade.mcq_total:
+            percent = round(100 * grade.mcq_correct / grade.mcq_total)
+            overall_feedback = (
+                f"You answered {grade.mcq_correct} out of {grade.mcq_total} multiple-choice questions correctly ({percent}%)."
+            )
+        else:
+            overall_feedback = "Your answers have been recorded."
 
-    async def evaluate_test(
-        self, questions: List[TestQuestion], answers: Dict[str, str]
-    ) -> TestResult:
-        """
-        Evaluates test answers and provides feedback, strengths, weaknesses,
-        and learning resources using Gemini.
-        Now includes specific learning paths for weaknesses.
-        """
+        strengths = _unique(grade.strength_topics)[:4] or (
+            [f"Answered {grade.mcq_correct} out of {grade.mcq_total} questions correctly."] if grade.mcq_correct else []
+        )
+        weaknesses = _unique(grade.weakness_topics + list(grade.open_ended_topics.values()))[:4]
+        if not weaknesses and grade.mcq_correct < grade.mcq_total:
+            weaknesses = ["Further review of core concepts is recommended."]
+
+        return TestResult(
+            overall_feedback=overall_feedback,
+            strengths=strengths,
+            weaknesses=weaknesses,
+            detailed_feedback=[
+                grade.feedback.get(i) or grade.code_feedback[i]
+                for i in sorted(set(grade.feedback) | set(grade.code_feedback))
+            ],
+            general_learning_resources=[],
+            specific_learning_paths=[]
+        )
+
+    def _build_evaluation_prompt(
+        self, questions: List[TestQuestion], answers: Dict[str, str], grade: LocalGrade
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Builds the evaluation prompt for the parts of a submission that need the model, and its schema."""
+        # Static instructions first, so every evaluation prompt shares the same prefix.
         evaluation_prompt_parts = [
             "As an empathetic, insightful, and highly skilled technical interviewer and career coach, "
-            "evaluate the following test submission comprehensively. Your goal is to provide constructive "
+            "evaluate the test submission below comprehensively. Your goal is to provide constructive "
             "and actionable feedback, highlighting both strengths and areas for improvement, and suggesting "
             "clear paths for learning and growth. Aim for a supportive and encouraging tone.\n\n"
+            "Where automated test results are given, treat them as the verdict on correctness and focus your feedback on approach, readability, style and efficiency.\n\n"
+            "Based on the submission, provide the following in a structured JSON format:\n"
+            "1.  **overall_feedback**: A concise summary (2-3 sentences) of the candidate's performance.\n"
+            "2.  **strengths**: A bulleted list of 2-4 key skills or areas where the candidate performed well.\n"
+            "3.  **weaknesses**: A bulleted list of 2-4 key skills or areas where the candidate needs significant improvement. Be specific.\n"
+            "4.  **detailed_feedback**: One entry per coding question, in order, analyzing code logic, efficiency, and correctness and offering corrections or alternative solutions. Use an empty list if there are no coding questions.\n"
+            "5.  **general_learning_resources**: A list of 2-3 broad learning resources (e.g., platforms, books, concepts) relevant to overall skill development. Include title, link, and a brief description.\n"
+            "6.  **specific_learning_paths**: A list of 2-3 highly specific learning paths, each tied directly to an identified weakness. For each path, include:\n"
+            "    -   `topic`: The specific skill/concept for this path (e.g., 'Python Decorators', 'SQL Joins').\n"
+            "    -   `reason`: Why this path is recommended (e.g., 'Lack of understanding in X', 'Errors in applying Y').\n"
+            "    -   `path`: 2-3 actionable steps or a mini-curriculum for learning this topic.\n"
+            "    -   `resources`: 2-3 highly relevant, direct links to tutorials, documentation, or courses for *this specific topic*. Provide title, link, and description for each.\n\n"
+            "Ensure the JSON output strictly follows the `TestResult` Pydantic model structure, including all nested objects and arrays. Your response should contain ONLY the JSON.\n\n"
             "--- Candidate Test Submission Details ---\n"
         ]
-        correct_count = 0
-        total_count = len(questions)
-        feedback_details = []
-        weakness_topics = set() 
-
-        for i, q in enumerate(questions):
-            question_id = str(i)
-            user_answer = answers.get(question_id, "No answer provided.")
 
-            evaluation_prompt_parts.append(f"Question {i+1}:\n")
-            evaluation_prompt_parts.append(f"  Question Text: {q.question}\n")
+        if grade.mcq_total:
+            evaluation_prompt_parts.append(
+                f"Multiple-choice questions (already graded): {grade.mcq_correct} of {grade.mcq_total} correct.\n"
+            )
+            missed = [questions[i].question for i in sorted(grade.feedback) if "Incorrect" in grade.feedback[i]]
+            if missed:
+                evaluation_prompt_parts.append("Multiple-choice questions answered incorrectly:\n")
+                evaluation_prompt_parts.extend(
+                    f"  - {truncate_to_tokens(text, self.max_question_tokens)}\n" for text in missed
+                )
+            evaluation_prompt_parts.append("\n")
 
-            if q.options: # MCQ
-                evaluation_prompt_parts.append(f"  Options: {', '.join(q.options)}\n")
-                evaluation_prompt_parts.append(f"  Correct Answer: {q.correct_answer}\n")
-                evaluation_prompt_parts.append(f"  User's Answer: {user_answer}\n")
-                
-                # check for correctness
-                is_correct = user_answer.strip().lower() == q.correct_answer.strip().lower()
-                if is_correct:
-                    correct_count += 1
-                    feedback_details.append(f"Question {i+1} (MCQ): Correct. Good understanding.")
-                else:
-                    feedback_details.append(f"Question {i+1} (MCQ): Incorrect. User answered '{user_answer}', correct was '{q.correct_answer}'. Review this topic.")
-                    # Extract a topic from the question for weakness
-                    topic_match = re.search(r"What is (.*?)\?|Explain (.*?)|Describe (.*?)|How does (.*?) work", q.question, re.IGNORECASE)
-                    topic = topic_match.group(1) or topic_match.group(2) or topic_match.group(3) or topic_match.group(4) if topic_match else q.question.split(' ')[0]
-                    if topic: 
-                         weakness_topics.add(topic.strip())
+        for n, i in enumerate(grade.open_ended):
+            q = questions[i]
+            user_answer = truncate_to_tokens(answers.get(str(i), "No answer provided."), self.max_answer_tokens)
+            evaluation_prompt_parts.append(f"Coding Question {n+1}:\n")
+            evaluation_prompt_parts.append(f"  Question Text: {truncate_to_tokens(q.question, self.max_question_tokens)}\n")
+            evaluation_prompt_parts.append(f"  User's Submission:\n```\n{user_answer}\n```\n")
+            if q.expected_output_example:
+                evaluation_prompt_parts.append(f"  Expected Output Example: {q.expected_output_example}\n")
+            if i in grade.code_results:
+                result = grade.code_results[i]
+                evaluation_prompt_parts.append(
+                    f"  Automated Test Results (already verified by running the code): "
+                    f"{result.error or f'{result.passed} of {result.total} test cases passed'}\n"
+                )
+            evaluation_prompt_parts.append("\n")
 
-            else: # Coding/Short Answer
-                evaluation_prompt_parts.append(f"  User's Submission:\n```\n{user_answer}\n```\n")
-                if q.expected_output_example:
-                    evaluation_prompt_parts.append(f"  Expected Output Example: {q.expected_output_example}\n")
-                
-                # For coding questions, we can't auto-grade. We need the LLM to provide feedback.
-                # Indicate to the LLM that this is a coding question and requires more detailed analysis.
-                evaluation_prompt_parts.append(f"  (This is a coding/open-ended question. Please provide detailed feedback on the logic, correctness, and best practices. Identify key areas for improvement or commend strong solutions.)\n")
-                
-                # Add question text to weakness topics if specific feedback points to a gap
-                topic_match = re.search(r"Write a (.*?) function|Implement (.*?)|Solve (.*?) problem", q.question, re.IGNORECASE)
-                topic = topic_match.group(1) or topic_match.group(2) or topic_match.group(3) if topic_match else q.question.split(' ')[0]
-                if topic: 
-                    weakness_topics.add(topic.strip())
-
-
-            evaluation_prompt_parts.append("\n") 
-
-        evaluation_prompt_parts.append(f"--- End of Submission ---\n\n")
-        evaluation_prompt_parts.append(f"Based on the above submission, provide the following in a structured JSON format:\n")
-        evaluation_prompt_parts.append(f"1.  **overall_feedback**: A concise summary (2-3 sentences) of the candidate's performance.\n")
-        evaluation_prompt_parts.append(f"2.  **strengths**: A bulleted list of 2-4 key skills or areas where the candidate performed well.\n")
-        evaluation_prompt_parts.append(f"3.  **weaknesses**: A bulleted list of 2-4 key skills or areas where the candidate needs significant improvement. Be specific.\n")
-        evaluation_prompt_parts.append(f"4.  **detailed_feedback**: A question-by-question breakdown, offering specific insights, corrections, or alternative solutions. For coding questions, analyze code logic, efficiency, and correctness.\n")
-        evaluation_prompt_parts.append(f"5.  **general_learning_resources**: A list of 2-3 broad learning resources (e.g., platforms, books, concepts) relevant to overall skill development. Include title, link, and a brief description.\n")
-        evaluation_prompt_parts.append(f"6.  **specific_learning_paths**: A list of 2-3 highly specific learning paths, each tied directly to an identified weakness. For each path, include:\n")
-        evaluation_prompt_parts.append(f"    -   `topic`: The specific skill/concept for this path (e.g., 'Python Decorators', 'SQL Joins').\n")
-        evaluation_prompt_parts.append(f"    -   `reason`: Why this path is recommended (e.g., 'Lack of understanding in X', 'Errors in applying Y').\n")
-        evaluation_prompt_parts.append(f"    -   `path`: 2-3 actionable steps or a mini-curriculum for learning this topic.\n")
-        evaluation_prompt_parts.append(f"    -   `resources`: 2-3 highly relevant, direct links to tutorials, documentation, or courses for *this specific topic*. Provide title, link, and description for each.\n\n")
-
-        evaluation_prompt_parts.append(f"Ensure the JSON output strictly follows the `TestResult` Pydantic model structure, including all nested objects and arrays. Your response should contain ONLY the JSON.\n")
+        evaluation_prompt_parts.append(f"--- End of Submission ---\n")
         
         schema = {
             "type": "object",
@@ -250,37 +555,64 @@ class TestGenerator:
             ]
         }
 
-        full_prompt = "".join(evaluation_prompt_parts)
+        return "".join(evaluation_prompt_parts), schema
+
+    async def evaluate_test(
+        self, questions: List[TestQuestion], answers: Dict[str, str], include_narrative: bool = True
+    ) -> TestResult:
+        """
+        Evaluates test answers and provides feedback, strengths, weaknesses,
+        and learning resources.
+        MCQs are graded locally, and coding answers are run against their test
+        cases when a code runner is configured. Gemini only sees coding/open-ended
+        submissions plus a summary of the local results, and writes the narrative
+        and learning paths. Without include_narrative, a test that can be fully
+        graded locally skips Gemini and returns the local result immediately.
+        """
+        grade = self.grade_test(questions, answers)
+        if self.code_runner is not None and grade.open_ended:
+            runs = await asyncio.gather(*[
+                self.code_runner.run(questions[i], answers.get(str(i), "")) for i in grade.open_ended
+            ])
+            for i, result in zip(grade.open_ended, runs):
+                if result is not None:
+                    grade.record_code_result(i, result)
+
+        local_result = self._local_result(grade)
+        if not include_narrative and not grade.needs_model:
+            return local_result
+
+        with stage("prompt_build"):
+            full_prompt, schema = self._build_evaluation_prompt(questions, answers, grade)
 
         try:
-            raw_results = await self.gemini_service.generate_structured_response(full_prompt, schema)
+            raw_results = await self.gemini_service.generate_structured_response(full_prompt, schema, purpose="evaluate_test")
 
             if not isinstance(raw_results, dict):
-                try:
-                    from services.gemini_service import clean_json
-                    raw_results = json.loads(clean_json(raw_results))
-
-                except json.JSONDecodeError:
-                    raise ValueError(f"Gemini response was not a valid JSON dictionary: {raw_results}")
-            
-            
+                raise ValueError(f"Gemini response was not a valid JSON dictionary: {raw_results}")
+
+            # MCQ feedback stays local; the model's entries fill in the coding questions in order.
+            coding_feedback = iter(raw_results.get("detailed_feedback") or [])
+            detailed_feedback = []
+            for i in range(len(questions)):
+                if i in grade.feedback:
+                    detailed_feedback.append(grade.feedback[i])
+                elif i in grade.code_feedback:
+                    comment = next(coding_feedback, None)
+                    detailed_feedback.append(f"{grade.code_feedback[i]} {comment}" if comment else grade.code_feedback[i])
+                else:
+                    detailed_feedback.append(next(coding_feedback, f"Question {i+1} (Coding): See the overall feedback."))
+            raw_results["detailed_feedback"] = detailed_feedback
+
             if not raw_results.get("strengths"):
-                raw_results["strengths"] = [f"Answered {correct_count} out of {total_count} questions correctly."]
-            
-            if not raw_results.get("weaknesses") and weakness_topics:
-                 raw_results["weaknesses"] = list(weakness_topics)
-            elif not raw_results.get("weaknesses"):
-                 raw_results["weaknesses"] = ["Further review of core concepts is recommended."]
-
-            test_result = TestResult(**raw_results)
+                raw_results["strengths"] = local_result.strengths
+            if not raw_results.get("weaknesses"):
+                raw_results["weaknesses"] = local_result.weaknesses or ["Further review of core concepts is recommended."]
+
+            with stage("validation"):
+                test_result = TestResult(**raw_results)
             return test_result
         except Exception as e:
-            print(f"Failed to evaluate test or parse Gemini response: {e}")
-            return TestResult(
-                overall_feedback="Temporary AI issue. Please retry.",
-                strengths=[],
-                weaknesses=["AI response error"],
-                detailed_feedback=[],
-                general_learning_resources=[],
-                specific_learning_paths=[]
-            )   
+            logger.warning("Failed to evaluate test or parse Gemini response: %s", e)
+            local_result.overall_feedback += " Detailed AI feedback is temporarily unavailable. Please retry."
+            return local_result
@@ -2,6 +2,7 @@
 // Global variables to store parsed resume data and generated questions
 let parsedResumeData = null;
 let generatedTestQuestions = [];
+let testSessionId = null; // Server-side session holding the generated questions
 let lastTestWeaknesses = []; // Store weaknesses for retry test
 
 // Multi-step form variables
@@ -141,53 +142,108 @@ function displayParsedResume(data) {
     });
 }
 
-function displayTestQuestions(questions, questionType) {
-    const container = document.getElementById('test-questions-container');
-    container.innerHTML = ''; // Clear previous questions
-
-    questions.forEach((q, index) => {
-        const questionCard = document.createElement('div');
-        questionCard.className = 'question-card';
-
-        const questionText = document.createElement('p');
-        questionText.textContent = `${index + 1}. ${q.question}`;
-        questionCard.appendChild(questionText);
-
-        if (questionType === 'mcq' && q.options) {
-            const optionsDiv = document.createElement('div');
-            optionsDiv.className = 'question-options';
-            q.options.forEach(option => {
-                const label = document.createElement('label');
-                const input = document.createElement('input');
-                input.type = 'radio';
-                input.name = `question-${index}`;
-                input.value = option.charAt(0); // Assuming option starts with A, B, C, D
-                label.appendChild(input);
-                label.appendChild(document.createTextNode(option));
-                optionsDiv.appendChild(label);
-            });
-            questionCard.appendChild(optionsDiv);
-        } else if (questionType === 'coding') {
-            const codeInputDiv = document.createElement('div');
-            codeInputDiv.className = 'coding-question-input';
-            const textarea = document.createElement('textarea');
-            textarea.name = `question-${index}`;
-            textarea.rows = 10;
-            textarea.placeholder = "Write your code here...";
-            if (q.code_template) {
-                textarea.value = q.code_template;
-            }
-            codeInputDiv.appendChild(textarea);
-            questionCard.appendChild(codeInputDiv);
+function createQuestionCard(q, index, questionType) {
+    const questionCard = document.createElement('div');
+    questionCard.className = 'question-card';
+
+    const questionText = document.createElement('p');
+    questionText.textContent = `${index + 1}. ${q.question}`;
+    questionCard.appendChild(questionText);
+
+    if (questionType === 'mcq' && q.options) {
+        const optionsDiv = document.createElement('div');
+        optionsDiv.className = 'question-options';
+        q.options.forEach(option => {
+            const label = document.createElement('label');
+            const input = document.createElement('input');
+            input.type = 'radio';
+            input.name = `question-${index}`;
+            input.value = option.charAt(0); // Assuming option starts with A, B, C, D
+            label.appendChild(input);
+            label.appendChild(document.createTextNode(option));
+            optionsDiv.appendChild(label);
+        });
+        questionCard.appendChild(optionsDiv);
+    } else if (questionType === 'coding') {
+        const codeInputDiv = document.createElement('div');
+        codeInputDiv.className = 'coding-question-input';
+        const textarea = document.createElement('textarea');
+        textarea.name = `question-${index}`;
+        textarea.rows = 10;
+        textarea.placeholder = "Write your code here...";
+        if (q.code_template) {
+            textarea.value = q.code_template;
+        }
+        codeInputDiv.appendChild(textarea);
+        questionCard.appendChild(codeInputDiv);
 
-            if (q.expected_output_example) {
-                const example = document.createElement('p');
-                example.innerHTML = `<strong>Example:</strong> <pre>${q.expected_output_example}</pre>`;
-                questionCard.appendChild(example);
-            }
+        if (q.expected_output_example) {
+            const example = document.createElement('p');
+            example.innerHTML = `<strong>Example:</strong> <pre>${q.expected_output_example}</pre>`;
+            questionCard.appendChild(example);
         }
-        container.appendChild(questionCard);
+    }
+    return questionCard;
+}
+
+// Streams a test from /generate-test/stream (NDJSON, one question per line),
+// rendering each question as soon as it arrives. Resolves with all questions
+// and records the test session id the answers are submitted against.
+async function streamTestQuestions(requestBody, questionType) {
+    const response = await fetch('/generate-test/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(requestBody),
     });
+
+    if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.detail || 'Failed to generate test.');
+    }
+    testSessionId = response.headers.get('X-Test-Session-Id');
+
+    const container = document.getElementById('test-questions-container');
+    container.innerHTML = '';
+    const questions = [];
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+
+    const handleLine = (line) => {
+        if (!line.trim()) {
+            return;
+        }
+        const item = JSON.parse(line);
+        if (item.error) {
+            throw new Error(item.error);
+        }
+        if (questions.length === 0) {
+            // First question is ready: show the test while the rest stream in.
+            hideLoading();
+            showSection('test-taking-section');
+        }
+        container.appendChild(createQuestionCard(item, questions.length, questionType));
+        questions.push(item);
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+        lines.forEach(handleLine);
+    }
+    handleLine(buffered);
+
+    if (questions.length === 0) {
+        throw new Error('No questions were generated. Please try again.');
+    }
+    return questions;
 }
 
 function displayTestResults(results) {
@@ -276,6 +332,23 @@ function displayJobRecommendations(jobs) {
 }
 
 
+async function evaluateTest(submission, includeNarrative) {
+    const response = await fetch(`/evaluate-test?include_narrative=${includeNarrative}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(submission),
+    });
+
+    if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.detail || 'Failed to evaluate test.');
+    }
+    return response.json();
+}
+
+
 // --- Event Listeners ---
 
 // Multi-step form navigation
@@ -376,27 +449,12 @@ document.getElementById('start-test-generation-btn').addEventListener('click', a
     showLoading('Generating your test...');
 
     try {
-        const response = await fetch('/generate-test', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                skills: parsedResumeData.skills,
-                experience_years: parsedResumeData.experience_years,
-                num_questions: numQuestions,
-                question_type: testType
-            }),
-        });
-
-        if (!response.ok) {
-            const errorData = await response.json();
-            throw new Error(errorData.detail || 'Failed to generate test.');
-        }
-
-        generatedTestQuestions = await response.json();
-        displayTestQuestions(generatedTestQuestions, testType);
-        showSection('test-taking-section');
+        generatedTestQuestions = await streamTestQuestions({
+            skills: parsedResumeData.skills,
+            experience_years: parsedResumeData.experience_years,
+            num_questions: numQuestions,
+            question_type: testType
+        }, testType);
         showMessage('Test generated successfully!', 'success');
 
     } catch (error) {
@@ -437,28 +495,26 @@ document.getElementById('test-form').addEventListener('submit', async (e) => {
 
     showLoading('Submitting your answers and evaluating test...');
 
-    try {
-        const response = await fetch('/evaluate-test', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                questions: generatedTestQuestions,
-                answers: answers
-            }),
-        });
+    // The server already has the questions; send them back only if there is no session.
+    const submission = testSessionId
+        ? { session_id: testSessionId, answers: answers }
+        : { questions: generatedTestQuestions, answers: answers };
 
-        if (!response.ok) {
-            const errorData = await response.json();
-            throw new Error(errorData.detail || 'Failed to evaluate test.');
-        }
-
-        const testResults = await response.json();
+    try {
+        // MCQ tests are graded locally first, so the score shows up right away.
+        const localFirst = testType === 'mcq';
+        const testResults = await evaluateTest(submission, !localFirst);
         displayTestResults(testResults);
         showSection('test-results-section');
         showMessage('Test evaluated successfully!', 'success');
 
+        if (localFirst) {
+            // Fill in the AI narrative and learning paths once they are ready.
+            evaluateTest(submission, true)
+                .then(displayTestResults)
+                .catch(error => showMessage(`Could not load detailed feedback: ${error.message}`, 'info'));
+        }
+
     } catch (error) {
         showMessage(`Error: ${error.message}`, 'error');
     } finally {
@@ -473,27 +529,12 @@ document.getElementById('retry-test-btn').addEventListener('click', async () =>
             const testType = document.querySelector('input[name="testType"]:checked').value; // Keep current test type
             const numQuestions = parseInt(document.getElementById('num-questions-input').value); // Keep current number of questions
 
-            const response = await fetch('/generate-test', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    skills: lastTestWeaknesses, // Use weaknesses as skills
-                    experience_years: parsedResumeData.experience_years, // Use original experience
-                    num_questions: numQuestions,
-                    question_type: testType
-                }),
-            });
-
-            if (!response.ok) {
-                const errorData = await response.json();
-                throw new Error(errorData.detail || 'Failed to generate retry test.');
-            }
-
-            generatedTestQuestions = await response.json();
-            displayTestQuestions(generatedTestQuestions, testType);
-            showSection('test-taking-section');
+            generatedTestQuestions = await streamTestQuestions({
+                skills: lastTestWeaknesses, // Use weaknesses as skills
+                experience_years: parsedResumeData.experience_years, // Use original experience
+                num_questions: numQuestions,
+                question_type: testType
+            }, testType);
             showMessage('Retry test generated successfully!', 'success');
 
         } catch (error) {